@@ -0,0 +1,284 @@
+# #########
+# ADMISSION
+# #########
+
+# Admission control of the help requests (opt-in, see ADMISSION_CONTROL in settings.py).
+# The classes of several schools can play at the same time (overlapping slots of SESSION_DATE in
+# src/session_date_constants.py), and a burst of help requests from one class must neither exceed the upstream
+# rate limit nor starve the other classes:
+# - global cap: at most max_concurrent upstream LLM streams at the same time, the other requests are queued
+# - per-student limit: at most max_per_game help requests in flight per game_id, the next ones are rejected (429).
+#   The slot is reserved when the request is checked (reserve_game) and released at the end of the response, or when
+#   the handler fails before the response
+# - weighted fair queueing across the classes (class_id query parameter, e.g. "BOU_2_2", weights given by
+#   ADMISSION_CLASS_WEIGHTS): each queued request gets a virtual finish time, max(virtual time, finish time of the
+#   previous request of its class) + 1 / weight, and the free slots go to the smallest finish time, so a class with
+#   30 queued requests does not delay the first request of another class by 30 streams
+# While a request is queued, an SSE comment (": keep-alive") is sent every keepalive seconds so that the client and
+# the proxies keep the connection open. A request still queued after max_wait seconds gets an SSE error frame.
+# Only the upstream streams take a slot: the replayed cached responses and the requests attached to a stream already
+# in flight (single flight) are not queued.
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+from llm_stream import sse_error
+
+DEFAULT_CLASS = "default"  # requests without class_id
+KEEPALIVE_FRAME = ": keep-alive\n\n"
+
+
+# "BOU_2_2=2,LJS_1=1" -> {"BOU_2_2": 2.0, "LJS_1": 1.0}
+def parse_class_weights(text):
+    weights = {}
+    for item in text.split(","):
+        if item.strip():
+            class_id, weight = item.split("=")
+            weights[class_id.strip()] = float(weight)
+    return weights
+
+
+# Slot of a help request in the per-student limit, released once: end of the response (track_game), error of the
+# handler, or garbage collection of a response that was never iterated (client gone before the first frame)
+class GameSlot:
+    def __init__(self, admission, game_id):
+        self.admission = admission
+        self.game_id = game_id
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.admission.leave_game(self.game_id)
+
+    def __del__(self):
+        self.release()
+
+
+class Waiter:
+    def __init__(self, class_id, finish, signal):
+        self.class_id = class_id
+        self.finish = finish  # virtual finish time
+        self.signal = signal  # threading.Event or asyncio.Future set when the slot is granted
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent, max_per_game, class_weights, keepalive, max_wait):
+        self.max_concurrent = max_concurrent
+        self.max_per_game = max_per_game
+        self.class_weights = class_weights
+        self.keepalive = keepalive  # seconds
+        self.max_wait = max_wait  # seconds
+        self.lock = threading.RLock()  # reentrant: a slot can be released by the garbage collector (GameSlot.__del__)
+        self.in_flight = 0  # upstream streams
+        self.games = {}  # game_id -> help requests in flight
+        self.queue = []  # heap of (virtual finish time, sequence number, waiter)
+        self.sequence = itertools.count()
+        self.virtual_time = 0.0
+        self.last_finish = {}  # class_id -> virtual finish time of its last queued request
+        self.queued_by_class = {}  # class_id -> queued requests
+        # Counters
+        self.admitted = 0  # upstream streams started, immediately or after queueing
+        self.queued = 0  # requests that had to wait for a slot
+        self.rejected = 0  # requests rejected by the per-student limit
+        self.timed_out = 0  # requests still queued after max_wait
+        self.abandoned = 0  # requests that left while queued
+        self.wait_total = 0.0  # seconds, over the admitted requests
+        self.wait_max = 0.0
+
+    # ---- Per-student limit ----
+
+    # Reserve a slot in the help requests in flight of the student (check and count under the lock, so that the
+    # simultaneous requests of a double click cannot both pass): GameSlot, or None if the student already has
+    # max_per_game help requests in flight. Requests without game_id are not limited (slot not counted).
+    def reserve_game(self, game_id):
+        with self.lock:
+            if not game_id:
+                slot = GameSlot(self, game_id)
+                slot.released = True
+                return slot
+            count = self.games.get(game_id, 0)
+            if count >= self.max_per_game:
+                self.rejected += 1
+                return None
+            self.games[game_id] = count + 1
+            return GameSlot(self, game_id)
+
+    def leave_game(self, game_id):
+        with self.lock:
+            count = self.games.pop(game_id) - 1
+            if count:
+                self.games[game_id] = count
+
+    # Release the slot of the request once its frames are streamed
+    def track_game(self, slot, frames):
+        try:
+            yield from frames
+        finally:
+            frames.close()
+            slot.release()
+
+    # ---- Global cap and fair queueing ----
+
+    # Take a slot (None) or queue the request (waiter). Must be called with the lock held.
+    def enqueue(self, class_id, signal):
+        if self.in_flight < self.max_concurrent and not self.queue:
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+        weight = self.class_weights.get(class_id, 1.0)
+        finish = max(self.virtual_time, self.last_finish.get(class_id, 0.0)) + 1 / weight
+        self.last_finish[class_id] = finish
+        waiter = Waiter(class_id, finish, signal)
+        heapq.heappush(self.queue, (finish, next(self.sequence), waiter))
+        self.queued_by_class[class_id] = self.queued_by_class.get(class_id, 0) + 1
+        self.queued += 1
+        return waiter
+
+    # Give the free slots to the queued requests with the smallest finish times. Must be called with the lock held.
+    def dispatch(self):
+        while self.in_flight < self.max_concurrent and self.queue:
+            _, _, waiter = heapq.heappop(self.queue)
+            if waiter.cancelled:
+                continue
+            self.dequeued(waiter)
+            waiter.granted = True
+            self.virtual_time = waiter.finish
+            self.in_flight += 1
+            self.admitted += 1
+            wait = time.monotonic() - waiter.enqueued
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.grant(waiter)
+
+    def dequeued(self, waiter):
+        count = self.queued_by_class.pop(waiter.class_id) - 1
+        if count:
+            self.queued_by_class[waiter.class_id] = count
+
+    def grant(self, waiter):
+        waiter.signal.set()
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.dispatch()
+
+    # Remove a request leaving the queue (timeout or client disconnection).
+    # Return True if the slot was granted in the meantime (the caller then owns the slot).
+    def cancel(self, waiter, timed_out):
+        with self.lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.dequeued(waiter)
+            if timed_out:
+                self.timed_out += 1
+            else:
+                self.abandoned += 1
+            return False
+
+    # Yield keep-alive comments until a slot is free, then the frames of the upstream stream
+    def admit(self, class_id, frames):
+        with self.lock:
+            waiter = self.enqueue(class_id or DEFAULT_CLASS, threading.Event())
+        if waiter is not None:
+            deadline = waiter.enqueued + self.max_wait
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if not self.cancel(waiter, timed_out=True):
+                            frames.close()
+                            yield sse_error("POST llm_inference_stream : server busy, please retry later")
+                            return
+                        break
+                    if waiter.signal.wait(min(self.keepalive, remaining)):
+                        break
+                    if time.monotonic() < deadline:
+                        yield KEEPALIVE_FRAME
+            except GeneratorExit:
+                # Client disconnected while queued
+                if self.cancel(waiter, timed_out=False):
+                    self.release()
+                frames.close()
+                raise
+        try:
+            yield from frames
+        finally:
+            frames.close()
+            self.release()
+
+    def report(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": sum(self.queued_by_class.values()),
+                "queue_depth_by_class": dict(self.queued_by_class),
+                "games_in_flight": len(self.games),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "abandoned": self.abandoned,
+                "mean_wait_ms": round(self.wait_total / self.admitted * 1e3, 1) if self.admitted else 0.0,
+                "max_wait_ms": round(self.wait_max * 1e3, 1),
+            }
+
+
+# ---- ASGI server (event loop) ----
+# Same queue, the requests wait on a future of the event loop instead of blocking a thread
+
+class AsyncAdmissionController(AdmissionController):
+    def grant(self, waiter):
+        if not waiter.signal.done():
+            waiter.signal.set_result(None)
+
+    # Async version of track_game()
+    async def atrack_game(self, slot, frames):
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            await frames.aclose()
+            slot.release()
+
+    # Async version of admit()
+    async def aadmit(self, class_id, frames):
+        with self.lock:
+            waiter = self.enqueue(class_id or DEFAULT_CLASS, asyncio.get_running_loop().create_future())
+        if waiter is not None:
+            deadline = waiter.enqueued + self.max_wait
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if not self.cancel(waiter, timed_out=True):
+                            await frames.aclose()
+                            yield sse_error("POST llm_inference_stream : server busy, please retry later")
+                            return
+                        break
+                    done, _ = await asyncio.wait({waiter.signal}, timeout=min(self.keepalive, remaining))
+                    if done:
+                        break
+                    if time.monotonic() < deadline:
+                        yield KEEPALIVE_FRAME
+            except (GeneratorExit, asyncio.CancelledError):
+                # Client disconnected while queued
+                if self.cancel(waiter, timed_out=False):
+                    self.release()
+                await frames.aclose()
+                raise
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            await frames.aclose()
+            self.release()
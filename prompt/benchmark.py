@@ -0,0 +1,330 @@
+# ##########
+# BENCHMARKS
+# ##########
+
+# Offline benchmarks of the system prompt pipeline and of the SSE streaming (no LLM call is made).
+# Usage (from the prompt/ folder):
+#   python benchmark.py registry [--iterations N]
+#   python benchmark.py tokens [--layout LAYOUT] [--pruning] [--grid-encoding ENCODING] [--minify]
+#                          [--output report.json] [--calibrate]
+#   python benchmark.py pruning
+#   python benchmark.py sse [--streams 200] [--deltas 300] [--interval-ms 15] [--delay-ms 30] [--min-bytes 64]
+
+import argparse
+import asyncio
+import json
+import socket
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+from prompt_registry import MODALITY_NAMES, PROMPT_MODULES, PROMPT_BUILDERS, MINIFIABLE_MODALITIES, \
+    build_prompt_registry, context_layout, get_system_message
+from token_count import count_tokens, tokenizer_name, calibrate_estimator
+from map_encoding import GRID_ENCODINGS
+from prompt_minify import minify_xml
+from llm_stream import agenerate_sse
+
+# ---- Benchmarked values ----
+LEVELS = [1, 2, 3, 4, 5, 6, 7, 8]
+LANGUAGES = ["EN", "FR"]
+MODALITIES = [1, 2]
+
+
+def all_variants():
+    return [(modality, level, language)
+            for modality in MODALITIES
+            for level in LEVELS
+            for language in LANGUAGES]
+
+
+# Mean time (in microseconds) and mean allocated bytes of one call to build_message()
+def measure(build_message, variants, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for variant in variants:
+            build_message(*variant)
+    elapsed = time.perf_counter() - start
+    calls = iterations * len(variants)
+
+    # Allocations are measured separately since tracing slows down the calls
+    tracemalloc.start()
+    allocated = 0
+    for variant in variants:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        build_message(*variant)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return elapsed / calls * 1e6, allocated / len(variants)
+
+
+# ---- Prompt registry benchmark ----
+# Compares the per-request cost of building the system message (before)
+# with the lookup in the prebuilt prompt registry (after)
+def benchmark_registry(iterations):
+    variants = all_variants()
+
+    def build_legacy(modality, level, language):
+        return PROMPT_BUILDERS[modality](level, language)
+
+    start = time.perf_counter()
+    registry = build_prompt_registry(LEVELS, LANGUAGES, MODALITIES)
+    startup_ms = (time.perf_counter() - start) * 1e3
+
+    def build_registry(modality, level, language):
+        return dict(get_system_message(registry, modality, level, language))
+
+    before_us, before_bytes = measure(build_legacy, variants, iterations)
+    after_us, after_bytes = measure(build_registry, variants, iterations)
+
+    print(f"Prompt registry benchmark ({len(variants)} variants, {iterations} iterations)")
+    print(f"  registry build at startup : {startup_ms:10.2f} ms")
+    print(f"  {'':24}  {'time/request':>14}  {'allocated/request':>18}")
+    print(f"  {'before (build prompt)':24}  {before_us:11.2f} us  {before_bytes:12.0f} bytes")
+    print(f"  {'after (registry lookup)':24}  {after_us:11.2f} us  {after_bytes:12.0f} bytes")
+    print(f"  speedup: x{before_us / after_us:.0f}")
+
+
+# ---- Token accounting ----
+# Token count of each section of the assembled system prompts, for each level/language/modality.
+# The prefill tokens drive the time to first token, the JSON report can be tracked over time.
+
+SECTION_SHORT_NAMES = {
+    "IDENTITY" : "identity",
+    "INSTRUCTION" : "instr",
+    "CONTEXT_HEADER" : "header",
+    "LEVELS_MAP_DEF" : "map_def",
+    "LEVELS_MAP_GRID" : "grid",
+    "CURRENT_STATE_DEF" : "state",
+    "PROGRAM_EXECUTION_DEF" : "exec",
+    "LEVEL_DESCRIPTION" : "level",
+    "STARTUP_GUIDE" : "guide",
+    "PROGRAMMING_MEMO" : "memo",
+}
+
+
+# Sections of the system prompt, in the order of the prompt
+def get_prompt_sections(modality, level, language, layout, pruning=False, grid_encoding="verbatim", minify=False):
+    module = PROMPT_MODULES[modality]
+    context_sections = module.get_context_sections(level, language, pruning, grid_encoding)
+    options = {"minify": minify} if modality in MINIFIABLE_MODALITIES else {}
+    instruction = module.INSTRUCTION[language]
+    if options.get("minify"):
+        instruction = minify_xml(instruction)
+    sections = {
+        "IDENTITY" : module.IDENTITY[language],
+        "INSTRUCTION" : instruction,
+        "CONTEXT_HEADER" : "# Context:\n",
+    }
+    # Same order as the prompt registry
+    sections_layout = context_layout(module, layout, LANGUAGES, pruning, grid_encoding)
+    for section in sections_layout:
+        sections[section] = context_sections[section]
+
+    # The report is only meaningful if the sections rebuild the actual prompt
+    prompt = PROMPT_BUILDERS[modality](level, language, sections_layout, pruning, grid_encoding, **options)["content"]
+    if "".join(sections.values()) != prompt:
+        raise ValueError(f"Sections do not match the system prompt (modality {modality}, level {level}, {language})")
+    return sections
+
+
+def token_report(layout, pruning, grid_encoding="verbatim", minify=False):
+    prompts = []
+    for modality, level, language in all_variants():
+        sections = get_prompt_sections(modality, level, language, layout, pruning, grid_encoding, minify)
+        content = "".join(sections.values())
+        prompts.append({
+            "modality": MODALITY_NAMES[modality],
+            "level": level,
+            "language": language,
+            "chars": len(content),
+            # Tokens of the whole prompt (may differ slightly from the sum of the sections at their boundaries)
+            "total_tokens": count_tokens(content),
+            "sections": {section: count_tokens(text) for section, text in sections.items()},
+        })
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "tokenizer": tokenizer_name(),
+        "layout": layout,
+        "pruning": pruning,
+        "grid_encoding": grid_encoding,
+        "minify": minify,
+        "prompts": prompts,
+    }
+
+
+def print_token_report(report):
+    print(f"Token accounting per section (tokenizer: {report['tokenizer']}, layout: {report['layout']}, "
+          f"pruning: {report['pruning']}, grid encoding: {report['grid_encoding']}, minify: {report['minify']})")
+    sections = list(SECTION_SHORT_NAMES)
+    header = "".join(f"{SECTION_SHORT_NAMES[section]:>9}" for section in sections)
+    print(f"  {'variant':10}{header}{'total':>9}")
+    for prompt in report["prompts"]:
+        variant = f"{prompt['modality']}-{prompt['level']}-{prompt['language']}"
+        values = "".join(f"{prompt['sections'].get(section, 0):>9}" for section in sections)
+        print(f"  {variant:10}{values}{prompt['total_tokens']:>9}")
+
+
+def benchmark_tokens(layout, pruning, grid_encoding, minify, output, calibrate):
+    if calibrate:
+        texts = [PROMPT_BUILDERS[modality](level, language)["content"] for modality, level, language in all_variants()]
+        scale = calibrate_estimator(texts)
+        if scale is None:
+            print("Calibration requires tiktoken and its encoding file")
+        else:
+            print(f"ESTIMATOR_SCALE = {scale:.3f}")
+        return
+
+    report = token_report(layout, pruning, grid_encoding, minify)
+    print_token_report(report)
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+        print(f"Report written to {output}")
+
+
+# ---- Relevance pruning ----
+# Tokens saved for each level by the pruning of the programming memo and of the control function rules
+
+def benchmark_pruning():
+    print(f"Tokens saved by the relevance pruning (tokenizer: {tokenizer_name()})")
+    print(f"  {'variant':10}{'exec':>16}{'memo':>16}{'prompt':>18}{'saved':>8}")
+    for modality, level, language in all_variants():
+        module = PROMPT_MODULES[modality]
+        full = module.get_context_sections(level, language)
+        pruned = module.get_context_sections(level, language, pruning=True)
+        columns = ""
+        for section in ["PROGRAM_EXECUTION_DEF", "PROGRAMMING_MEMO"]:
+            columns += f"{count_tokens(full[section]):>8}{count_tokens(pruned[section]):>8}"
+        full_tokens = count_tokens(PROMPT_BUILDERS[modality](level, language)["content"])
+        pruned_tokens = count_tokens(PROMPT_BUILDERS[modality](level, language, pruning=True)["content"])
+        variant = f"{MODALITY_NAMES[modality]}-{level}-{language}"
+        print(f"  {variant:10}{columns}{full_tokens:>9}{pruned_tokens:>9}{1 - pruned_tokens / full_tokens:>8.1%}")
+
+
+# ---- SSE flush policy ----
+# Concurrent simulated streams (one tiny delta every interval, as streamed by the providers) sent through
+# agenerate_sse() without and with the flush policy: frames per second, CPU time per stream and time to first frame.
+# Each frame is written to a socket, as the server does (one write per frame).
+
+class FakeAsyncStream:
+    def __init__(self, deltas, interval):
+        self.deltas = deltas
+        self.interval = interval
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for index in range(self.deltas):
+            await asyncio.sleep(self.interval)
+            delta = SimpleNamespace(content=f" tok{index}")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+
+def fake_async_client(deltas, interval):
+    async def create(**params):
+        return FakeAsyncStream(deltas, interval)
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+async def run_sse_streams(streams, deltas, interval, flush_policy):
+    client = fake_async_client(deltas, interval)
+    loop = asyncio.get_running_loop()
+
+    async def drain(reader):
+        while await loop.sock_recv(reader, 65536):
+            pass
+
+    async def consume():
+        writer, reader = socket.socketpair()
+        writer.setblocking(False)
+        reader.setblocking(False)
+        drain_task = asyncio.ensure_future(drain(reader))
+        start = time.perf_counter()
+        first_frame = None
+        frames = 0
+        try:
+            async for frame in agenerate_sse(client, "openai", "fake", [], {}, flush_policy=flush_policy):
+                await loop.sock_sendall(writer, frame.encode())
+                frames += 1
+                if first_frame is None:
+                    first_frame = time.perf_counter() - start
+        finally:
+            writer.close()
+            await drain_task
+            reader.close()
+        return frames, first_frame
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(consume() for _ in range(streams)))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    frames = sum(frames for frames, _ in results)
+    return {
+        "frames": frames,
+        "frames_per_second": frames / elapsed,
+        "cpu_ms_per_stream": cpu / streams * 1e3,
+        "first_frame_ms": sum(first_frame for _, first_frame in results) / streams * 1e3,
+    }
+
+
+def benchmark_sse(streams, deltas, interval_ms, delay_ms, min_bytes):
+    print(f"SSE flush policy benchmark ({streams} concurrent streams, {deltas} deltas every {interval_ms} ms)")
+    print(f"  {'policy':28}{'frames':>9}{'frames/s':>11}{'CPU/stream':>13}{'first frame':>13}")
+    policies = {
+        "one frame per delta": None,
+        f"{delay_ms:g} ms / {min_bytes} bytes": (delay_ms / 1000, min_bytes),
+    }
+    for name, flush_policy in policies.items():
+        result = asyncio.run(run_sse_streams(streams, deltas, interval_ms / 1000, flush_policy))
+        print(f"  {name:28}{result['frames']:>9}{result['frames_per_second']:>11.0f}"
+              f"{result['cpu_ms_per_stream']:>10.2f} ms{result['first_frame_ms']:>10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the system prompt pipeline and SSE streaming")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    registry_parser = subparsers.add_parser("registry", help="per-request cost of the system prompt build")
+    registry_parser.add_argument("--iterations", type=int, default=200)
+
+    tokens_parser = subparsers.add_parser("tokens", help="token count of each prompt section")
+    tokens_parser.add_argument("--layout", default="default", help="context layout (see CONTEXT_LAYOUTS)")
+    tokens_parser.add_argument("--pruning", action="store_true", help="per-level relevance pruning of the context")
+    tokens_parser.add_argument("--grid-encoding", default="verbatim", choices=list(GRID_ENCODINGS),
+                               help="representation of the level map grids")
+    tokens_parser.add_argument("--minify", action="store_true", help="minified XML instructions of modality C")
+    tokens_parser.add_argument("--output", help="path of the JSON report")
+    tokens_parser.add_argument("--calibrate", action="store_true", help="compute ESTIMATOR_SCALE with tiktoken")
+
+    subparsers.add_parser("pruning", help="tokens saved per level by the relevance pruning")
+
+    sse_parser = subparsers.add_parser("sse", help="frames and CPU per stream of the SSE flush policy")
+    sse_parser.add_argument("--streams", type=int, default=200, help="concurrent streams")
+    sse_parser.add_argument("--deltas", type=int, default=300, help="deltas per stream")
+    sse_parser.add_argument("--interval-ms", type=float, default=15, help="delay between two deltas")
+    sse_parser.add_argument("--delay-ms", type=float, default=30, help="max delay of the flush policy")
+    sse_parser.add_argument("--min-bytes", type=int, default=64, help="min bytes of the flush policy")
+
+    args = parser.parse_args()
+    if args.command == "registry":
+        benchmark_registry(args.iterations)
+    elif args.command == "tokens":
+        benchmark_tokens(args.layout, args.pruning, args.grid_encoding, args.minify, args.output,
+                         args.calibrate)
+    elif args.command == "pruning":
+        benchmark_pruning()
+    elif args.command == "sse":
+        benchmark_sse(args.streams, args.deltas, args.interval_ms, args.delay_ms, args.min_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+# ###########
+# CLIENT POOL
+# ###########
+
+# Pooled keep-alive HTTP clients of the LLM backends (opt-in, see CLIENT_POOL in settings.py).
+# By default the provider SDKs create their own HTTP client: the Mistral SDK keeps the httpx defaults (100
+# connections, idle connections closed after 5 s) and the first help request after a quiet period pays the DNS
+# resolution and the TCP and TLS handshakes (100 to 300 ms with a remote provider) before the time to first token.
+# A ClientPool gives the SDK client an httpx client:
+# - connection pool sized to the upstream streams of a worker (threads of the Flask worker or admission limit), all
+#   the connections kept alive for CLIENT_POOL_KEEPALIVE_EXPIRY seconds
+# - HTTP/2 when the h2 package is installed (the streams of a worker share one connection)
+# - saturation counters: streams in flight, requests which waited for a free connection, open and idle connections
+#   (reported by the /stats endpoint)
+# The warm-up opens connections (GET /v1/models, no token is generated) at startup, then every
+# CLIENT_POOL_WARMUP_INTERVAL seconds while classes are in session: the sessions of SESSION_DATE
+# (src/session_date_constants.py) repeat every week, on the same weekday and at the same time. The warm-up is
+# skipped while the help requests in flight keep the connections busy.
+# The warm-up runs in a thread of each Flask worker (PoolWarmer, started after the fork with the pre-fork profile,
+# see gunicorn_conf.py) or in a task of the event loop of the ASGI server (AsyncPoolWarmer).
+
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+from datetime import datetime
+
+import httpx
+
+from llm_stream import create_client, create_async_client, DeferredClient
+
+SESSION_DATE_CONSTANTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src",
+                                      "session_date_constants.py")
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+TIMEOUT = httpx.Timeout(600, connect=5)  # same as the default timeout of the OpenAI SDK
+
+
+# ---- Saturation counters ----
+
+class PoolStats:
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0  # requests from the upstream call until their response is closed
+        self.max_in_flight = 0
+        self.waited = 0  # requests sent when all the connections were busy (HTTP/1.1: queued for a connection)
+        self.warmups = 0
+        self.warmup_errors = 0
+        self.last_warmup = None  # seconds of the last warm-up
+
+    def request_started(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.in_flight > self.max_connections:
+                self.waited += 1
+
+    def request_finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def record_warmup(self, seconds, error):
+        with self.lock:
+            self.warmups += 1
+            if error:
+                self.warmup_errors += 1
+            self.last_warmup = seconds
+
+
+class CountedStream(httpx.SyncByteStream):
+    def __init__(self, stream, stats):
+        self.stream = stream
+        self.stats = stats
+        self.closed = False
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.stats.request_finished()
+            self.stream.close()
+
+
+class AsyncCountedStream(httpx.AsyncByteStream):
+    def __init__(self, stream, stats):
+        self.stream = stream
+        self.stats = stats
+        self.closed = False
+
+    async def __aiter__(self):
+        async for part in self.stream:
+            yield part
+
+    async def aclose(self):
+        if not self.closed:
+            self.closed = True
+            self.stats.request_finished()
+            await self.stream.aclose()
+
+
+# Transports counting the requests in flight: a request holds its connection (or its HTTP/2 stream) until the
+# response is closed, i.e. until the end of the LLM stream
+class CountedTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        self.stats.request_started()
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self.stats.request_finished()
+            raise
+        response.stream = CountedStream(response.stream, self.stats)
+        return response
+
+
+class AsyncCountedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        self.stats.request_started()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self.stats.request_finished()
+            raise
+        response.stream = AsyncCountedStream(response.stream, self.stats)
+        return response
+
+
+# ---- Pools ----
+
+# Pooled HTTP client and SDK client of one backend. deferred: SDK client created in a background thread (FAST_START)
+class ClientPool:
+    def __init__(self, name, llm_api, llm_api_key, llm_url, max_connections, keepalive_expiry, http2,
+                 asynchronous=False, deferred=False):
+        # HTTP/2 requires the h2 package (pip install httpx[http2]), HTTP/1.1 otherwise (reported by /stats)
+        http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.name = name
+        self.llm_api = llm_api
+        self.http2 = http2
+        self.stats = PoolStats(max_connections)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                              keepalive_expiry=keepalive_expiry)
+        if asynchronous:
+            transport = AsyncCountedTransport(self.stats, limits=limits, http2=http2)
+            self.http_client = httpx.AsyncClient(transport=transport, timeout=TIMEOUT)
+            create = create_async_client
+        else:
+            transport = CountedTransport(self.stats, limits=limits, http2=http2)
+            self.http_client = httpx.Client(transport=transport, timeout=TIMEOUT)
+            create = create_client
+        self.transport = transport
+        if deferred:
+            self.client = DeferredClient(create, llm_api, llm_api_key, llm_url, self.http_client)
+        else:
+            self.client = create(llm_api, llm_api_key, llm_url, self.http_client)
+
+    # Open and idle connections of the pool, read from the httpcore connection pool of the transport (private
+    # attribute of httpx): (None, None) if the installed httpx or httpcore version does not expose it
+    def connections(self):
+        pool = getattr(self.transport, "_pool", None)
+        try:
+            connections = list(pool.connections)
+            return len(connections), sum(1 for connection in connections if connection.is_idle())
+        except (AttributeError, TypeError):
+            return None, None
+
+    def report(self):
+        stats = self.stats
+        connections, idle = self.connections()
+        with stats.lock:
+            return {
+                "http2": self.http2,
+                "max_connections": stats.max_connections,
+                "connections": connections,
+                "idle_connections": idle,
+                "in_flight": stats.in_flight,
+                "max_in_flight": stats.max_in_flight,
+                "saturation": round(stats.in_flight / stats.max_connections, 3),
+                "requests": stats.requests,
+                "waited": stats.waited,
+                "warmups": stats.warmups,
+                "warmup_errors": stats.warmup_errors,
+                "last_warmup_ms": None if stats.last_warmup is None else round(stats.last_warmup * 1e3, 1),
+            }
+
+
+# ---- Warm-up schedule ----
+
+# SESSION_DATE of src/session_date_constants.py, loaded from its path (src/ is not added to sys.path of the servers)
+def load_session_dates():
+    spec = importlib.util.spec_from_file_location("session_date_constants", SESSION_DATE_CONSTANTS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SESSION_DATE
+
+
+# Weekly windows of the class sessions: {(weekday, start seconds of the day, end seconds of the day), ...}
+def session_windows():
+    windows = set()
+    for sessions in load_session_dates().values():
+        for dates in sessions.values():
+            start = datetime.strptime(dates["start"], DATE_FORMAT)
+            end = datetime.strptime(dates["end"], DATE_FORMAT)
+            windows.add((start.weekday(), seconds_of_day(start), seconds_of_day(end)))
+    return windows
+
+
+def seconds_of_day(date):
+    return date.hour * 3600 + date.minute * 60 + date.second
+
+
+# True if a class session runs at that time, or starts within lead seconds
+def in_session(now, windows, lead=0.0):
+    seconds = seconds_of_day(now)
+    return any(weekday == now.weekday() and start - lead <= seconds <= end for weekday, start, end in windows)
+
+
+def warmup_due(schedule, windows, interval):
+    return schedule == "always" or in_session(datetime.now(), windows, interval)
+
+
+# ---- Warm-up ----
+
+def warm_connection(pool):
+    start = time.perf_counter()
+    error = None
+    try:
+        pool.client.models.list()
+    except Exception as e:
+        error = e
+    pool.stats.record_warmup(time.perf_counter() - start, error)
+
+
+async def awarm_connection(pool):
+    start = time.perf_counter()
+    error = None
+    try:
+        if pool.llm_api == "mistral":
+            await pool.client.models.list_async()
+        else:
+            await pool.client.models.list()
+    except Exception as e:
+        error = e
+    pool.stats.record_warmup(time.perf_counter() - start, error)
+
+
+# Background thread of a Flask worker: connections concurrent warm-up requests per pool, at startup and every
+# interval seconds while classes are in session
+class PoolWarmer:
+    def __init__(self, pools, connections, interval, schedule):
+        self.pools = pools
+        self.connections = connections
+        self.interval = interval
+        self.schedule = schedule
+        self.windows = session_windows()
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def warm(self):
+        threads = []
+        for pool in self.pools:
+            if pool.stats.in_flight >= self.connections:
+                continue
+            for _ in range(self.connections):
+                thread = threading.Thread(target=warm_connection, args=(pool,), daemon=True)
+                thread.start()
+                threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def run(self):
+        self.warm()
+        while not self.stopped.wait(self.interval):
+            if warmup_due(self.schedule, self.windows, self.interval):
+                self.warm()
+
+
+# Task of the event loop of the ASGI server (started and cancelled by the lifespan of the application)
+class AsyncPoolWarmer:
+    def __init__(self, pools, connections, interval, schedule):
+        self.pools = pools
+        self.connections = connections
+        self.interval = interval
+        self.schedule = schedule
+        self.windows = session_windows()
+
+    async def warm(self):
+        tasks = []
+        for pool in self.pools:
+            if pool.stats.in_flight >= self.connections:
+                continue
+            if isinstance(pool.client, DeferredClient):  # FAST_START: wait for the SDK without blocking the loop
+                await asyncio.to_thread(pool.client.ready.wait)
+            tasks.extend(awarm_connection(pool) for _ in range(self.connections))
+        await asyncio.gather(*tasks)
+
+    async def run(self):
+        await self.warm()
+        while True:
+            await asyncio.sleep(self.interval)
+            if warmup_due(self.schedule, self.windows, self.interval):
+                await self.warm()
@@ -0,0 +1,149 @@
+# ##########
+# CODE DELTA
+# ##########
+
+# Delta encoding of the code snapshots of the activity history (opt-in, see CODE_DELTA in settings.py).
+# Every <activity> carries the full contents of the code editor (<code>), even when consecutive activities only
+# differ by one line. Before the upstream call, each snapshot is rewritten relative to the previous one:
+# - identical code: <code ref="previous"/>
+# - changed code: <code diff="previous">, one line per change, "-n text" for the line n of the previous code that is
+#   removed and "+n text" for the line n of the new code that is added (lines numbered from 1)
+# The first snapshot and the snapshots whose diff is not shorter than the code stay verbatim.
+# The notation is explained to the model by the CODE_DELTA_NOTATION section of the system prompt modules.
+
+import difflib
+import re
+import threading
+
+CODE_PATTERN = re.compile(r"<code>(.*?)</code>", re.S)
+ENCODED_CODE_PATTERN = re.compile(r'<code>(.*?)</code>|<code ref="previous"/>|<code diff="previous">(.*?)</code>', re.S)
+CHANGE_PATTERN = re.compile(r"^([-+])(\d+) ?(.*)$")
+
+
+# ---- Line diff ----
+
+def diff_lines(previous, code):
+    previous_lines = previous.split("\n")
+    lines = code.split("\n")
+    changes = []
+    matcher = difflib.SequenceMatcher(None, previous_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        changes += [f"-{i + 1} {previous_lines[i]}" for i in range(i1, i2)]
+        changes += [f"+{j + 1} {lines[j]}" for j in range(j1, j2)]
+    return "\n".join(changes)
+
+
+def apply_diff(previous, diff):
+    removed = set()
+    added = {}
+    for change in diff.split("\n"):
+        sign, number, text = CHANGE_PATTERN.match(change).groups()
+        if sign == "-":
+            removed.add(int(number))
+        else:
+            added[int(number)] = text
+    kept = [line for number, line in enumerate(previous.split("\n"), 1) if number not in removed]
+    kept.reverse()
+    lines = [added[number] if number in added else kept.pop() for number in range(1, len(kept) + len(added) + 1)]
+    return "\n".join(lines)
+
+
+# Encoded code element and its kind ("verbatim", "ref" or "diff")
+def encode_code(previous, code):
+    if previous is None:
+        return "verbatim", f"<code>{code}</code>"
+    if code == previous:
+        return "ref", '<code ref="previous"/>'
+    # Fall back to the verbatim code when the diff (and its longer tag) is not shorter
+    diff = diff_lines(previous, code)
+    if len(diff) + 10 < len(code):
+        return "diff", f'<code diff="previous">\n{diff}\n</code>'
+    return "verbatim", f"<code>{code}</code>"
+
+
+# ---- Messages ----
+
+# Messages with the code snapshots encoded relative to the previous snapshot (in the chronological order of the
+# messages) and the report of the compression of the request
+def encode_code_history(user_messages):
+    previous = None
+    snapshots = {"verbatim": 0, "ref": 0, "diff": 0}
+    chars_before = 0
+    chars_after = 0
+    encoded_messages = []
+    for message in user_messages:
+        content = message.get("content")
+        if not isinstance(content, str) or "<code>" not in content:
+            encoded_messages.append(message)
+            continue
+        parts = []
+        end = 0
+        for match in CODE_PATTERN.finditer(content):
+            code = match.group(1)
+            kind, encoded = encode_code(previous, code)
+            snapshots[kind] += 1
+            chars_before += len(match.group())
+            chars_after += len(encoded)
+            parts += [content[end:match.start()], encoded]
+            end = match.end()
+            previous = code
+        parts.append(content[end:])
+        encoded_messages.append(dict(message, content="".join(parts)))
+    report = {
+        "snapshots": snapshots,
+        "code_chars": chars_before,
+        "encoded_chars": chars_after,
+        "ratio": round(chars_before / chars_after, 2) if chars_after else 1.0,
+    }
+    return encoded_messages, report
+
+
+# Inverse of encode_code_history() (full code snapshots)
+def decode_code_history(user_messages):
+    previous = None
+    decoded_messages = []
+    for message in user_messages:
+        content = message.get("content")
+        if not isinstance(content, str):
+            decoded_messages.append(message)
+            continue
+        parts = []
+        end = 0
+        for match in ENCODED_CODE_PATTERN.finditer(content):
+            if match.group(1) is not None:
+                code = match.group(1)
+            elif match.group(2) is not None:
+                code = apply_diff(previous, match.group(2).strip("\n"))
+            else:
+                code = previous
+            parts += [content[end:match.start()], f"<code>{code}</code>"]
+            end = match.end()
+            previous = code
+        parts.append(content[end:])
+        decoded_messages.append(dict(message, content="".join(parts)))
+    return decoded_messages
+
+
+class CodeDeltaStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.code_chars = 0
+        self.encoded_chars = 0
+
+    def record(self, report):
+        with self.lock:
+            self.requests += 1
+            self.code_chars += report["code_chars"]
+            self.encoded_chars += report["encoded_chars"]
+
+    def report(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "code_chars": self.code_chars,
+                "encoded_chars": self.encoded_chars,
+                "ratio": round(self.code_chars / self.encoded_chars, 2) if self.encoded_chars else 1.0,
+            }
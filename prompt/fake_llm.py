@@ -0,0 +1,196 @@
+# ########
+# FAKE LLM
+# ########
+
+# Offline stand-in of the LLM providers for the load tests and benchmarks (no token is paid).
+# It speaks the streaming chat completions protocol of the OpenAI-compatible APIs and of the Mistral API
+# (chat.stream): SSE events "data: {chunk}" ending with "data: [DONE]", the last chunk carrying the usage.
+# Configurable time to first token, delay between tokens, response length distribution, error injection (HTTP 500
+# before the stream or connection aborted during the stream) and empty-response injection.
+# Run (from the prompt/ folder):
+#   python fake_llm.py --port 8001 --ttft-ms 400 --token-delay-ms 20 --length lognormal:180,0.5 --error-rate 0.01
+# then point the server at it:
+#   LLM_API=openai LLM_URL=http://localhost:8001/v1 LLM_API_KEY=fake
+#   LLM_API=mistral MISTRAL_SERVER_URL=http://localhost:8001 LLM_API_KEY=fake
+# GET /stats returns the counters of the fake server (requests, injected errors, tokens streamed, model lists).
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from token_count import count_tokens
+
+WORDS = ("the", "robot", "moves", "to", "key", "door", "loop", "while", "if", "variable", "function", "right", "left",
+         "up", "down", "check", "your", "code", "line", "try", "again", "condition", "repeat", "jump", "chest")
+
+
+# "fixed:200", "uniform:50-300", "normal:200,60" or "lognormal:180,0.5" (median, sigma) -> sampler of token counts
+def parse_length(spec):
+    kind, _, params = spec.partition(":")
+    if kind == "fixed":
+        return lambda rng: int(params)
+    if kind == "uniform":
+        low, high = (int(value) for value in params.split("-"))
+        return lambda rng: rng.randint(low, high)
+    if kind == "normal":
+        mean, std = (float(value) for value in params.split(","))
+        return lambda rng: round(rng.gauss(mean, std))
+    if kind == "lognormal":
+        median, sigma = (float(value) for value in params.split(","))
+        return lambda rng: round(median * rng.lognormvariate(0, sigma))
+    raise ValueError(f"Unknown length distribution: {spec}")
+
+
+class FakeLLMConfig:
+    def __init__(self, ttft=0.3, ttft_jitter=0.1, token_delay=0.02, length="lognormal:180,0.5", error_rate=0.0,
+                 abort_rate=0.0, empty_rate=0.0, seed=None):
+        self.ttft = ttft  # seconds
+        self.ttft_jitter = ttft_jitter  # seconds, uniform +/-
+        self.token_delay = token_delay  # seconds
+        self.length = length
+        self.sample_length = parse_length(length)
+        self.error_rate = error_rate  # HTTP 500 before the stream
+        self.abort_rate = abort_rate  # connection aborted in the middle of the stream
+        self.empty_rate = empty_rate  # stream without content
+        self.rng = random.Random(seed)
+
+
+class FakeLLMStats:
+    def __init__(self):
+        self.requests = 0
+        self.streams = 0
+        self.active = 0
+        self.max_active = 0
+        self.errors = 0
+        self.aborts = 0
+        self.empty = 0
+        self.tokens = 0
+        self.model_lists = 0
+
+    def report(self):
+        return dict(vars(self))
+
+
+def chunk(completion_id, model, delta, finish_reason=None, usage=None):
+    data = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        data["usage"] = usage
+    return "data: " + json.dumps(data) + "\n\n"
+
+
+def create_app(config):
+    stats = FakeLLMStats()
+
+    async def stream_chunks(completion_id, model, length, prompt_tokens, abort_at):
+        stats.streams += 1
+        stats.active += 1
+        stats.max_active = max(stats.max_active, stats.active)
+        try:
+            await asyncio.sleep(max(0.0, config.ttft + config.rng.uniform(-config.ttft_jitter, config.ttft_jitter)))
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for index in range(length):
+                if index:
+                    await asyncio.sleep(config.token_delay)
+                if index == abort_at:
+                    stats.aborts += 1
+                    raise ConnectionAbortedError("fake LLM: injected abort")
+                word = config.rng.choice(WORDS)
+                yield chunk(completion_id, model, {"content": (" " if index else "") + word})
+                stats.tokens += 1
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": length,
+                     "total_tokens": prompt_tokens + length}
+            yield chunk(completion_id, model, {}, finish_reason="stop", usage=usage)
+            yield "data: [DONE]\n\n"
+        finally:
+            stats.active -= 1
+
+    async def chat_completions(request):
+        body = await request.json()
+        stats.requests += 1
+        if config.rng.random() < config.error_rate:
+            stats.errors += 1
+            return JSONResponse({"error": {"message": "fake LLM: injected error", "type": "server_error"}},
+                                status_code=500)
+        model = body.get("model", "fake")
+        prompt_tokens = sum(count_tokens(message.get("content") or "") for message in body.get("messages", [])
+                            if isinstance(message.get("content"), str))
+        if config.rng.random() < config.empty_rate:
+            stats.empty += 1
+            length = 0
+        else:
+            length = max(1, min(config.sample_length(config.rng), body.get("max_tokens") or 10 ** 6))
+        abort_at = config.rng.randrange(length) if length and config.rng.random() < config.abort_rate else None
+        completion_id = "fake-" + uuid.uuid4().hex
+        if not body.get("stream"):
+            await asyncio.sleep(config.ttft + length * config.token_delay)
+            content = " ".join(config.rng.choice(WORDS) for _ in range(length))
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": length,
+                          "total_tokens": prompt_tokens + length},
+            })
+        return StreamingResponse(stream_chunks(completion_id, model, length, prompt_tokens, abort_at),
+                                 media_type="text/event-stream")
+
+    # Model list (connection warm-up of the client pools, see client_pool.py)
+    async def get_models(request):
+        stats.model_lists += 1
+        # "type" and "capabilities" are required by the Mistral client
+        return JSONResponse({"object": "list", "data": [{"id": "fake", "object": "model", "created": 0,
+                                                         "owned_by": "fake", "type": "base",
+                                                         "capabilities": {"completion_chat": True}}]})
+
+    async def get_stats(request):
+        return JSONResponse(stats.report())
+
+    app = Starlette(routes=[
+        # OpenAI-compatible clients (base_url ending with /v1) and Mistral client (server_url without /v1)
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/models", get_models, methods=["GET"]),
+        Route("/models", get_models, methods=["GET"]),
+        Route("/stats", get_stats, methods=["GET"]),
+    ])
+    app.state.stats = stats
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline fake LLM server (OpenAI-compatible and Mistral streaming)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="time to first token")
+    parser.add_argument("--ttft-jitter-ms", type=float, default=100, help="uniform jitter of the time to first token")
+    parser.add_argument("--token-delay-ms", type=float, default=20, help="delay between two tokens")
+    parser.add_argument("--length", default="lognormal:180,0.5",
+                        help="tokens per response: fixed:N, uniform:A-B, normal:MEAN,STD or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 500 responses")
+    parser.add_argument("--abort-rate", type=float, default=0.0, help="fraction of streams aborted midway")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="fraction of empty responses")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = FakeLLMConfig(args.ttft_ms / 1000, args.ttft_jitter_ms / 1000, args.token_delay_ms / 1000, args.length,
+                           args.error_rate, args.abort_rate, args.empty_rate, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# #############
+# GUNICORN CONF
+# #############
+
+# Pre-fork serving profile of the Flask server (requires gunicorn), from the prompt/ folder:
+#   gunicorn -c gunicorn_conf.py "main:create_app()"
+# The application is loaded once by the master before the workers are forked (preload): the prompt modules, the
+# prompt registry (or the mapped prompt artifact, see prompt_artifact.py) and the provider SDK are imported and built
+# once and shared copy-on-write by all the workers.
+# The garbage collector of the master is disabled while the application is loaded, then the loaded objects are frozen
+# (gc.freeze) and the collector is enabled again (when_ready, before the first fork): the collections of the master
+# and of the workers never visit them, so they do not write to the shared pages (reference counts and GC headers) and
+# the pages stay shared. The objects created by the master afterwards are frozen before each fork (pre_fork).
+# Each worker then creates its own LLM clients, client pools (and their warm-up thread) and session store connection
+# (create_worker_resources in main.py).
+# FAST_START is ignored with preload (a warning is printed if it is set): the master imports the provider SDK before
+# the fork, so the workers already start without importing it.
+# Environment:
+# - GUNICORN_BIND: listening address (default 0.0.0.0:5000)
+# - GUNICORN_WORKERS: worker processes (default 8)
+# - GUNICORN_THREADS: threads per worker, one per SSE stream in flight (default 32)
+# - GUNICORN_PRELOAD, GUNICORN_GC_FREEZE: 1 = enabled (default), 0 = default gunicorn behavior (to measure the profile)
+# The per-worker memory of the profile is measured by prefork_report.py.
+
+import gc
+import os
+import sys
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "8"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+timeout = 180  # seconds without heartbeat of a worker, above the longest LLM stream
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+gc_freeze = preload_app and os.getenv("GUNICORN_GC_FREEZE", "1") == "1"
+
+if preload_app:
+    # The background threads of FAST_START and of the client pool warm-up must not run in the master during the fork
+    if os.getenv("FAST_START") == "1":
+        print("[WARNING] FAST_START is ignored with GUNICORN_PRELOAD=1: the master imports the provider SDK before "
+              "forking the workers")
+    os.environ["FAST_START"] = "0"
+    os.environ["PREFORK_MASTER"] = "1"
+if gc_freeze:
+    gc.disable()  # the configuration is loaded before the application
+
+
+# Master, application loaded, before the first fork
+def when_ready(server):
+    if gc_freeze:
+        gc.freeze()
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    if gc_freeze:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # Without preload, the worker imports the application (and creates its resources) after the fork
+    if "main" in sys.modules:
+        sys.modules["main"].create_worker_resources()
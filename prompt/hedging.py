@@ -0,0 +1,324 @@
+# #######
+# HEDGING
+# #######
+
+# Hedged requests and failover between several LLM backends (opt-in, see LLM_ALT_API in settings.py).
+# The backends are tried in order (the LLM_API backend first, then the alternate backend, Mistral or any
+# OpenAI-compatible URL):
+# - hedging: when the first chunk of a backend has not arrived after hedge_delay seconds, the same request is sent to
+#   the next backend, the first backend to produce content streams the response and the other one is cancelled
+# - failover: when a backend fails or returns an empty response before its first chunk, the next backend is called
+#   immediately
+# - circuit breaker: a backend is skipped for cooldown seconds after max_failures consecutive failures or empty
+#   responses, then tried again (one more failure reopens the circuit). When all the circuits are open, all the
+#   backends are tried anyway.
+# The time to first token of each backend is tracked (mean and percentiles over the last requests, see report()).
+# In the Flask server, the first chunks are awaited in threads: a cancelled backend that is still waiting for its first
+# chunk is closed as soon as the chunk arrives. In the ASGI server, the cancelled backend is closed immediately.
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+
+from llm_stream import stream_llm_content, astream_llm_content
+from metrics import percentile
+
+TTFT_WINDOW = 200  # requests kept for the percentiles of the time to first token
+
+
+# on_connect callback of stream_llm_content() reporting the connect time of the backend to the observation
+def connect_callback(observation, backend):
+    if observation is None:
+        return None
+    return lambda seconds: observation.connected(backend.name, seconds)
+
+
+# Messages and parameters of the call of a backend: the hints of one provider (e.g. stream_options of the
+# OpenAI-compatible APIs) are rejected by the other one
+def prepare_call(prepare, backend, messages, llm_params):
+    if prepare is None:
+        return messages, llm_params
+    return prepare(backend.llm_api, messages, llm_params)
+
+
+class Backend:
+    def __init__(self, name, client, llm_api, llm_model):
+        self.name = name
+        self.client = client
+        self.llm_api = llm_api
+        self.llm_model = llm_model
+        # Circuit breaker
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # Counters
+        self.requests = 0  # requests sent to the backend
+        self.hedges = 0  # requests sent because the previous backend was slow
+        self.failovers = 0  # requests sent because the previous backend failed
+        self.wins = 0  # responses streamed from the backend
+        self.cancelled = 0  # requests cancelled because another backend answered first
+        self.failures = 0  # errors and empty responses
+        self.circuit_opened = 0
+        self.ttft = deque(maxlen=TTFT_WINDOW)  # seconds
+
+
+# Request to one backend: content generator and state of its first chunk
+class Attempt:
+    def __init__(self, backend, contents):
+        self.backend = backend
+        self.contents = contents
+        self.start = time.monotonic()
+        self.first_done = False  # first chunk (or failure) received
+        self.lost = False  # another backend answered first
+        self.task = None  # ASGI server: task awaiting the first chunk
+
+
+class HedgedBackends:
+    def __init__(self, backends, hedge_delay, max_failures, cooldown):
+        self.backends = backends
+        self.hedge_delay = hedge_delay  # seconds
+        self.max_failures = max_failures
+        self.cooldown = cooldown  # seconds
+        self.lock = threading.Lock()
+
+    # ---- Circuit breaker and counters ----
+
+    # Backends to try, in order, skipping the backends whose circuit is open
+    def ordered_backends(self):
+        now = time.monotonic()
+        with self.lock:
+            backends = [backend for backend in self.backends if backend.open_until <= now]
+        return backends or list(self.backends)
+
+    def record_request(self, backend, reason):
+        with self.lock:
+            backend.requests += 1
+            if reason == "hedge":
+                backend.hedges += 1
+            elif reason == "failover":
+                backend.failovers += 1
+
+    def record_first_chunk(self, attempt):
+        with self.lock:
+            attempt.backend.wins += 1
+            attempt.backend.ttft.append(time.monotonic() - attempt.start)
+
+    def record_cancelled(self, backend):
+        with self.lock:
+            backend.cancelled += 1
+
+    def record_success(self, backend):
+        with self.lock:
+            backend.consecutive_failures = 0
+
+    def record_failure(self, backend, error):
+        with self.lock:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.max_failures:
+                if backend.open_until <= time.monotonic():
+                    backend.circuit_opened += 1
+                backend.open_until = time.monotonic() + self.cooldown
+        reason = str(error) if error is not None else "empty response"
+        print(f"[WARNING] LLM backend {backend.name} failed: {reason}")
+
+    def report(self):
+        now = time.monotonic()
+        with self.lock:
+            report = {}
+            for backend in self.backends:
+                ttft = list(backend.ttft)
+                report[backend.name] = {
+                    "api": backend.llm_api,
+                    "model": backend.llm_model,
+                    "circuit": "open" if backend.open_until > now else "closed",
+                    "requests": backend.requests,
+                    "hedges": backend.hedges,
+                    "failovers": backend.failovers,
+                    "wins": backend.wins,
+                    "cancelled": backend.cancelled,
+                    "failures": backend.failures,
+                    "circuit_opened": backend.circuit_opened,
+                    "ttft_ms": {
+                        "mean": round(sum(ttft) / len(ttft) * 1e3, 1) if ttft else None,
+                        "p50": round(percentile(ttft, 0.5) * 1e3, 1) if ttft else None,
+                        "p95": round(percentile(ttft, 0.95) * 1e3, 1) if ttft else None,
+                    },
+                }
+            return report
+
+    # ---- Flask server (threads) ----
+
+    # Same contents as stream_llm_content(), from the first backend producing content
+    # observation: StreamObservation receiving the connect time of each backend and the backend streaming the response
+    # prepare: provider-specific preparation of the call (see generate_sse), applied for the API of each backend
+    def stream(self, messages, llm_params, on_usage=None, observation=None, prepare=None):
+        pending = self.ordered_backends()
+        results = queue.Queue()  # (attempt, first content or None, error or None)
+        call_lock = threading.Lock()
+        attempts = []
+
+        def first_content(attempt):
+            try:
+                results.put((attempt, next(attempt.contents), None))
+            except StopIteration:
+                results.put((attempt, None, None))
+            except Exception as e:
+                results.put((attempt, None, e))
+            with call_lock:
+                attempt.first_done = True
+                lost = attempt.lost
+            # The generator can only be closed by this thread while it waits for its first chunk
+            if lost:
+                attempt.contents.close()
+
+        def start(reason):
+            backend = pending.pop(0)
+            backend_messages, backend_params = prepare_call(prepare, backend, messages, llm_params)
+            contents = stream_llm_content(backend.client, backend.llm_api, backend.llm_model, backend_messages,
+                                          backend_params, on_usage, connect_callback(observation, backend))
+            attempt = Attempt(backend, contents)
+            attempts.append(attempt)
+            self.record_request(backend, reason)
+            threading.Thread(target=first_content, args=(attempt,), daemon=True).start()
+
+        winner = None
+        try:
+            start("first")
+            running = 1
+            error = None
+            while running:
+                try:
+                    attempt, content, attempt_error = results.get(timeout=self.hedge_delay if pending else None)
+                except queue.Empty:
+                    start("hedge")
+                    running += 1
+                    continue
+                running -= 1
+                if content is None:
+                    self.record_failure(attempt.backend, attempt_error)
+                    error = attempt_error or error
+                    if pending and not running:
+                        start("failover")
+                        running += 1
+                    continue
+                winner = attempt
+                self.record_first_chunk(winner)
+                if observation is not None:
+                    observation.served_by(winner.backend.name)
+                break
+            self.cancel_losers(attempts, winner, call_lock)
+            if winner is None:
+                if error is not None:
+                    raise error
+                return  # empty response from all the backends
+
+            yield content
+            try:
+                yield from winner.contents
+            except Exception as e:
+                self.record_failure(winner.backend, e)
+                raise
+            self.record_success(winner.backend)
+        finally:
+            self.cancel_losers(attempts, winner, call_lock)
+            if winner is not None:
+                winner.contents.close()
+
+    def cancel_losers(self, attempts, winner, call_lock):
+        for attempt in attempts:
+            if attempt is winner or attempt.lost:
+                continue
+            with call_lock:
+                attempt.lost = True
+                first_done = attempt.first_done
+            if first_done:
+                attempt.contents.close()
+            else:
+                self.record_cancelled(attempt.backend)
+
+    # ---- ASGI server (event loop) ----
+
+    # Async version of stream()
+    async def astream(self, messages, llm_params, on_usage=None, observation=None, prepare=None):
+        pending = self.ordered_backends()
+        attempts = []
+
+        def start(reason):
+            backend = pending.pop(0)
+            backend_messages, backend_params = prepare_call(prepare, backend, messages, llm_params)
+            contents = astream_llm_content(backend.client, backend.llm_api, backend.llm_model, backend_messages,
+                                           backend_params, on_usage, connect_callback(observation, backend))
+            attempt = Attempt(backend, contents)
+            attempt.task = asyncio.ensure_future(contents.__anext__())
+            attempts.append(attempt)
+            self.record_request(backend, reason)
+
+        winner = None
+        try:
+            start("first")
+            error = None
+            while True:
+                running = {attempt.task: attempt for attempt in attempts if not attempt.first_done}
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, timeout=self.hedge_delay if pending else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    start("hedge")
+                    continue
+                for task in done:
+                    attempt = running[task]
+                    attempt.first_done = True
+                    try:
+                        first_content = task.result()
+                    except StopAsyncIteration:
+                        self.record_failure(attempt.backend, None)
+                        continue
+                    except Exception as e:
+                        self.record_failure(attempt.backend, e)
+                        error = e
+                        continue
+                    if winner is None:
+                        winner = attempt
+                        content = first_content
+                if winner is not None:
+                    break
+                if pending and all(attempt.first_done for attempt in attempts):
+                    start("failover")
+            await self.acancel_losers(attempts, winner)
+            if winner is None:
+                if error is not None:
+                    raise error
+                return  # empty response from all the backends
+            self.record_first_chunk(winner)
+            if observation is not None:
+                observation.served_by(winner.backend.name)
+
+            yield content
+            try:
+                async for content in winner.contents:
+                    yield content
+            except Exception as e:
+                self.record_failure(winner.backend, e)
+                raise
+            self.record_success(winner.backend)
+        finally:
+            await self.acancel_losers(attempts, winner)
+            if winner is not None:
+                await winner.contents.aclose()
+
+    # The cancellation of the task awaiting the first chunk closes the upstream stream
+    async def acancel_losers(self, attempts, winner):
+        for attempt in attempts:
+            if attempt is winner or attempt.lost:
+                continue
+            attempt.lost = True
+            if not attempt.task.done():
+                attempt.task.cancel()
+                await asyncio.wait({attempt.task})
+                self.record_cancelled(attempt.backend)
+            elif not attempt.task.cancelled():
+                attempt.task.exception()  # retrieved (failure already recorded or first chunk of a loser)
+            await attempt.contents.aclose()
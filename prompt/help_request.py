@@ -0,0 +1,62 @@
+# ############
+# HELP REQUEST
+# ############
+
+# Validation of the help requests and assembly of the messages sent to the LLM,
+# shared by the Flask server (main.py) and the async server (main_asgi.py)
+
+import hashlib
+import json
+
+from prompt_registry import build_prompt_registry, get_system_message
+from prompt_artifact import load_prompt_artifact
+from settings import accepted_levels, accepted_languages, accepted_modalities, prompt_layout, prompt_pruning, \
+    grid_encoding, prompt_minify, code_delta_enabled, prompt_artifact_path
+
+# ---- Prompt registry ----
+# All the system prompts (levels x languages x modalities) are built once at startup,
+# or memory-mapped from the prebuilt artifact (see prompt_artifact.py)
+prompt_options = (accepted_levels, accepted_languages, accepted_modalities, prompt_layout, prompt_pruning,
+                  grid_encoding, prompt_minify, code_delta_enabled)
+prompt_registry = load_prompt_artifact(prompt_artifact_path, *prompt_options) if prompt_artifact_path else None
+if prompt_registry is None:
+    prompt_registry = build_prompt_registry(*prompt_options)
+
+
+# Return the error message of an invalid help request, None if the request is valid
+def validate_help_request(level_id, language, modality, user_messages):
+    if not level_id or level_id not in accepted_levels:
+        return "Invalid level_id"
+    if not language or language not in accepted_languages:
+        return "Invalid language"
+    if not modality or modality not in accepted_modalities:
+        return "Invalid modality"
+    if not user_messages:
+        return "Messages array is empty"
+    return None
+
+
+# Return the messages sent to the LLM: the system prompt followed by the user messages
+def build_full_messages(level_id, language, modality, user_messages):
+    # Get prebuilt prompt
+    system_message = get_system_message(prompt_registry, modality, level_id, language)
+
+    # Shallow copy: the registry entry is read-only, the prompt content itself is not copied
+    return [dict(system_message)] + user_messages
+
+
+# Canonical hash of the user messages: the same messages get the same hash
+# whatever the order of the JSON keys and the spacing of the JSON document sent by the client
+def messages_hash(user_messages):
+    canonical = json.dumps(
+        user_messages,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Key identifying a help request (used to coalesce and cache the identical requests)
+def request_key(level_id, language, modality, user_messages):
+    return (modality, level_id, language, messages_hash(user_messages))
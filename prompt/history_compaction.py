@@ -0,0 +1,140 @@
+# ##################
+# HISTORY COMPACTION
+# ##################
+
+# Token-budgeted compaction of the activity history sent by the client (opt-in, see HISTORY_TOKEN_BUDGET in
+# settings.py). The messages carry the whole chronological list of <activity> elements since the start of the
+# level (and, for modality C, the previous turns of the <interaction_history>), each with a full code snapshot,
+# so the prompt grows with the persistence of the student.
+# When the activities exceed the budget, the oldest ones are collapsed into an <activities_digest> element
+# (number of activities per type, game time range, error messages) until the messages fit in the budget.
+# The activities needed to tailor the feedback are always kept verbatim:
+# - the last launched program (last executed code and character state)
+# - the last asked help (current state of the code editor)
+# - the consultations of the contents (displayed-content: memo sections read by the student)
+
+import re
+
+from token_count import count_tokens
+
+ACTIVITY_PATTERN = re.compile(r"<activity>.*?</activity>", re.S)
+TYPE_PATTERN = re.compile(r"<type>\s*(.*?)\s*</type>", re.S)
+GAME_TIME_PATTERN = re.compile(r"<game_time>\s*(.*?)\s*</game_time>", re.S)
+# Error messages and reasons reported in the digest
+REASON_PATTERN = re.compile(r"<(error_message|lost_reason|game_reason)>\s*(.*?)\s*</\1>", re.S)
+
+KEPT_LAST_TYPES = ["launched-program", "asked-help"]
+KEPT_TYPES = ["displayed-content"]
+
+
+def activity_type(activity):
+    match = TYPE_PATTERN.search(activity)
+    return match.group(1) if match else None
+
+
+# Activities of the messages: [(message index, match), ...] in chronological order
+def find_activities(user_messages):
+    activities = []
+    for index, message in enumerate(user_messages):
+        content = message.get("content")
+        if isinstance(content, str):
+            activities += [(index, match) for match in ACTIVITY_PATTERN.finditer(content)]
+    return activities
+
+
+# Activities that must stay verbatim (positions in the list of activities)
+def kept_activities(activities):
+    kept = set()
+    last = {}
+    for position, (_, match) in enumerate(activities):
+        type_ = activity_type(match.group())
+        if type_ in KEPT_TYPES:
+            kept.add(position)
+        if type_ in KEPT_LAST_TYPES:
+            last[type_] = position
+    return kept | set(last.values())
+
+
+def activities_digest(activities):
+    types = {}
+    game_times = []
+    reasons = []
+    for activity in activities:
+        type_ = activity_type(activity) or "unknown"
+        types[type_] = types.get(type_, 0) + 1
+        game_times += GAME_TIME_PATTERN.findall(activity)
+        for _, reason in REASON_PATTERN.findall(activity):
+            if reason and reason not in reasons:
+                reasons.append(reason)
+    digest = "<activities_digest>"
+    digest += f"<count>{len(activities)}</count>"
+    digest += "<types>" + ", ".join(f"{type_} x{count}" for type_, count in types.items()) + "</types>"
+    if len(game_times) == 1:
+        digest += f"<game_time>{game_times[0]}</game_time>"
+    elif game_times:
+        digest += f"<game_time>{game_times[0]} to {game_times[-1]}</game_time>"
+    if reasons:
+        digest += "<errors>" + " | ".join(reasons) + "</errors>"
+    digest += "</activities_digest>"
+    return digest
+
+
+# Rewrite a message content with its collapsed activities replaced by digests.
+# Each run of consecutive collapsed activities becomes one digest.
+def compact_content(content, matches, collapsed):
+    parts = []
+    end = 0
+    run = []
+    for match, is_collapsed in zip(matches, collapsed):
+        between = content[end:match.start()]
+        if is_collapsed:
+            if run and between.strip():
+                parts.append(activities_digest(run))
+                run = []
+            if not run:
+                parts.append(between)
+            run.append(match.group())
+        else:
+            if run:
+                parts.append(activities_digest(run))
+                run = []
+            parts.append(between)
+            parts.append(match.group())
+        end = match.end()
+    if run:
+        parts.append(activities_digest(run))
+    parts.append(content[end:])
+    return "".join(parts)
+
+
+# Messages with the oldest activities collapsed so that the messages fit in the token budget.
+# The messages are returned unchanged if they already fit in the budget, the kept activities
+# (see kept_activities) are never collapsed even if they exceed the budget.
+def compact_history(user_messages, token_budget):
+    contents = [message.get("content") for message in user_messages]
+    total_tokens = sum(count_tokens(content) for content in contents if isinstance(content, str))
+    if total_tokens <= token_budget:
+        return user_messages
+
+    activities = find_activities(user_messages)
+    kept = kept_activities(activities)
+    collapsed = set()
+    for position, (_, match) in enumerate(activities):
+        if total_tokens <= token_budget:
+            break
+        if position not in kept:
+            collapsed.add(position)
+            total_tokens -= count_tokens(match.group())
+    if not collapsed:
+        return user_messages
+
+    compacted = []
+    for index, message in enumerate(user_messages):
+        positions = [position for position, (message_index, _) in enumerate(activities) if message_index == index]
+        if any(position in collapsed for position in positions):
+            content = compact_content(message["content"],
+                                      [activities[position][1] for position in positions],
+                                      [position in collapsed for position in positions])
+            message = dict(message, content=content)
+        compacted.append(message)
+    return compacted
@@ -0,0 +1,80 @@
+# ##############
+# IMPORT PROFILE
+# ##############
+
+# Import time profile of a server module (cold start of a worker), from the -X importtime output of a fresh
+# interpreter: cumulative time of each module (its own import time plus the modules it imports), own time per
+# top-level package and wall time of the import, module-level setup included (prompt registry, LLM clients).
+# Usage (from the prompt/ folder, with the same environment as the servers):
+#   python import_profile.py [main|main_asgi] [--top 30] [--min-ms 1]
+# With FAST_START=1 the provider SDK is imported by a background thread (see DeferredClient in llm_stream.py) that
+# the startup does not wait for: the threads are not started by the profiled interpreter (their imports would be
+# interleaved with the startup in the -X importtime output), so only the startup path is reported.
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+LINE_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Child interpreter: wall time of the import without background threads
+CHILD_CODE = """
+import os, sys, threading, time
+threading.Thread.start = lambda thread: None
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1e3, flush=True)
+sys.stderr.flush()
+os._exit(0)
+"""
+
+
+# [(own ms, cumulative ms, depth, module), ...] in the order of -X importtime (children before their parent)
+def parse_importtime(output):
+    rows = []
+    for line in output.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            rows.append((int(own) / 1e3, int(cumulative) / 1e3, len(indent) // 2, module))
+    return rows
+
+
+def profile_import(module):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD_CODE.format(module=module)],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def own_time_by_package(rows):
+    packages = {}
+    for own, _, _, module in rows:
+        package = module.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + own
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time profile of a server module")
+    parser.add_argument("module", nargs="?", default="main", help="main (Flask) or main_asgi (ASGI)")
+    parser.add_argument("--top", type=int, default=30, help="modules listed by cumulative time")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="min own time of the listed packages")
+    args = parser.parse_args()
+
+    wall_ms, rows = profile_import(args.module)
+    print(f"import {args.module}: {wall_ms:.0f} ms (wall time, module-level setup included)")
+    print(f"  {'cumulative ms':>14}{'own ms':>9}  module")
+    for own, cumulative, depth, module in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"  {cumulative:>14.1f}{own:>9.1f}  {'  ' * (depth - 1)}{module}")
+    print(f"  {'own ms':>14}  package")
+    for package, own in own_time_by_package(rows):
+        if own >= args.min_ms:
+            print(f"  {own:>14.1f}  {package}")
+
+
+if __name__ == "__main__":
+    main()
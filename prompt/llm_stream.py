@@ -0,0 +1,365 @@
+# ##########
+# LLM STREAM
+# ##########
+
+# Streaming of the LLM response (Mistral API or OpenAI compatible API) and SSE framing,
+# with a synchronous version (Flask server) and an asynchronous version (ASGI server).
+# SSE format: "data: [content]\n\n" or "error: [error message]\n\n"
+# When the client disconnects, the SSE generator is closed (Flask) or cancelled (ASGI): the upstream stream is then
+# closed immediately instead of running until the model finishes, and on_cancel(generated text) is called.
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from sse_flush import coalesce_contents, acoalesce_contents
+
+
+# ---- Clients ----
+
+# llm_url: base URL of the OpenAI-compatible API, or server of the Mistral API ("" or None = default Mistral server)
+# http_client: pooled httpx client (see client_pool.py), None = HTTP client created by the SDK
+def create_client(llm_api, llm_api_key, llm_url, http_client=None):
+    if llm_api == "mistral":
+        from mistralai import Mistral
+
+        # Default server of the Mistral API, unless MISTRAL_SERVER_URL is set (e.g. fake_llm.py)
+        return Mistral(api_key=llm_api_key, server_url=llm_url or None, client=http_client)
+    else:
+        from openai import OpenAI
+
+        return OpenAI(
+            base_url=llm_url,
+            api_key=llm_api_key,
+            http_client=http_client,
+        )
+
+
+def create_async_client(llm_api, llm_api_key, llm_url, http_client=None):
+    if llm_api == "mistral":
+        from mistralai import Mistral
+
+        # The same client provides both the sync and the async (*_async) methods
+        return Mistral(api_key=llm_api_key, server_url=llm_url or None, async_client=http_client)
+    else:
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(
+            base_url=llm_url,
+            api_key=llm_api_key,
+            http_client=http_client,
+        )
+
+
+# Client created in a background thread (fast start, see FAST_START in settings.py): the import of the provider SDK
+# takes 0.5 to 1 s, the server starts serving meanwhile and the first help request waits for the client if it is not
+# ready yet (in the ASGI server, this first wait blocks the event loop). The attributes are forwarded to the client.
+class DeferredClient:
+    def __init__(self, create, *args):
+        self.client = None
+        self.error = None
+        self.ready = threading.Event()
+        threading.Thread(target=self.load, args=(create,) + args, daemon=True).start()
+
+    def load(self, create, *args):
+        try:
+            self.client = create(*args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def get(self):
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self.client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+# ---- Streams ----
+
+# Return the text content of a streamed chunk (None if the chunk has no content)
+def get_chunk_content(llm_api, chunk):
+    if llm_api == "mistral":
+        choices = chunk.data.choices
+    else:
+        choices = chunk.choices
+    if choices and choices[0].delta:
+        return choices[0].delta.content
+    return None
+
+
+# Return the usage payload of a streamed chunk (None if the chunk has no usage, i.e. not the last one)
+def get_chunk_usage(llm_api, chunk):
+    if llm_api == "mistral":
+        return chunk.data.usage
+    return getattr(chunk, "usage", None)
+
+
+# Yield the non-empty content chunks of the LLM response.
+# on_usage(usage) is called with the usage payload sent at the end of the stream (token counts).
+# on_connect(seconds) is called when the response headers are received.
+def stream_llm_content(client, llm_api, llm_model, messages, llm_params, on_usage=None, on_connect=None):
+    start = time.perf_counter()
+    # --- Call Mistral API ---
+    if llm_api == "mistral":
+        response = client.chat.stream(
+            model=llm_model,
+            messages=messages,
+            **llm_params  # Inject common params
+        )
+    # --- Call OpenAI API (or compatible) ---
+    else:
+        response = client.chat.completions.create(
+            model=llm_model,
+            messages=messages,
+            stream=True,
+            **llm_params  # Inject common params
+        )
+    if on_connect:
+        on_connect(time.perf_counter() - start)
+    # The upstream HTTP response is closed when the generator is closed before the end of the stream
+    with response:
+        for chunk in response:
+            usage = get_chunk_usage(llm_api, chunk)
+            if usage and on_usage:
+                on_usage(usage)
+            content = get_chunk_content(llm_api, chunk)
+            if content:  # Only send non-empty chunks
+                yield content
+
+
+# Async version of stream_llm_content()
+async def astream_llm_content(client, llm_api, llm_model, messages, llm_params, on_usage=None, on_connect=None):
+    start = time.perf_counter()
+    # --- Call Mistral API ---
+    if llm_api == "mistral":
+        response = await client.chat.stream_async(
+            model=llm_model,
+            messages=messages,
+            **llm_params  # Inject common params
+        )
+    # --- Call OpenAI API (or compatible) ---
+    else:
+        response = await client.chat.completions.create(
+            model=llm_model,
+            messages=messages,
+            stream=True,
+            **llm_params  # Inject common params
+        )
+    if on_connect:
+        on_connect(time.perf_counter() - start)
+    # The upstream HTTP response is closed when the generator is closed or cancelled before the end of the stream
+    async with response:
+        async for chunk in response:
+            usage = get_chunk_usage(llm_api, chunk)
+            if usage and on_usage:
+                on_usage(usage)
+            content = get_chunk_content(llm_api, chunk)
+            if content:  # Only send non-empty chunks
+                yield content
+
+
+# ---- SSE framing ----
+
+def sse_data(content):
+    # Escape new lines du to SSE format: "data: [content]\n\n" ou "error: [error message]\n\n"
+    escaped_content = content.replace('\n', '\\n')
+    return f"data: {escaped_content}\n\n"
+
+
+def sse_error(error_message):
+    return f"error: {error_message}\n\n"
+
+
+# llm_api None: hedged request, the message does not name one backend (see hedging.py)
+def empty_response_message(llm_api):
+    if llm_api is None:
+        return "POST llm_inference_stream : empty response from the LLM backends"
+    if llm_api == "mistral":
+        return "POST llm_inference_stream : empty response from Mistral"
+    return "POST llm_inference_stream : empty response from LLM"
+
+
+def log_error(error_message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ERROR] {error_message}")
+
+
+# Yield the SSE frames of the LLM response
+# flush_policy: (max delay in seconds, min bytes) to coalesce the deltas into fewer frames (see sse_flush.py)
+# hedging: HedgedBackends streaming the contents from several backends instead of client (see hedging.py)
+# observation: StreamObservation recording the timings of the stream (see metrics.py)
+# prepare: provider-specific preparation of the call, prepare(llm_api, messages, llm_params) -> (messages, llm_params)
+# applied to the messages and parameters of the request for the API of the backend called (see prompt_cache.py)
+def generate_sse(client, llm_api, llm_model, messages, llm_params, on_usage=None, on_cancel=None, flush_policy=None,
+                 hedging=None, observation=None, prepare=None):
+    on_connect = None
+    if observation is not None:
+        observation.started()
+        on_connect = lambda seconds: observation.connected("primary", seconds)
+    if hedging is not None:
+        contents = hedging.stream(messages, llm_params, on_usage, observation, prepare)
+    else:
+        if prepare is not None:
+            messages, llm_params = prepare(llm_api, messages, llm_params)
+        contents = stream_llm_content(client, llm_api, llm_model, messages, llm_params, on_usage, on_connect)
+    if flush_policy:
+        contents = coalesce_contents(contents, *flush_policy)
+    generated = []
+    try:
+        has_content = False  # Flag to check if any content was received
+        for content in contents:
+            if not has_content and observation is not None:
+                observation.first_token()
+            has_content = True
+            generated.append(content)
+            # Stream the chunk
+            yield sse_data(content)
+
+        # If no content was generated by the model
+        if not has_content:
+            if observation is not None:
+                observation.empty()
+            error_message = empty_response_message(llm_api if hedging is None else None)
+            log_error(error_message)
+            yield sse_error(error_message)
+        elif observation is not None:
+            observation.finished("".join(generated))
+
+    except GeneratorExit:
+        # Client disconnected: close the upstream stream
+        contents.close()
+        if observation is not None:
+            observation.cancelled()
+        if on_cancel:
+            on_cancel("".join(generated))
+        raise
+
+    except Exception as e:
+        if observation is not None:
+            observation.error(e)
+        error_message = "POST llm_inference_stream : " + str(e)
+        log_error(error_message)
+        yield sse_error(error_message)
+
+
+# Async version of generate_sse()
+async def agenerate_sse(client, llm_api, llm_model, messages, llm_params, on_usage=None, on_cancel=None,
+                        flush_policy=None, hedging=None, observation=None, prepare=None):
+    on_connect = None
+    if observation is not None:
+        observation.started()
+        on_connect = lambda seconds: observation.connected("primary", seconds)
+    if hedging is not None:
+        contents = hedging.astream(messages, llm_params, on_usage, observation, prepare)
+    else:
+        if prepare is not None:
+            messages, llm_params = prepare(llm_api, messages, llm_params)
+        contents = astream_llm_content(client, llm_api, llm_model, messages, llm_params, on_usage, on_connect)
+    if flush_policy:
+        contents = acoalesce_contents(contents, *flush_policy)
+    generated = []
+    try:
+        has_content = False  # Flag to check if any content was received
+        async for content in contents:
+            if not has_content and observation is not None:
+                observation.first_token()
+            has_content = True
+            generated.append(content)
+            # Stream the chunk
+            yield sse_data(content)
+
+        # If no content was generated by the model
+        if not has_content:
+            if observation is not None:
+                observation.empty()
+            error_message = empty_response_message(llm_api if hedging is None else None)
+            log_error(error_message)
+            yield sse_error(error_message)
+        elif observation is not None:
+            observation.finished("".join(generated))
+
+    except (GeneratorExit, asyncio.CancelledError):
+        # Client disconnected: close the upstream stream (already closed if the cancellation came from it)
+        await contents.aclose()
+        if observation is not None:
+            observation.cancelled()
+        if on_cancel:
+            on_cancel("".join(generated))
+        raise
+
+    except Exception as e:
+        if observation is not None:
+            observation.error(e)
+        error_message = "POST llm_inference_stream : " + str(e)
+        log_error(error_message)
+        yield sse_error(error_message)
+
+
+# ---- Observation of the coalesced requests ----
+
+# Error frame of a stream driven by another request (the exception itself is not available to the attached requests)
+class CoalescedStreamError(Exception):
+    pass
+
+
+class FrameObserver:
+    def __init__(self, observation):
+        self.observation = observation
+        self.generated = []
+        self.error_message = None
+
+    def started(self):
+        self.observation.started()
+        self.observation.served_by("coalesced")
+
+    def frame(self, frame):
+        if frame.startswith("data: "):
+            if not self.generated:
+                self.observation.first_token()
+            self.generated.append(frame[len("data: "):].rstrip("\n").replace("\\n", "\n"))
+        elif frame.startswith("error: "):
+            self.error_message = frame[len("error: "):].rstrip("\n")
+
+    def finished(self):
+        if self.error_message is not None:
+            if "empty response" in self.error_message:
+                self.observation.empty()
+            else:
+                self.observation.error(CoalescedStreamError(self.error_message))
+        elif self.generated:
+            self.observation.finished("".join(self.generated))
+
+
+# Yield the SSE frames received by a request attached to an upstream stream driven by another request (see
+# single_flight.py) and report them to its observation as generate_sse() does for the driving request: time to first
+# frame and completion as seen by this request, backend "coalesced"
+def observe_frames(frames, observation):
+    observer = FrameObserver(observation)
+    observer.started()
+    try:
+        for frame in frames:
+            observer.frame(frame)
+            yield frame
+    except GeneratorExit:
+        observation.cancelled()
+        raise
+    observer.finished()
+
+
+# Async version of observe_frames()
+async def aobserve_frames(frames, observation):
+    observer = FrameObserver(observation)
+    observer.started()
+    try:
+        async for frame in frames:
+            observer.frame(frame)
+            yield frame
+    except (GeneratorExit, asyncio.CancelledError):
+        observation.cancelled()
+        raise
+    observer.finished()
@@ -0,0 +1,397 @@
+# #########
+# LOAD TEST
+# #########
+
+# Replay of realistic classroom help traffic against POST /llm-inference-stream, with a time to first token SLO report.
+# Arrival pattern: the help requests (ASKED / ASSISTANT_HELP events) of the interaction traces
+# (data/raw/raw_data_interaction_traces.csv), assigned to the class windows of SESSION_DATE
+# (src/session_date_constants.py) through the students of CLASS_MAPPING (src/students_constants.py). When the raw
+# traces are not available, the help requests of each student of groups B and C are drawn from the cleaned data
+# (_num_calls and _max_level of data/cleaned/cleaned_all_data_pyratesLLM2025.csv), spread over the sessions of
+# their class with a level progressing over the play time.
+# Each request carries the level_id, modality (group B = 1, group C = 2) and game_id of the student, a language
+# (FR, or EN for a share of the students) and an activity history growing with the game time of the level.
+# Scenarios:
+# - burst (default): one session (--session S1) of each selected class (--classes), all starting at the same time
+# - day (--day 2025-10-15): the sessions of that day, with their real overlap
+# The schedule is compressed by --speedup and replicated --scale times (each copy plays as another class). With
+# several scales (--scale 1,2,4,8), the steps run in order until the SLO is violated (p95 time to first token above
+# --slo-ttft-ms or error rate above --slo-error-rate): the max sustainable concurrency is the max number of streams in
+# flight of the last step within the SLO.
+# Run the server under test with the worker configuration to measure (e.g. gunicorn -w 4 main:MyApp, or uvicorn
+# main_asgi:application), against a real provider or the fake LLM server (fake_llm.py), then (from the prompt/ folder):
+#   python load_test.py --url http://localhost:5000 --label "flask 4 workers" --scale 1,2,4,8 --output load_test.jsonl
+# With --output, each step is appended as one JSON line and the max sustainable concurrency of each --label found
+# in the file is printed at the end, to compare the worker configurations.
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+from metrics import percentile
+from token_count import count_tokens
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+sys.path.append(SRC_DIR)
+
+import interaction_constants as int_const
+import session_date_constants as ses_const
+import students_constants as stu_const
+
+TRACES_PATH = os.path.join(DATA_DIR, "raw", "raw_data_interaction_traces.csv")
+CLEANED_PATH = os.path.join(DATA_DIR, "cleaned", "cleaned_all_data_pyratesLLM2025.csv")
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+GROUP_MODALITIES = {stu_const.GROUP_B: 1, stu_const.GROUP_C: 2}  # groups using the assistant
+MAX_LEVEL = 8
+
+
+def parse_date(text):
+    if "." not in text:
+        text += ".000"
+    return datetime.strptime(text, DATE_FORMAT)
+
+
+# ---- Arrival pattern ----
+
+# game_id -> (class_id, group) of the students using the assistant
+def students_by_game():
+    students = {}
+    for class_id, class_students in stu_const.CLASS_MAPPING.items():
+        for student in class_students:
+            if student[stu_const.GROUP_ID] in GROUP_MODALITIES:
+                students[student[stu_const.GAME_ID]] = (class_id, student[stu_const.GROUP_ID])
+    return students
+
+
+# Help requests of the interaction traces: [{"date", "game_id", "level_id", "game_time"}, ...]
+def read_trace_events(path):
+    events = []
+    with open(path, encoding="latin1", newline="") as file:
+        for row in csv.DictReader(file, delimiter=";"):
+            if row[int_const.ACTION_DATA_KEY] != int_const.ASKED_ACTION or \
+                    row[int_const.OBJECT_DATA_KEY] != int_const.ASSISTANT_HELP_OBJECT:
+                continue
+            try:
+                level_id = int(float(row[int_const.LEVEL_DATA_KEY]))
+                game_time = float(row[int_const.GAME_TIME_DATA_KEY] or 0)
+            except ValueError:
+                continue
+            events.append({
+                "date": parse_date(row[int_const.DATE_DATA_KEY]),
+                "game_id": row[int_const.GAME_ID_DATA_KEY],
+                "level_id": level_id,
+                "game_time": game_time,
+            })
+    return events
+
+
+# Help requests drawn from the number of calls and the max level of each student (cleaned data)
+def synthetic_events(path, students, rng):
+    events = []
+    with open(path, encoding="latin1", newline="") as file:
+        for row in csv.DictReader(file):
+            game_id = row["_game_id"]
+            if game_id not in students or not row["_num_calls"].isdigit():
+                continue
+            sessions = [(parse_date(session["start"]), parse_date(session["end"]))
+                        for session in ses_const.SESSION_DATE[students[game_id][0]].values()]
+            play_time = sum((end - start).total_seconds() for start, end in sessions)
+            max_level = int(row["_max_level"]) if row["_max_level"].isdigit() else MAX_LEVEL
+            level_time = play_time / max_level
+            for _ in range(int(row["_num_calls"])):
+                # Position in the total play time of the student -> session, date and level
+                position = rng.random() * play_time
+                level_id = min(max_level, 1 + int(position / level_time))
+                game_time = position - (level_id - 1) * level_time
+                for start, end in sessions:
+                    duration = (end - start).total_seconds()
+                    if position <= duration:
+                        events.append({"date": start + (end - start) * (position / duration), "game_id": game_id,
+                                       "level_id": level_id, "game_time": game_time})
+                        break
+                    position -= duration
+    return events
+
+
+# Help requests grouped by class window: (class_id, session) -> {"start", "requests": [(offset, event), ...]}
+def class_windows(events, students):
+    windows = {}
+    for event in events:
+        if event["game_id"] not in students:
+            continue
+        class_id = students[event["game_id"]][0]
+        for session, dates in ses_const.SESSION_DATE[class_id].items():
+            start, end = parse_date(dates["start"]), parse_date(dates["end"])
+            if start <= event["date"] <= end:
+                window = windows.setdefault((class_id, session), {"start": start, "requests": []})
+                window["requests"].append(((event["date"] - start).total_seconds(), event))
+                break
+    return windows
+
+
+# Requests to send: [{"at", "class_id", "game_id", "level_id", "modality", "language", "game_time"}, ...] sorted by
+# "at" (seconds from the start of the replay)
+def build_schedule(windows, students, classes, session, day, scale, speedup, english_share, rng):
+    if day is not None:
+        selected = {key: window for key, window in windows.items() if window["start"].date().isoformat() == day}
+    else:
+        selected = {key: window for key, window in windows.items() if key[1] == session}
+    if classes:
+        selected = {key: window for key, window in selected.items() if key[0] in classes}
+    if not selected:
+        return []
+    origin = min(window["start"] for window in selected.values())
+    languages = {}
+    schedule = []
+    for copy in range(scale):
+        suffix = f"-{copy}" if copy else ""
+        for (class_id, _), window in selected.items():
+            window_offset = (window["start"] - origin).total_seconds() if day is not None else 0.0
+            for offset, event in window["requests"]:
+                game_id = event["game_id"] + suffix
+                if game_id not in languages:
+                    languages[game_id] = "EN" if rng.random() < english_share else "FR"
+                schedule.append({
+                    "at": (window_offset + offset) / speedup,
+                    "class_id": class_id + suffix,
+                    "game_id": game_id,
+                    "level_id": event["level_id"],
+                    "modality": GROUP_MODALITIES[students[event["game_id"]][1]],
+                    "language": languages[game_id],
+                    "game_time": event["game_time"],
+                })
+    schedule.sort(key=lambda request: request["at"])
+    return schedule
+
+
+# ---- Messages ----
+
+def random_code(level_id, rng):
+    lines = ["walk()", "right()", "walk()", "left()"][:rng.randint(1, 4)]
+    for _ in range(rng.randint(0, level_id)):
+        lines += [f"for _ in range({rng.randint(2, 16)}):", "    " + rng.choice(["walk()", "jump()", "attack()"])]
+    if level_id >= 3 and rng.random() < 0.5:
+        lines += ["if is_barrel():", "    attack()", "else:", "    walk()"]
+    return "\n".join(lines + [rng.choice(["open_chest()", "read_message()", "walk()"])])
+
+
+def char_state(rng):
+    return (f"<char_state><x_pos>{rng.randint(1, 20)}</x_pos><y_pos>{rng.randint(1, 6)}</y_pos>"
+            f"<flipped>{rng.choice(['true', 'false'])}</flipped>"
+            f"<owned_key>{rng.choice(['true', 'false'])}</owned_key></char_state>")
+
+
+# Activity history of the level until the help request: about one activity every 40 seconds of game time
+def build_messages(level_id, game_time, rng):
+    count = max(0, int(game_time / 40 + rng.gauss(0, 2)))
+    times = sorted(rng.uniform(0, game_time) for _ in range(count))
+    activities = []
+    code = random_code(level_id, rng)
+    for activity_time in times:
+        activity_type = rng.choices(["launched-program", "displayed-content", "copied-content", "pasted-content"],
+                                    [6, 2, 1, 1])[0]
+        if activity_type == "launched-program":
+            code = random_code(level_id, rng)
+            extra = f"<result>{char_state(rng)}</result>"
+        elif activity_type == "displayed-content":
+            section = rng.choice(["FOR_SIMPLE_SECTION", "VAR_CREATION_SECTION", "CONDI_2BRAN_SECTION"])
+            extra = f"<content>{section}</content>"
+        else:
+            extra = ""
+        activities.append(f"<activity><type>{activity_type}</type><game_time>{round(activity_time)}</game_time>"
+                          f"<code>{code}</code>{extra}</activity>")
+    activities.append(f"<activity><type>asked-help</type><game_time>{round(game_time)}</game_time>"
+                      f"<code>{code}</code></activity>")
+    return [{"role": "user", "content": "<activities>" + "".join(activities) + "</activities>"}]
+
+
+# ---- Replay ----
+
+class ReplayState:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.results = []
+        self.elapsed = 0.0
+
+
+# One help request: time to first data frame, full stream duration and outcome
+async def send_help_request(client, url, request, messages, state):
+    params = {key: request[key] for key in ("level_id", "language", "modality", "game_id", "class_id")}
+    state.in_flight += 1
+    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+    start = time.perf_counter()
+    result = {"level_id": request["level_id"], "modality": request["modality"], "ttft": None, "outcome": "ok",
+              "message_tokens": count_tokens(messages[0]["content"])}
+    try:
+        async with client.stream("POST", url + "/llm-inference-stream", params=params,
+                                 json={"messages": messages}) as response:
+            if response.status_code != 200:
+                await response.aread()
+                result["outcome"] = "rejected" if response.status_code == 429 else f"http_{response.status_code}"
+            else:
+                async for line in response.aiter_lines():
+                    if line.startswith("data:") and result["ttft"] is None:
+                        result["ttft"] = time.perf_counter() - start
+                    elif line.startswith("error:"):
+                        result["outcome"] = "empty_response" if "empty response" in line else "sse_error"
+                if result["outcome"] == "ok" and result["ttft"] is None:
+                    result["outcome"] = "no_content"
+    except httpx.HTTPError as e:
+        result["outcome"] = type(e).__name__
+    finally:
+        state.in_flight -= 1
+    result["duration"] = time.perf_counter() - start
+    state.results.append(result)
+
+
+async def replay(url, schedule, timeout, seed):
+    rng = random.Random(seed)
+    state = ReplayState()
+    client = httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=10),
+                               limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+    tasks = []
+    start = time.perf_counter()
+    try:
+        for request in schedule:
+            # Messages built before the send time so that the send itself is on time
+            messages = build_messages(request["level_id"], request["game_time"], rng)
+            delay = request["at"] - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send_help_request(client, url, request, messages, state)))
+        await asyncio.gather(*tasks)
+    finally:
+        await client.aclose()
+    state.elapsed = time.perf_counter() - start
+    return state
+
+
+# ---- Report ----
+
+def summarize(state, schedule):
+    results = state.results
+    ok = [result for result in results if result["outcome"] == "ok"]
+    outcomes = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+    ttft = [result["ttft"] * 1e3 for result in results if result["ttft"] is not None]
+    durations = [result["duration"] * 1e3 for result in ok]
+    message_tokens = [result["message_tokens"] for result in results]
+    return {
+        "requests": len(results),
+        "classes": len({request["class_id"] for request in schedule}),
+        "students": len({request["game_id"] for request in schedule}),
+        "elapsed_s": round(state.elapsed, 1),
+        "max_in_flight": state.max_in_flight,
+        "message_tokens_p50": percentile(message_tokens, 0.5),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "outcomes": outcomes,
+        "ttft_ms": {f"p{q}": round(percentile(ttft, q / 100), 1) if ttft else None for q in (50, 95, 99)},
+        "stream_ms": {f"p{q}": round(percentile(durations, q / 100), 1) if durations else None for q in (50, 95, 99)},
+    }
+
+
+def within_slo(summary, slo_ttft_ms, slo_error_rate):
+    p95 = summary["ttft_ms"]["p95"]
+    return p95 is not None and p95 <= slo_ttft_ms and summary["error_rate"] <= slo_error_rate
+
+
+def print_header():
+    print(f"  {'scale':>5}{'requests':>10}{'in flight':>11}{'errors':>9}{'TTFT p50':>10}{'p95':>8}{'p99':>8}"
+          f"{'stream p50':>12}{'p95':>8}{'p99':>8}  SLO")
+
+
+def print_step(scale, summary, passed):
+    ttft, stream = summary["ttft_ms"], summary["stream_ms"]
+
+    def ms(value):
+        return "-" if value is None else f"{value:.0f}"
+
+    print(f"  {scale:>5}{summary['requests']:>10}{summary['max_in_flight']:>11}{summary['error_rate']:>9.2%}"
+          f"{ms(ttft['p50']):>10}{ms(ttft['p95']):>8}{ms(ttft['p99']):>8}"
+          f"{ms(stream['p50']):>12}{ms(stream['p95']):>8}{ms(stream['p99']):>8}  {'ok' if passed else 'VIOLATED'}")
+
+
+# Max sustainable concurrency of each worker configuration (label) of the JSON lines report
+def print_comparison(path):
+    configurations = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                step = json.loads(line)
+                best = configurations.setdefault(step["label"], 0)
+                if step["within_slo"]:
+                    configurations[step["label"]] = max(best, step["max_in_flight"])
+    print("Max sustainable concurrency per worker configuration")
+    for label, concurrency in configurations.items():
+        print(f"  {label:40}{concurrency:>6} streams")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classroom burst load test of /llm-inference-stream")
+    parser.add_argument("--url", default="http://localhost:5000", help="base URL of the server under test")
+    parser.add_argument("--label", default="default", help="worker configuration of the server under test")
+    parser.add_argument("--classes", help="comma-separated class ids of SESSION_DATE (all by default)")
+    parser.add_argument("--session", default="S1", help="session replayed by each class (burst scenario)")
+    parser.add_argument("--day", help="replay the sessions of this day (YYYY-MM-DD) with their real overlap")
+    parser.add_argument("--speedup", type=float, default=10, help="time compression of the schedule")
+    parser.add_argument("--scale", default="1", help="comma-separated replication factors of the classes")
+    parser.add_argument("--english-share", type=float, default=0.2, help="share of the students playing in EN")
+    parser.add_argument("--slo-ttft-ms", type=float, default=2000, help="p95 time to first token objective")
+    parser.add_argument("--slo-error-rate", type=float, default=0.01, help="error rate objective")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout of a help request in seconds")
+    parser.add_argument("--traces", default=TRACES_PATH, help="raw interaction traces (CSV, ';' separated)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON lines report, one line per step")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    students = students_by_game()
+    if os.path.exists(args.traces):
+        events = read_trace_events(args.traces)
+        source = args.traces
+    else:
+        events = synthetic_events(CLEANED_PATH, students, rng)
+        source = f"{CLEANED_PATH} (calls per student, raw traces not found)"
+    windows = class_windows(events, students)
+    classes = set(args.classes.split(",")) if args.classes else None
+    scenario = f"day {args.day}" if args.day else f"burst of the {args.session} sessions"
+    print(f"Load test of {args.url} ({args.label}): {scenario}, speedup x{args.speedup:g}")
+    print(f"  help requests from {source}")
+    print_header()
+
+    for scale in [int(value) for value in args.scale.split(",")]:
+        schedule = build_schedule(windows, students, classes, args.session, args.day, scale, args.speedup,
+                                  args.english_share, random.Random(args.seed))
+        if not schedule:
+            print("  no help request in the selected class windows")
+            return
+        state = asyncio.run(replay(args.url.rstrip("/"), schedule, args.timeout, args.seed))
+        summary = summarize(state, schedule)
+        passed = within_slo(summary, args.slo_ttft_ms, args.slo_error_rate)
+        print_step(scale, summary, passed)
+        if args.output:
+            step = {"label": args.label, "scenario": scenario, "speedup": args.speedup, "scale": scale,
+                    "slo_ttft_ms": args.slo_ttft_ms, "slo_error_rate": args.slo_error_rate, "within_slo": passed}
+            step.update(summary)
+            with open(args.output, "a", encoding="utf-8") as file:
+                file.write(json.dumps(step) + "\n")
+        if not passed:
+            break
+
+    if args.output:
+        print_comparison(args.output)
+
+
+if __name__ == "__main__":
+    main()
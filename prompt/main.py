@@ -1,20 +1,37 @@
 from flask import Flask, request, jsonify, Response, stream_with_context
-from dotenv import load_dotenv
-from datetime import datetime
-from system_prompt_modality_B import get_system_prompt_modality_B
-from system_prompt_modality_C import get_system_prompt_modality_C
+from settings import llm_api, llm_api_key, llm_url, llm_model, llm_params, fast_start, mistral_server_url
+from settings import llm_alt_api, llm_alt_api_key, llm_alt_url, llm_alt_model, hedge_delay, circuit_breaker_failures, \
+    circuit_breaker_cooldown
+from settings import single_flight_enabled, prompt_cache_enabled, prompt_cache_marker, history_token_budget, \
+    code_delta_enabled
+from settings import session_store_backend, session_store_url, session_ttl, sse_flush_policy, metrics_enabled
+from settings import trace_sample_rate, trace_log
+from settings import admission_enabled, admission_max_concurrent, admission_max_per_game, admission_class_weights, \
+    admission_keepalive, admission_max_wait
+from settings import response_cache_enabled, response_cache_max_entries, response_cache_max_bytes, \
+    response_cache_ttl, response_cache_pacing
+from settings import client_pool_enabled, client_pool_max_connections, client_pool_keepalive_expiry, \
+    client_pool_http2, client_pool_warmup, client_pool_warmup_interval, client_pool_warmup_schedule
+from help_request import validate_help_request, build_full_messages, request_key
+from llm_stream import create_client, DeferredClient, generate_sse, observe_frames
+from single_flight import SingleFlight
+from prompt_cache import PromptCacheStats, prompt_cache_preparer
+from history_compaction import compact_history
+from code_delta import CodeDeltaStats, encode_code_history
+from session_store import create_session_store
+from stream_cancel import CancelledStreamStats
+from admission import AdmissionController, parse_class_weights
+from hedging import Backend, HedgedBackends
+from metrics import ServerMetrics
+from tracing import Tracer, combine_observations
+from response_cache import ResponseCache, replay_frames
+from client_pool import ClientPool, PoolWarmer
 import os
+import time
 
 os.environ['OPENBLAS_NUM_THREADS'] = "1"
-import pandas as pd
-import __main__
-
-__main__.pd = pd
 from flask_cors import CORS
 
-# Load environment variables from .env file
-load_dotenv()
-
 MyApp = Flask(__name__)
 CORS(MyApp)
 # CORS(MyApp,resources={r"/*": {"origins": "*"}})
@@ -24,44 +41,95 @@ CORS(MyApp)
 #                       "https://py-rates.org"])
 application = MyApp
 
-# ---- Environment variables ----
-llm_api = os.getenv('LLM_API')
-llm_api_key = os.getenv('LLM_API_KEY')
-llm_url = os.getenv('LLM_URL')
-llm_model = os.getenv('LLM_MODEL')
-
-# ---- Init client depending on API ----
-if llm_api == "mistral":
-    from mistralai import Mistral
-
-    client = Mistral(api_key=llm_api_key)  # no need base_url here
-else:
-    from openai import OpenAI
-
-    client = OpenAI(
-        base_url=llm_url,
-        api_key=llm_api_key,
-    )
-
-# ---- Common LLM parameters ----
-llm_params = {
-    # temperature : Controls the randomness of the responses [0.0,2.0] / def = 1.0
-    "temperature": 0.3,
-    # 0.3 -> Lower temperature reduces randomness. This ensures factual, consistent, and clear responses.
-    # max_tokens : Maximum length of the generated response [0,model max] / def = no def
-    "max_tokens": 500,  # 500 -> Allows for reasonably detailed explanations without being too verbose.
-    # top_p : Nucleus sampling to filter unlikely tokens [0.0,1.0] / def = 1.0
-    "top_p": 0.9,  # 0.9 -> Helps avoid unlikely creative words while keeping some diversity
-    # presence_penalty : Discourages repeating earlier tokens [-2.0,2.0] / def = 0.0
-    "presence_penalty": 0, # 0 -> Default value
-    # frequency_penalty: Reduces exact repetitions [-2.0,2.0] / def = 0.0
-    "frequency_penalty": 0, # 0-> Default value
-}
-
-# ---- Accepted input values ----
-accepted_levels = [1, 2, 3, 4, 5, 6, 7, 8]
-accepted_languages = ["EN", "FR"]
-accepted_modalities = [1, 2]
+# ---- Process-bound resources ----
+# LLM clients (connection pools), hedged backends and session store connection. The pre-fork profile creates them
+# again in each worker (see create_app and gunicorn_conf.py), so that the workers do not share the sockets of the
+# master process.
+# Pooled clients: connections sized to the upstream streams of a worker (one per thread, or the admission limit)
+client_pool_size = client_pool_max_connections or (
+    admission_max_concurrent if admission_enabled else int(os.getenv('GUNICORN_THREADS', '32')))
+pool_warmer = None
+
+
+def create_backend_client(name, api, api_key, url, deferred):
+    # The Mistral SDK ignores LLM_URL/LLM_ALT_URL (OpenAI-compatible URLs), see MISTRAL_SERVER_URL in settings.py
+    if api == "mistral":
+        url = mistral_server_url
+    if client_pool_enabled:
+        pool = ClientPool(name, api, api_key, url, client_pool_size, client_pool_keepalive_expiry, client_pool_http2,
+                          deferred=deferred)
+        client_pools.append(pool)
+        return pool.client
+    if deferred:
+        return DeferredClient(create_client, api, api_key, url)
+    return create_client(api, api_key, url)
+
+
+# warm: start the warm-up thread of the client pools (not in the gunicorn master, see gunicorn_conf.py)
+def create_worker_resources(deferred=False, warm=True):
+    global client, hedging, session_store, client_pools, pool_warmer
+
+    # Init client depending on API
+    client_pools = []
+    client = create_backend_client("primary", llm_api, llm_api_key, llm_url, deferred)
+
+    # Hedged requests and failover to an alternate backend
+    hedging = None
+    if llm_alt_api:
+        alt_client = create_backend_client("alternate", llm_alt_api, llm_alt_api_key, llm_alt_url, deferred)
+        hedging = HedgedBackends(
+            [Backend("primary", client, llm_api, llm_model),
+             Backend("alternate", alt_client, llm_alt_api, llm_alt_model)],
+            hedge_delay, circuit_breaker_failures, circuit_breaker_cooldown)
+
+    # Connection warm-up of the client pools
+    if pool_warmer is not None:
+        pool_warmer.stop()
+        pool_warmer = None
+    if client_pools and warm and client_pool_warmup > 0:
+        pool_warmer = PoolWarmer(client_pools, client_pool_warmup, client_pool_warmup_interval,
+                                 client_pool_warmup_schedule)
+        pool_warmer.start()
+
+    # Sessions of the students
+    session_store = None
+    if session_store_backend != "none":
+        session_store = create_session_store(session_store_backend, session_store_url, session_ttl)
+
+
+# Imported by the gunicorn master of the pre-fork profile: the warm-up threads are started by the workers (post_fork)
+create_worker_resources(deferred=fast_start, warm=os.getenv('PREFORK_MASTER') != '1')
+
+
+# ---- Coalescing of identical in-flight requests ----
+single_flight = SingleFlight() if single_flight_enabled else None
+
+# ---- Cache of the completed responses ----
+response_cache = None
+if response_cache_enabled:
+    response_cache = ResponseCache(response_cache_max_entries, response_cache_max_bytes, response_cache_ttl)
+
+# ---- Provider-side prompt caching ----
+prompt_cache_stats = PromptCacheStats() if prompt_cache_enabled else None
+
+# ---- Delta encoding of the code snapshots ----
+code_delta_stats = CodeDeltaStats() if code_delta_enabled else None
+
+# ---- Prometheus metrics ----
+metrics = ServerMetrics() if metrics_enabled else None
+
+# ---- Sampled stage tracing ----
+tracer = Tracer(trace_log, trace_sample_rate) if trace_sample_rate > 0 else None
+
+# ---- Upstream streams cancelled on client disconnection ----
+cancelled_stream_stats = CancelledStreamStats(llm_params["max_tokens"])
+
+# ---- Admission control of the upstream streams ----
+admission = None
+if admission_enabled:
+    admission = AdmissionController(admission_max_concurrent, admission_max_per_game,
+                                    parse_class_weights(admission_class_weights),
+                                    admission_keepalive, admission_max_wait)
 
 
 @MyApp.route("/llm-inference-stream", methods=["POST"])
@@ -78,101 +146,176 @@ def get_llm_inference_stream():
     # print(f"  - presence_penalty: {llm_params['presence_penalty']}")
     # print(f"  - frequency_penalty: {llm_params['frequency_penalty']}")
     try:
+        game_slot = None
+        started = time.perf_counter()
+        trace = tracer.start_trace() if tracer is not None else None
         # Extract request parameters
         level_id = request.args.get('level_id', type=int)
         language = request.args.get('language', type=str)
         modality = request.args.get('modality', type=int)
+        game_id = request.args.get('game_id', type=str)
+        class_id = request.args.get('class_id', type=str)
         content = request.get_json()
         user_messages = content.get('messages', [])
+        if trace is not None:
+            trace.end_stage("parse_request")
 
         # Input validation
-        if not level_id or level_id not in accepted_levels:
-            return jsonify({"error": "Invalid level_id"}), 400
-        if not language or language not in accepted_languages:
-            return jsonify({"error": "Invalid language"}), 400
-        if not modality or modality not in accepted_modalities:
-            return jsonify({"error": "Invalid modality"}), 400
-        if not user_messages:
-            return jsonify({"error": "Messages array is empty"}), 400
+        error_message = validate_help_request(level_id, language, modality, user_messages)
+        if trace is not None:
+            trace.end_stage("validate")
+            trace.attributes.update({"level_id": level_id, "language": language, "modality": modality})
+        if metrics is not None:
+            metrics.record_validation(level_id, language, modality, error_message, time.perf_counter() - started)
+        if error_message:
+            if trace is not None:
+                trace.finish(400)
+            return jsonify({"error": error_message}), 400
+
+        # Per-student limit of the help requests in flight
+        if admission is not None:
+            game_slot = admission.reserve_game(game_id)
+            if game_slot is None:
+                if trace is not None:
+                    trace.finish(429)
+                return jsonify({"error": "Too many help requests in flight"}), 429
 
         # print("Modality: "+str(modality))
 
+        started = time.perf_counter()
+        # Session: the client only sends the messages since its last help request
+        session_context = (level_id, modality, language)
+        use_session = session_store is not None and bool(game_id)
+        if use_session:
+            user_messages = session_store.get_messages(game_id, session_context) + user_messages
+        session_messages = user_messages
+
+        # Compaction of the activity history
+        if history_token_budget:
+            user_messages = compact_history(user_messages, history_token_budget)
+
+        # Code snapshots encoded relative to the previous activity, compression ratio sent in a response header
+        headers = {}
+        if code_delta_stats is not None:
+            user_messages, code_delta_report = encode_code_history(user_messages)
+            code_delta_stats.record(code_delta_report)
+            headers["X-Code-Delta-Ratio"] = str(code_delta_report["ratio"])
+
         # Build prompt
-        system_message = {}
-        if modality == 1 :
-            system_message = get_system_prompt_modality_B(level_id, language)
-        elif modality == 2 :
-            system_message = get_system_prompt_modality_C(level_id, language)
-    
-        full_messages = [system_message] + user_messages
+        full_messages = build_full_messages(level_id, language, modality, user_messages)
+        on_usage = None
+        prepare = None
+        if prompt_cache_stats is not None:
+            # Cache hints of the provider applied when the backend is called (primary or alternate)
+            prepare = prompt_cache_preparer(prompt_cache_marker, modality, level_id, language)
+            on_usage = lambda usage: prompt_cache_stats.record(level_id, modality, usage)
+        stream_observation = None
+        if metrics is not None:
+            metrics.record_prompt_build(level_id, language, modality, time.perf_counter() - started)
+            stream_observation = metrics.observe_stream(level_id, language, modality)
+        if trace is not None:
+            trace.end_stage("build_prompt")
+        observation = combine_observations(stream_observation, trace)
 
         # print(full_messages)
 
+        key = request_key(level_id, language, modality, user_messages)
+
+        def generate_frames():
+            # print("LLM API Calling")
+            frames = generate_sse(client, llm_api, llm_model, full_messages, llm_params, on_usage,
+                                  cancelled_stream_stats.record, sse_flush_policy, hedging,
+                                  observation, prepare)
+            if response_cache is not None:
+                frames = response_cache.record(key, frames)
+            # Wait for a slot before calling the LLM (keep-alive comments are not recorded in the response cache)
+            if admission is not None:
+                frames = admission.admit(class_id, frames)
+            return frames
+
         def generate():
-            try:
-                # print("LLM API Calling")
-                # --- Call Mistral API ---
-                if llm_api == "mistral":
-                    response = client.chat.stream(
-                        model=llm_model,
-                        messages=full_messages,
-                        **llm_params  # Inject common params
-                    )
-                    has_content = False
-                    for chunk in response:
-                        if chunk.data.choices and chunk.data.choices[0].delta:
-                            content = chunk.data.choices[0].delta.content
-                            if content:  # Only send non-empty chunks
-                                has_content = True
-                                # Escape new lines du to SSE format: "data: [content]\n\n" ou "error: [error message]\n\n"
-                                escaped_content = content.replace('\n', '\\n')
-                                # Stream the chunk
-                                yield f"data: {escaped_content}\n\n"
-
-                    if not has_content:
-                        error_message = "POST llm_inference_stream : empty response from Mistral"
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ERROR] {error_message}")
-                        # print("[ERROR]" + error_message)
-                        yield f"error: {error_message}\n\n"
-                # --- Call OpenAI API (or compatible) ---
-                else:
-                    response = client.chat.completions.create(
-                        model=llm_model,
-                        messages=full_messages,
-                        stream=True,
-                        **llm_params  # Inject common params
-                    )
-                    has_content = False  # Flag to check if any content was received
-
-                    for chunk in response:
-                        if chunk.choices and chunk.choices[0].delta:
-                            content = chunk.choices[0].delta.content
-                            if content:  # Only send non-empty chunks
-                                has_content = True
-                                # Escape new lines du to SSE format: "data: [content]\n\n" ou "error: [error message]\n\n"
-                                escaped_content = content.replace('\n', '\\n')
-                                # Stream the chunk
-                                yield f"data: {escaped_content}\n\n"
-
-                    # If no content was generated by the model
-                    if not has_content:
-                        error_message = "POST llm_inference_stream : empty response from LLM"
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ERROR] {error_message}")
-                        # print("[ERROR]" + error_message)
-                        yield f"error: {error_message}\n\n"
-
-            except Exception as e:
-                error_message = "POST llm_inference_stream : " + str(e)
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [ERROR] {error_message}")
-                # print("[ERROR]" + error_message)
-                yield f"error: {error_message}\n\n"
+            # Replay the cached response
+            cached_frames = response_cache.get(key) if response_cache is not None else None
+            if cached_frames is not None:
+                yield from replay_frames(cached_frames, response_cache_pacing)
+            elif single_flight is None:
+                yield from generate_frames()
+            else:
+                # The requests attached to a stream in flight are observed on the frames they receive
+                observe_coalesced = None
+                if observation is not None:
+                    observe_coalesced = lambda frames: observe_frames(frames, observation)
+                yield from single_flight.stream(key, generate_frames, observe_coalesced)
 
         # print("----------------------------------")
         # print("End POST llm_inference_stream")
         # print("----------------------------------")
         # Use EventStream to prevent buffering
-        return Response(stream_with_context(generate()), content_type="text/event-stream")
+        frames = generate()
+        if use_session:
+            frames = session_store.record(game_id, session_context, session_messages, frames)
+        if admission is not None:
+            frames = admission.track_game(game_slot, frames)
+        if trace is not None:
+            frames = trace.record(frames)
+        return Response(stream_with_context(frames), content_type="text/event-stream", headers=headers)
 
     except Exception as e:
+        if game_slot is not None:
+            game_slot.release()
+        if metrics is not None:
+            metrics.record_handler_error(e)
+        if trace is not None:
+            trace.finish(500, e)
         print(f"Error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+# End of the session of a student (e.g. end of the game)
+@MyApp.route("/session", methods=["DELETE"])
+def delete_session():
+    game_id = request.args.get('game_id', type=str)
+    if session_store is None or not game_id:
+        return jsonify({"error": "Session store disabled or missing game_id"}), 400
+    session_store.delete(game_id)
+    return jsonify({"deleted": game_id})
+
+
+# Prometheus metrics (text exposition format)
+@MyApp.route("/metrics", methods=["GET"])
+def get_metrics():
+    if metrics is None:
+        return jsonify({"error": "Metrics disabled"}), 404
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Counters of the coalescing and caching layers, prefix cache hit rates, code compression ratio,
+# cancelled upstream streams, queue depth and wait times of the admission control, latency and circuit of the backends,
+# saturation of the client pools
+@MyApp.route("/stats", methods=["GET"])
+def get_stats():
+    stats = {}
+    if single_flight is not None:
+        stats["single_flight"] = {"started": single_flight.started, "coalesced": single_flight.coalesced}
+    if response_cache is not None:
+        stats["response_cache"] = response_cache.stats()
+    if prompt_cache_stats is not None:
+        stats["prompt_cache"] = prompt_cache_stats.report()
+    if code_delta_stats is not None:
+        stats["code_delta"] = code_delta_stats.report()
+    if session_store is not None:
+        stats["sessions"] = session_store.count()
+    if admission is not None:
+        stats["admission"] = admission.report()
+    if hedging is not None:
+        stats["backends"] = hedging.report()
+    if client_pools:
+        stats["client_pools"] = {pool.name: pool.report() for pool in client_pools}
+    stats["cancelled_streams"] = cancelled_stream_stats.report()
+    return jsonify(stats)
+
+
+# Application factory of the pre-fork profile (gunicorn -c gunicorn_conf.py "main:create_app()"): the prompt registry
+# and the provider SDK are loaded by the import of this module in the gunicorn master, before the fork of the workers
+def create_app():
+    return MyApp
@@ -0,0 +1,307 @@
+# ###########
+# ASGI SERVER
+# ###########
+
+# Async version of the Flask server (main.py) exposing the same /llm-inference-stream endpoint.
+# The LLM responses are streamed with the async Mistral/OpenAI clients, so a single worker (one event loop)
+# serves hundreds of concurrent help requests instead of holding one thread per stream.
+# The SSE framing ("data: ...\n\n" / "error: ...\n\n") and the error responses are identical to main.py.
+# Run (from the prompt/ folder): uvicorn main_asgi:application --host 0.0.0.0 --port 5000
+
+import asyncio
+import contextlib
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from settings import llm_api, llm_api_key, llm_url, llm_model, llm_params, fast_start, mistral_server_url
+from settings import llm_alt_api, llm_alt_api_key, llm_alt_url, llm_alt_model, hedge_delay, circuit_breaker_failures, \
+    circuit_breaker_cooldown
+from settings import single_flight_enabled, prompt_cache_enabled, prompt_cache_marker, history_token_budget, \
+    code_delta_enabled
+from settings import session_store_backend, session_store_url, session_ttl, sse_flush_policy, metrics_enabled
+from settings import trace_sample_rate, trace_log
+from settings import admission_enabled, admission_max_concurrent, admission_max_per_game, admission_class_weights, \
+    admission_keepalive, admission_max_wait
+from settings import response_cache_enabled, response_cache_max_entries, response_cache_max_bytes, \
+    response_cache_ttl, response_cache_pacing
+from settings import client_pool_enabled, client_pool_max_connections, client_pool_keepalive_expiry, \
+    client_pool_http2, client_pool_warmup, client_pool_warmup_interval, client_pool_warmup_schedule
+from help_request import validate_help_request, build_full_messages, request_key
+from llm_stream import create_async_client, DeferredClient, agenerate_sse, aobserve_frames
+from single_flight import AsyncSingleFlight
+from prompt_cache import PromptCacheStats, prompt_cache_preparer
+from history_compaction import compact_history
+from code_delta import CodeDeltaStats, encode_code_history
+from session_store import create_session_store
+from stream_cancel import CancelledStreamStats
+from admission import AsyncAdmissionController, parse_class_weights
+from hedging import Backend, HedgedBackends
+from metrics import ServerMetrics
+from tracing import Tracer, combine_observations
+from response_cache import ResponseCache, areplay_frames
+from client_pool import ClientPool, AsyncPoolWarmer
+
+# ---- Pooled clients ----
+# Connections sized to the upstream streams of the worker (admission limit, else the default of httpx)
+client_pool_size = client_pool_max_connections or (admission_max_concurrent if admission_enabled else 100)
+client_pools = []
+
+
+def create_backend_client(name, api, api_key, url):
+    # The Mistral SDK ignores LLM_URL/LLM_ALT_URL (OpenAI-compatible URLs), see MISTRAL_SERVER_URL in settings.py
+    if api == "mistral":
+        url = mistral_server_url
+    if client_pool_enabled:
+        pool = ClientPool(name, api, api_key, url, client_pool_size, client_pool_keepalive_expiry, client_pool_http2,
+                          asynchronous=True, deferred=fast_start)
+        client_pools.append(pool)
+        return pool.client
+    if fast_start:
+        return DeferredClient(create_async_client, api, api_key, url)
+    return create_async_client(api, api_key, url)
+
+
+# ---- Init async client depending on API ----
+client = create_backend_client("primary", llm_api, llm_api_key, llm_url)
+
+# ---- Hedged requests and failover to an alternate backend ----
+hedging = None
+if llm_alt_api:
+    alt_client = create_backend_client("alternate", llm_alt_api, llm_alt_api_key, llm_alt_url)
+    hedging = HedgedBackends(
+        [Backend("primary", client, llm_api, llm_model),
+         Backend("alternate", alt_client, llm_alt_api, llm_alt_model)],
+        hedge_delay, circuit_breaker_failures, circuit_breaker_cooldown)
+
+# ---- Coalescing of identical in-flight requests ----
+single_flight = AsyncSingleFlight() if single_flight_enabled else None
+
+# ---- Cache of the completed responses ----
+response_cache = None
+if response_cache_enabled:
+    response_cache = ResponseCache(response_cache_max_entries, response_cache_max_bytes, response_cache_ttl)
+
+# ---- Provider-side prompt caching ----
+prompt_cache_stats = PromptCacheStats() if prompt_cache_enabled else None
+
+# ---- Delta encoding of the code snapshots ----
+code_delta_stats = CodeDeltaStats() if code_delta_enabled else None
+
+# ---- Prometheus metrics ----
+metrics = ServerMetrics() if metrics_enabled else None
+
+# ---- Sampled stage tracing ----
+tracer = Tracer(trace_log, trace_sample_rate) if trace_sample_rate > 0 else None
+
+# ---- Upstream streams cancelled on client disconnection ----
+cancelled_stream_stats = CancelledStreamStats(llm_params["max_tokens"])
+
+# ---- Sessions of the students ----
+session_store = None
+if session_store_backend != "none":
+    session_store = create_session_store(session_store_backend, session_store_url, session_ttl)
+
+# ---- Admission control of the upstream streams ----
+admission = None
+if admission_enabled:
+    admission = AsyncAdmissionController(admission_max_concurrent, admission_max_per_game,
+                                         parse_class_weights(admission_class_weights),
+                                         admission_keepalive, admission_max_wait)
+
+
+# Same behavior as Flask request.args.get(key, type=int): None if missing or not an integer
+def get_int_arg(request, key):
+    try:
+        return int(request.query_params[key])
+    except (KeyError, ValueError):
+        return None
+
+
+async def get_llm_inference_stream(request):
+    try:
+        game_slot = None
+        started = time.perf_counter()
+        trace = tracer.start_trace() if tracer is not None else None
+        # Extract request parameters
+        level_id = get_int_arg(request, 'level_id')
+        language = request.query_params.get('language')
+        modality = get_int_arg(request, 'modality')
+        game_id = request.query_params.get('game_id')
+        class_id = request.query_params.get('class_id')
+        content = await request.json()
+        user_messages = content.get('messages', [])
+        if trace is not None:
+            trace.end_stage("parse_request")
+
+        # Input validation
+        error_message = validate_help_request(level_id, language, modality, user_messages)
+        if trace is not None:
+            trace.end_stage("validate")
+            trace.attributes.update({"level_id": level_id, "language": language, "modality": modality})
+        if metrics is not None:
+            metrics.record_validation(level_id, language, modality, error_message, time.perf_counter() - started)
+        if error_message:
+            if trace is not None:
+                trace.finish(400)
+            return JSONResponse({"error": error_message}, status_code=400)
+
+        # Per-student limit of the help requests in flight
+        if admission is not None:
+            game_slot = admission.reserve_game(game_id)
+            if game_slot is None:
+                if trace is not None:
+                    trace.finish(429)
+                return JSONResponse({"error": "Too many help requests in flight"}, status_code=429)
+
+        started = time.perf_counter()
+        # Session: the client only sends the messages since its last help request
+        session_context = (level_id, modality, language)
+        use_session = session_store is not None and bool(game_id)
+        if use_session:
+            user_messages = await session_store.aget_messages(game_id, session_context) + user_messages
+        session_messages = user_messages
+
+        # Compaction of the activity history
+        if history_token_budget:
+            user_messages = compact_history(user_messages, history_token_budget)
+
+        # Code snapshots encoded relative to the previous activity, compression ratio sent in a response header
+        headers = {}
+        if code_delta_stats is not None:
+            user_messages, code_delta_report = encode_code_history(user_messages)
+            code_delta_stats.record(code_delta_report)
+            headers["X-Code-Delta-Ratio"] = str(code_delta_report["ratio"])
+
+        # Build prompt
+        full_messages = build_full_messages(level_id, language, modality, user_messages)
+        on_usage = None
+        prepare = None
+        if prompt_cache_stats is not None:
+            # Cache hints of the provider applied when the backend is called (primary or alternate)
+            prepare = prompt_cache_preparer(prompt_cache_marker, modality, level_id, language)
+            on_usage = lambda usage: prompt_cache_stats.record(level_id, modality, usage)
+        stream_observation = None
+        if metrics is not None:
+            metrics.record_prompt_build(level_id, language, modality, time.perf_counter() - started)
+            stream_observation = metrics.observe_stream(level_id, language, modality)
+        if trace is not None:
+            trace.end_stage("build_prompt")
+        observation = combine_observations(stream_observation, trace)
+
+        key = request_key(level_id, language, modality, user_messages)
+
+        def agenerate_frames():
+            frames = agenerate_sse(client, llm_api, llm_model, full_messages, llm_params, on_usage,
+                                   cancelled_stream_stats.record, sse_flush_policy, hedging,
+                                   observation, prepare)
+            if response_cache is not None:
+                frames = response_cache.arecord(key, frames)
+            # Wait for a slot before calling the LLM (keep-alive comments are not recorded in the response cache)
+            if admission is not None:
+                frames = admission.aadmit(class_id, frames)
+            return frames
+
+        # Replay the cached response
+        cached_frames = response_cache.get(key) if response_cache is not None else None
+        if cached_frames is not None:
+            frames = areplay_frames(cached_frames, response_cache_pacing)
+        elif single_flight is None:
+            frames = agenerate_frames()
+        else:
+            # The requests attached to a stream in flight are observed on the frames they receive
+            observe_coalesced = None
+            if observation is not None:
+                observe_coalesced = lambda frames: aobserve_frames(frames, observation)
+            frames = single_flight.stream(key, agenerate_frames, observe_coalesced)
+        if use_session:
+            frames = session_store.arecord(game_id, session_context, session_messages, frames)
+        if admission is not None:
+            frames = admission.atrack_game(game_slot, frames)
+        if trace is not None:
+            frames = trace.arecord(frames)
+
+        # Use EventStream to prevent buffering
+        return StreamingResponse(frames, headers=dict(headers, **{"content-type": "text/event-stream"}))
+
+    except Exception as e:
+        if game_slot is not None:
+            game_slot.release()
+        if metrics is not None:
+            metrics.record_handler_error(e)
+        if trace is not None:
+            trace.finish(500, e)
+        print(f"Error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# End of the session of a student (e.g. end of the game)
+async def delete_session(request):
+    game_id = request.query_params.get('game_id')
+    if session_store is None or not game_id:
+        return JSONResponse({"error": "Session store disabled or missing game_id"}, status_code=400)
+    await session_store.adelete(game_id)
+    return JSONResponse({"deleted": game_id})
+
+
+# Prometheus metrics (text exposition format)
+async def get_metrics(request):
+    if metrics is None:
+        return JSONResponse({"error": "Metrics disabled"}, status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")  # charset added by Starlette
+
+
+# Counters of the coalescing and caching layers, prefix cache hit rates, code compression ratio,
+# cancelled upstream streams, queue depth and wait times of the admission control, latency and circuit of the backends,
+# saturation of the client pools
+async def get_stats(request):
+    stats = {}
+    if single_flight is not None:
+        stats["single_flight"] = {"started": single_flight.started, "coalesced": single_flight.coalesced}
+    if response_cache is not None:
+        stats["response_cache"] = response_cache.stats()
+    if prompt_cache_stats is not None:
+        stats["prompt_cache"] = prompt_cache_stats.report()
+    if code_delta_stats is not None:
+        stats["code_delta"] = code_delta_stats.report()
+    if session_store is not None:
+        stats["sessions"] = await session_store.acount()
+    if admission is not None:
+        stats["admission"] = admission.report()
+    if hedging is not None:
+        stats["backends"] = hedging.report()
+    if client_pools:
+        stats["client_pools"] = {pool.name: pool.report() for pool in client_pools}
+    stats["cancelled_streams"] = cancelled_stream_stats.report()
+    return JSONResponse(stats)
+
+
+# Connection warm-up of the client pools, in the event loop of each worker
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    warmup_task = None
+    if client_pools and client_pool_warmup > 0:
+        pool_warmer = AsyncPoolWarmer(client_pools, client_pool_warmup, client_pool_warmup_interval,
+                                      client_pool_warmup_schedule)
+        warmup_task = asyncio.create_task(pool_warmer.run())
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+
+
+application = Starlette(
+    routes=[
+        Route("/llm-inference-stream", get_llm_inference_stream, methods=["POST"]),
+        Route("/session", delete_session, methods=["DELETE"]),
+        Route("/stats", get_stats, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+    ],
+    lifespan=lifespan,
+)
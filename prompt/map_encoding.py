@@ -0,0 +1,206 @@
+# ############
+# MAP ENCODING
+# ############
+
+# Alternative representations of the level map grids (LEVELS_MAP_GRID in the system prompt modules).
+# The verbatim grid lists every block, most of them being empty sky blocks. The compact encodings give the same
+# grid in fewer tokens (selected per deployment with GRID_ENCODING in settings.py):
+# - "verbatim": the original grid
+# - "rle": run-length encoding of each row ("13*." = 13 consecutive "." blocks)
+# - "sparse": the background block and the [y,x] coordinates of the other blocks, per symbol
+# - "entities": the background block and the other blocks grouped in horizontal runs, per symbol
+# Each encoding starts with a line explaining its notation to the model and can be decoded back to the grid.
+# Usage (from the prompt/ folder), checks the round trip of every grid and prints the token counts:
+#   python map_encoding.py
+
+import re
+from collections import Counter
+
+# Grid block of a LEVELS_MAP_GRID section: "[", one "[a,b,...]," line per row, "]"
+GRID_PATTERN = re.compile(r"^\[\n((?:[ \t]*\[.*\],?\n)+)\]", re.M)
+RUN_PATTERN = re.compile(r"^(\d+)\*(.)$")
+COORDINATES_PATTERN = re.compile(r"\[(\d+),(\d+)(?:-(\d+))?\]")
+HEADER_PATTERN = re.compile(r"^Grid \(.*?, (\d+) rows x (\d+) columns\)")
+
+
+# ---- Verbatim grid ----
+
+# Rows of the grid (lists of one-character symbols) from the text of a grid block
+def parse_grid(grid_text):
+    match = GRID_PATTERN.search(grid_text)
+    if match is None:
+        raise ValueError("No map grid found")
+    rows = []
+    for line in match.group(1).strip("\n").split("\n"):
+        rows.append(line.strip().rstrip(",")[1:-1].split(","))
+    return rows
+
+
+def format_grid(rows):
+    lines = ",\n".join("    [" + ",".join(row) + "]" for row in rows)
+    return "[\n" + lines + "\n]"
+
+
+def grid_header(encoding, rows, notation):
+    return f"Grid ({encoding}, {len(rows)} rows x {len(rows[0])} columns): {notation}\n"
+
+
+def parse_header(text):
+    match = HEADER_PATTERN.match(text)
+    if match is None:
+        raise ValueError("Invalid encoded grid header")
+    return int(match.group(1)), int(match.group(2))
+
+
+# Most frequent symbol of the grid (the sky in all the levels)
+def background_symbol(rows):
+    return Counter(symbol for row in rows for symbol in row).most_common(1)[0][0]
+
+
+# Horizontal runs of identical symbols of a row: [(symbol, first x, last x), ...]
+def row_runs(row):
+    runs = []
+    for x, symbol in enumerate(row):
+        if runs and runs[-1][0] == symbol:
+            runs[-1][2] = x
+        else:
+            runs.append([symbol, x, x])
+    return runs
+
+
+# ---- Run-length encoding ----
+
+def encode_rle(rows):
+    notation = 'row y lists its blocks from left to right (x = 0 first), "n*s" meaning n consecutive blocks s.'
+    lines = []
+    for y, row in enumerate(rows):
+        runs = [symbol if first == last else f"{last - first + 1}*{symbol}" for symbol, first, last in row_runs(row)]
+        lines.append(f"y={y}: " + " ".join(runs))
+    return grid_header("run-length encoded", rows, notation) + "\n".join(lines)
+
+
+def decode_rle(text):
+    height, width = parse_header(text)
+    rows = []
+    for line in text.split("\n")[1:]:
+        row = []
+        for run in line.split(": ", 1)[1].split(" "):
+            match = RUN_PATTERN.match(run)
+            if match:
+                row += [match.group(2)] * int(match.group(1))
+            else:
+                row.append(run)
+        rows.append(row)
+    if len(rows) != height or any(len(row) != width for row in rows):
+        raise ValueError("Invalid run-length encoded grid")
+    return rows
+
+
+# ---- Sparse coordinates ----
+
+# Non-background blocks per symbol, in the order of their first appearance (top to bottom, left to right)
+def symbols_runs(rows, background):
+    runs = {}
+    for y, row in enumerate(rows):
+        for symbol, first, last in row_runs(row):
+            if symbol != background:
+                runs.setdefault(symbol, []).append((y, first, last))
+    return runs
+
+
+def encode_sparse(rows):
+    background = background_symbol(rows)
+    notation = f'every block is "{background}" except the blocks listed below with their [y,x] coordinates ' \
+        '(row y from the top, column x from the left).'
+    lines = []
+    for symbol, runs in symbols_runs(rows, background).items():
+        coordinates = [f"[{y},{x}]" for y, first, last in runs for x in range(first, last + 1)]
+        lines.append(f"{symbol}: " + " ".join(coordinates))
+    return grid_header("sparse", rows, notation) + "\n".join(lines)
+
+
+# ---- Entity list ----
+
+def encode_entities(rows):
+    background = background_symbol(rows)
+    notation = f'every block is "{background}" except the entities listed below, [y,x] being a single block and ' \
+        '[y,x1-x2] a horizontal run of blocks (row y from the top, columns x1 to x2 from the left).'
+    lines = []
+    for symbol, runs in symbols_runs(rows, background).items():
+        coordinates = [f"[{y},{first}]" if first == last else f"[{y},{first}-{last}]" for y, first, last in runs]
+        lines.append(f"{symbol}: " + " ".join(coordinates))
+    return grid_header("entity list", rows, notation) + "\n".join(lines)
+
+
+# Decoder of the sparse and entity list encodings
+def decode_coordinates(text):
+    height, width = parse_header(text)
+    background = re.search(r'every block is "(.)"', text.split("\n")[0]).group(1)
+    rows = [[background] * width for _ in range(height)]
+    for line in text.split("\n")[1:]:
+        symbol, coordinates = line.split(": ", 1)
+        for y, first, last in COORDINATES_PATTERN.findall(coordinates):
+            for x in range(int(first), int(last or first) + 1):
+                rows[int(y)][x] = symbol
+    return rows
+
+
+# ---- Encodings ----
+
+# encoding -> (encoder, decoder)
+GRID_ENCODINGS = {
+    "verbatim" : (format_grid, parse_grid),
+    "rle" : (encode_rle, decode_rle),
+    "sparse" : (encode_sparse, decode_coordinates),
+    "entities" : (encode_entities, decode_coordinates),
+}
+
+
+# Round trip of the grid block of a LEVELS_MAP_GRID section through an encoding (True if the grid is unchanged)
+def verify_round_trip(map_grid, encoding):
+    encode, decode = GRID_ENCODINGS[encoding]
+    rows = parse_grid(map_grid)
+    return decode(encode(rows)) == rows
+
+
+# LEVELS_MAP_GRID section with its grid block replaced by the given encoding.
+# The legend and the descriptions around the grid are kept unchanged.
+def encode_map_grid(map_grid, encoding):
+    if encoding == "verbatim":
+        return map_grid
+    if encoding not in GRID_ENCODINGS:
+        raise ValueError(f"Unknown grid encoding: {encoding}")
+    encode, decode = GRID_ENCODINGS[encoding]
+    rows = parse_grid(map_grid)
+    encoded = encode(rows)
+    # The prompt must describe the same map as the verbatim grid
+    if decode(encoded) != rows:
+        raise ValueError(f"The {encoding} encoding does not round-trip")
+    match = GRID_PATTERN.search(map_grid)
+    return map_grid[:match.start()] + encoded + map_grid[match.end():]
+
+
+def main():
+    import system_prompt_modality_B
+    import system_prompt_modality_C
+    from token_count import count_tokens, tokenizer_name
+
+    modules = {"B": system_prompt_modality_B, "C": system_prompt_modality_C}
+    failures = 0
+    print(f"Tokens of the level map grid sections per encoding (tokenizer: {tokenizer_name()})")
+    print(f"  {'variant':8}" + "".join(f"{encoding:>10}" for encoding in GRID_ENCODINGS))
+    for modality_name, module in modules.items():
+        for level, map_grid in module.LEVELS_MAP_GRID.items():
+            columns = ""
+            for encoding in GRID_ENCODINGS:
+                if not verify_round_trip(map_grid, encoding):
+                    failures += 1
+                    print(f"  round trip failed: modality {modality_name}, level {level}, {encoding}")
+                columns += f"{count_tokens(encode_map_grid(map_grid, encoding)):>10}"
+            print(f"  {modality_name}-{level:<6}{columns}")
+    print("Round trip: " + ("OK" if failures == 0 else f"{failures} failure(s)"))
+    return failures
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if main() else 0)
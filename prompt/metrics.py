@@ -0,0 +1,209 @@
+# #######
+# METRICS
+# #######
+
+# Prometheus metrics of the help requests, exposed by the /metrics endpoint (text exposition format, see METRICS in
+# settings.py). Used to size the upstream quota:
+# - histograms: request validation time (parsing and validation of the request), prompt build time (session,
+#   compaction, code delta and system prompt), upstream connect time (until the response headers of the provider),
+#   time to first token and total stream duration (from the upstream call, after the admission queue), output
+#   tokens per second (after the first token)
+# - counters: requests, empty responses ("empty response from LLM"), exceptions of the streams and of the handler
+# The labels are level_id, language, modality and backend ("primary", or "alternate" with hedging, see hedging.py,
+# "coalesced" for the requests attached to a stream in flight, see single_flight.py).
+# Invalid requests are labelled "invalid" to bound the number of series.
+
+import math
+import threading
+import time
+
+from token_count import count_tokens
+
+REQUEST_LABELS = ("level_id", "language", "modality")
+STREAM_LABELS = REQUEST_LABELS + ("backend",)
+INVALID_LABELS = ("invalid", "invalid", "invalid")
+
+# Buckets (upper bounds)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)  # seconds
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)  # seconds
+DURATION_BUCKETS = (0.5, 1, 2, 4, 8, 16, 32, 64, 128)  # seconds
+RATE_BUCKETS = (5, 10, 20, 40, 80, 160, 320)  # tokens per second
+
+
+# Nearest-rank percentile (q in [0, 1]) of the values, None without values. Also used by the reports of hedging.py,
+# tracing.py and load_test.py
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(round(q * len(ordered), 9)) - 1)]  # rounded: 0.07 * 100 = 7.000000000000001
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ---- Metric types ----
+
+class Counter:
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.lock = threading.Lock()
+        self.values = {}  # label values -> count
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}  # label values -> [counts per bucket (not cumulative) + overflow, sum]
+
+    def observe(self, labels, value):
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = 'le="' + (bound if bound == "+Inf" else format_value(float(bound))) + '"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {format_value(total)}")
+                lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+# ---- Metrics of the servers ----
+
+class ServerMetrics:
+    def __init__(self):
+        self.requests = Counter("pyrates_requests_total", "Help requests received.", REQUEST_LABELS)
+        self.validation = Histogram("pyrates_request_validation_seconds", "Parsing and validation of the request.",
+                                    REQUEST_LABELS, FAST_BUCKETS)
+        self.prompt_build = Histogram("pyrates_prompt_build_seconds", "Build of the messages sent to the LLM.",
+                                      REQUEST_LABELS, FAST_BUCKETS)
+        self.upstream_connect = Histogram("pyrates_upstream_connect_seconds",
+                                          "Upstream call until the response headers of the provider.",
+                                          STREAM_LABELS, UPSTREAM_BUCKETS)
+        self.time_to_first_token = Histogram("pyrates_time_to_first_token_seconds",
+                                             "Upstream call until the first content chunk.",
+                                             STREAM_LABELS, UPSTREAM_BUCKETS)
+        self.stream_duration = Histogram("pyrates_stream_duration_seconds",
+                                         "Upstream call until the end of the response.",
+                                         STREAM_LABELS, DURATION_BUCKETS)
+        self.output_tokens_per_second = Histogram("pyrates_output_tokens_per_second",
+                                                  "Output tokens per second after the first token.",
+                                                  STREAM_LABELS, RATE_BUCKETS)
+        self.empty_responses = Counter("pyrates_empty_responses_total", "Empty responses of the LLM.", STREAM_LABELS)
+        self.stream_errors = Counter("pyrates_stream_errors_total", "Exceptions raised during the LLM streams.",
+                                     STREAM_LABELS + ("exception",))
+        self.handler_errors = Counter("pyrates_handler_errors_total",
+                                      "Exceptions of the help request handler (HTTP 500).", ("exception",))
+        self.metrics = [self.requests, self.validation, self.prompt_build, self.upstream_connect,
+                        self.time_to_first_token, self.stream_duration, self.output_tokens_per_second,
+                        self.empty_responses, self.stream_errors, self.handler_errors]
+
+    # error_message: result of validate_help_request()
+    def record_validation(self, level_id, language, modality, error_message, seconds):
+        labels = INVALID_LABELS if error_message else (str(level_id), language, str(modality))
+        self.requests.inc(labels)
+        self.validation.observe(labels, seconds)
+
+    def record_prompt_build(self, level_id, language, modality, seconds):
+        self.prompt_build.observe((str(level_id), language, str(modality)), seconds)
+
+    def record_handler_error(self, error):
+        self.handler_errors.inc((type(error).__name__,))
+
+    def observe_stream(self, level_id, language, modality):
+        return StreamObservation(self, (str(level_id), language, str(modality)))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+# Timings of one LLM stream, reported by generate_sse() / agenerate_sse() (llm_stream.py)
+# and by the hedged backends (hedging.py)
+class StreamObservation:
+    def __init__(self, metrics, labels):
+        self.metrics = metrics
+        self.labels = labels
+        self.backend = "primary"
+        self.start = None
+        self.first_token_time = None
+
+    def stream_labels(self):
+        return self.labels + (self.backend,)
+
+    def started(self):
+        self.start = time.perf_counter()
+
+    # Response headers received from a backend (each backend called by the hedged requests)
+    def connected(self, backend, seconds):
+        self.metrics.upstream_connect.observe(self.labels + (backend,), seconds)
+
+    # Backend streaming the response
+    def served_by(self, backend):
+        self.backend = backend
+
+    def first_token(self):
+        self.first_token_time = time.perf_counter()
+        self.metrics.time_to_first_token.observe(self.stream_labels(), self.first_token_time - self.start)
+
+    def finished(self, generated):
+        end = time.perf_counter()
+        self.metrics.stream_duration.observe(self.stream_labels(), end - self.start)
+        if end > self.first_token_time:
+            self.metrics.output_tokens_per_second.observe(
+                self.stream_labels(), count_tokens(generated) / (end - self.first_token_time))
+
+    def empty(self):
+        self.metrics.empty_responses.inc(self.stream_labels())
+
+    def error(self, error):
+        self.metrics.stream_errors.inc(self.stream_labels() + (type(error).__name__,))
+
+    def cancelled(self):
+        pass  # counted by CancelledStreamStats (stream_cancel.py)
@@ -0,0 +1,141 @@
+# ##############
+# PREFORK REPORT
+# ##############
+
+# Per-worker memory of the pre-fork serving profile (gunicorn_conf.py, requires gunicorn) against the default
+# gunicorn behavior, for several worker counts. Each mode starts the Flask server under gunicorn against the fake LLM
+# server (fake_llm.py), sends help requests for all the prompt variants (so that every worker has served requests and
+# run its garbage collections), then reads the memory of the master and of each worker:
+# - default: no preload, each worker imports the application after the fork
+# - preload: the master imports the application, the workers are forked from it
+# - preload + gc.freeze: same, with the objects of the master frozen before the fork (default of gunicorn_conf.py)
+# Private memory is the memory a worker does not share with any other process; PSS counts each shared page divided
+# by the number of processes sharing it, so the total PSS is the memory of the whole server.
+# Usage (from the prompt/ folder, with the same environment as the servers):
+#   python prefork_report.py [--workers 8,16] [--rounds 4]
+
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from load_test import build_messages
+from prompt_artifact import memory_usage
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODES = [
+    ("default", {"GUNICORN_PRELOAD": "0"}),
+    ("preload", {"GUNICORN_PRELOAD": "1", "GUNICORN_GC_FREEZE": "0"}),
+    ("preload + gc.freeze", {"GUNICORN_PRELOAD": "1", "GUNICORN_GC_FREEZE": "1"}),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with code {process.returncode}")
+        try:
+            if httpx.get(url + "/stats", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout} s")
+
+
+def child_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def send_help_request(url, level_id, language, modality, messages):
+    params = {"level_id": level_id, "language": language, "modality": modality}
+    with httpx.stream("POST", url + "/llm-inference-stream", params=params, json={"messages": messages},
+                      timeout=60) as response:
+        return response.status_code == 200 and any(line.startswith("data:") for line in response.iter_lines())
+
+
+# Help requests for all the variants, rounds times, concurrently
+def send_requests(url, variants, rounds, concurrency, seed):
+    rng = random.Random(seed)
+    requests = [(level, language, modality, build_messages(level, rng.uniform(30, 600), rng))
+                for _ in range(rounds) for modality, level, language in variants]
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(lambda request: send_help_request(url, *request), requests))
+    return sum(results), len(results)
+
+
+def measure_mode(workers, mode_environment, fake_url, variants, rounds, seed):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    environment = dict(os.environ, LLM_API="openai", LLM_URL=fake_url + "/v1", LLM_API_KEY="fake",
+                       LLM_MODEL="fake", GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(workers),
+                       **mode_environment)
+    environment.pop("LLM_ALT_API", None)
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn_conf.py", "main:create_app()"],
+                               cwd=SOURCE_DIR, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url, process)
+        ok, sent = send_requests(url, variants, rounds, 4 * workers, seed)
+        time.sleep(1)
+        pids = child_pids(process.pid)
+        master = memory_usage(process.pid)
+        usages = [memory_usage(pid) for pid in pids]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {"ok": ok, "sent": sent, "workers": len(pids), "master": master, "usages": usages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker memory of the pre-fork serving profile")
+    parser.add_argument("--workers", default="8,16", help="worker counts, comma-separated")
+    parser.add_argument("--rounds", type=int, default=4, help="help requests per prompt variant")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from settings import accepted_levels, accepted_languages, accepted_modalities
+
+    variants = [(modality, level, language) for modality in accepted_modalities for level in accepted_levels
+                for language in accepted_languages]
+    fake_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake = subprocess.Popen([sys.executable, "fake_llm.py", "--port", str(fake_port), "--ttft-ms", "20",
+                             "--ttft-jitter-ms", "0", "--token-delay-ms", "1", "--length", "fixed:40"],
+                            cwd=SOURCE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(fake_url, fake)
+        for workers in (int(value) for value in args.workers.split(",")):
+            print(f"{workers} workers, {len(variants) * args.rounds} help requests (means per worker)")
+            print(f"  {'mode':22}{'private MB':>12}{'PSS MB':>9}{'RSS MB':>9}{'total PSS MB':>14}  requests ok")
+            for mode, mode_environment in MODES:
+                result = measure_mode(workers, mode_environment, fake_url, variants, args.rounds, args.seed)
+                usages = result["usages"]
+
+                def mean(key):
+                    return sum(usage[key] for usage in usages) / len(usages) / 1024
+
+                total_pss = (result["master"]["pss_kb"] + sum(usage["pss_kb"] for usage in usages)) / 1024
+                print(f"  {mode:22}{mean('private_kb'):>12.1f}{mean('pss_kb'):>9.1f}{mean('rss_kb'):>9.1f}"
+                      f"{total_pss:>14.1f}  {result['ok']}/{result['sent']}")
+    finally:
+        fake.terminate()
+        fake.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# ###############
+# PROMPT ARTIFACT
+# ###############
+
+# Prebuilt system prompts memory-mapped by the servers (opt-in, see PROMPT_ARTIFACT in settings.py).
+# Importing system_prompt_modality_B.py and system_prompt_modality_C.py (about 470 KB of source) creates hundreds of
+# string constants in every worker process, and the prompt registry then keeps one more copy of the 32 concatenated
+# prompts. The build step renders all the variants into one binary file:
+#   MAGIC | header length (uint32) | header (JSON) | offset table | payload
+# - header: fingerprint of the prompt sources and build options, role of the messages, number of variants
+# - offset table: one ENTRY per variant (modality, level, language, offset and length of the content in the payload)
+# - payload: UTF-8 contents of the system prompts
+# The servers map the file read-only: the pages are shared by all the workers (page cache, or inherited from the
+# gunicorn master with --preload) and the prompt modules are not imported. The content of a prompt is decoded the
+# first time a help request of the worker reads it, then kept: a worker only holds the strings of the variants it
+# serves (a class plays one level at a time), instead of decoding a new copy for every request.
+# When the artifact is missing or stale (prompt sources or options changed since the build), the servers build the
+# prompt registry from the Python modules (prompt_registry.py).
+# Usage (from the prompt/ folder, with the same environment as the servers):
+#   python prompt_artifact.py build [--output prompts.bin]
+#   python prompt_artifact.py report [--workers 4]: cold start time and per-worker memory, modules vs artifact
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+
+MAGIC = b"PYRPRMT1"
+HEADER_LENGTH = struct.Struct("<I")
+ENTRY = struct.Struct("<BB2sQQ")  # modality, level, language (ASCII), offset, length
+
+# Modules rendering the system prompts: any change makes the artifact stale
+PROMPT_SOURCES = ["system_prompt_modality_B.py", "system_prompt_modality_C.py", "prompt_registry.py",
+                  "prompt_pruning.py", "map_encoding.py", "prompt_minify.py"]
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Hash of the prompt sources and of the options of build_prompt_registry()
+def prompt_fingerprint(levels, languages, modalities, layout, pruning, grid_encoding, minify, code_delta):
+    digest = hashlib.sha256()
+    for name in PROMPT_SOURCES:
+        with open(os.path.join(SOURCE_DIR, name), "rb") as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+    options = [levels, languages, modalities, layout, pruning, grid_encoding, minify, code_delta]
+    digest.update(json.dumps(options).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# ---- Build ----
+
+def build_prompt_artifact(path, levels, languages, modalities, layout="default", pruning=False,
+                          grid_encoding="verbatim", minify=False, code_delta=False):
+    from prompt_registry import build_prompt_registry
+
+    registry = build_prompt_registry(levels, languages, modalities, layout, pruning, grid_encoding, minify,
+                                     code_delta)
+    roles = {message["role"] for message in registry.values()}
+    if len(roles) != 1:
+        raise ValueError(f"System prompts with several roles: {roles}")
+    table = []
+    payload = []
+    offset = 0
+    for (modality, level, language), message in registry.items():
+        content = message["content"].encode("utf-8")
+        table.append(ENTRY.pack(modality, level, language.encode("ascii"), offset, len(content)))
+        payload.append(content)
+        offset += len(content)
+    header = json.dumps({
+        "fingerprint": prompt_fingerprint(levels, languages, modalities, layout, pruning, grid_encoding, minify,
+                                          code_delta),
+        "role": roles.pop(),
+        "entries": len(table),
+    }).encode("utf-8")
+    # Written next to the artifact and renamed: the workers mapping the previous file keep a valid mapping
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        file.writelines(table)
+        file.writelines(payload)
+    os.replace(temporary_path, path)
+    return offset
+
+
+# ---- Load ----
+
+# System message of the artifact, same keys as the messages of the prompt registry ("role", "content")
+class ArtifactMessage(Mapping):
+    def __init__(self, view, role, start, end):
+        self.view = view
+        self.role = role
+        self.start = start
+        self.end = end
+        self.content = None  # decoded on first read
+
+    def __getitem__(self, key):
+        if key == "role":
+            return self.role
+        if key == "content":
+            # Concurrent first reads may both decode, the same string is kept either way
+            if self.content is None:
+                self.content = str(self.view[self.start:self.end], "utf-8")
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("role", "content"))
+
+    def __len__(self):
+        return 2
+
+
+# Read-only mapping (modality, level, language) -> system message, same as build_prompt_registry().
+# None if the artifact is missing or stale.
+def load_prompt_artifact(path, levels, languages, modalities, layout="default", pruning=False,
+                         grid_encoding="verbatim", minify=False, code_delta=False):
+    try:
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        print(f"[WARNING] Prompt artifact {path} not found, prompts built from the Python modules")
+        return None
+    except ValueError:  # empty file
+        print(f"[WARNING] Invalid prompt artifact {path}, prompts built from the Python modules")
+        return None
+    header_start = len(MAGIC) + HEADER_LENGTH.size
+    try:
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError("magic")
+        (header_length,) = HEADER_LENGTH.unpack_from(buffer, len(MAGIC))
+        header = json.loads(buffer[header_start:header_start + header_length])
+    except (struct.error, ValueError):
+        buffer.close()
+        print(f"[WARNING] Invalid prompt artifact {path}, prompts built from the Python modules")
+        return None
+    fingerprint = prompt_fingerprint(levels, languages, modalities, layout, pruning, grid_encoding, minify,
+                                     code_delta)
+    if header["fingerprint"] != fingerprint:
+        buffer.close()
+        print(f"[WARNING] Stale prompt artifact {path} (prompt sources or options changed), "
+              f"prompts built from the Python modules")
+        return None
+    view = memoryview(buffer)
+    table_start = header_start + header_length
+    payload_start = table_start + header["entries"] * ENTRY.size
+    registry = {}
+    for index in range(header["entries"]):
+        modality, level, language, offset, length = ENTRY.unpack_from(buffer, table_start + index * ENTRY.size)
+        start = payload_start + offset
+        registry[(modality, level, language.decode("ascii"))] = ArtifactMessage(view, header["role"], start,
+                                                                                start + length)
+    return MappingProxyType(registry)
+
+
+# ---- Report ----
+
+# Resident memory of a process in KB (Linux): private and shared pages, proportional set size (shared pages divided
+# by the number of processes sharing them)
+def memory_usage(pid="self"):
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for line in file:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    usage[name] = int(value.split()[0])
+    except FileNotFoundError:
+        import resource
+
+        return {"rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "pss_kb": None, "private_kb": None,
+                "shared_kb": None}
+    return {
+        "rss_kb": usage["Rss"],
+        "pss_kb": usage["Pss"],
+        "private_kb": usage["Private_Clean"] + usage["Private_Dirty"],
+        "shared_kb": usage["Shared_Clean"] + usage["Shared_Dirty"],
+    }
+
+
+# Worker of the report: load the prompts as the servers do, read every variant, print the measures and wait
+# until the parent has measured all the workers (so that the shared pages are counted as shared)
+def measure_worker():
+    start = time.perf_counter()
+    import help_request
+
+    load_ms = (time.perf_counter() - start) * 1e3
+    for modality, level, language in list(help_request.prompt_registry):
+        help_request.build_full_messages(level, language, modality, [])
+    result = {"load_ms": load_ms, "prompt_modules_imported": "system_prompt_modality_C" in sys.modules}
+    result.update(memory_usage())
+    print(json.dumps(result), flush=True)
+    sys.stdin.read()
+
+
+def run_workers(workers, artifact_path):
+    environment = dict(os.environ, PROMPT_ARTIFACT=artifact_path)
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "measure-worker"], cwd=SOURCE_DIR,
+                                  env=environment, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+    results = []
+    for process in processes:
+        results.append(json.loads(next(line for line in process.stdout if line.startswith("{"))))
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+    return results
+
+
+def report(workers, artifact_path):
+    from settings import prompt_artifact_path
+
+    path = artifact_path or prompt_artifact_path or "prompts.bin"
+    print(f"Prompt loading, {workers} workers started together (means per worker)")
+    print(f"  {'mode':22}{'load ms':>9}{'RSS MB':>9}{'private MB':>12}{'shared MB':>11}  prompt modules")
+    for mode, mode_path in (("Python modules", ""), (f"artifact {os.path.basename(path)}", path)):
+        results = run_workers(workers, mode_path)
+
+        def mean(key):
+            values = [result[key] for result in results if result[key] is not None]
+            return sum(values) / len(values) if values else float("nan")
+
+        imported = "imported" if any(result["prompt_modules_imported"] for result in results) else "not imported"
+        print(f"  {mode:22}{mean('load_ms'):>9.1f}{mean('rss_kb') / 1024:>9.1f}{mean('private_kb') / 1024:>12.1f}"
+              f"{mean('shared_kb') / 1024:>11.1f}  {imported}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuilt system prompt artifact")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="render all the system prompt variants into the artifact")
+    build_parser.add_argument("--output", help="path of the artifact (PROMPT_ARTIFACT by default)")
+    report_parser = subparsers.add_parser("report", help="cold start time and per-worker memory")
+    report_parser.add_argument("--workers", type=int, default=4)
+    report_parser.add_argument("--artifact", help="path of the artifact (PROMPT_ARTIFACT by default)")
+    subparsers.add_parser("measure-worker", help="worker process of the report")
+    args = parser.parse_args()
+
+    if args.command == "measure-worker":
+        measure_worker()
+    elif args.command == "report":
+        report(args.workers, args.artifact)
+    elif args.command == "build":
+        from settings import accepted_levels, accepted_languages, accepted_modalities, prompt_layout, \
+            prompt_pruning, grid_encoding, prompt_minify, code_delta_enabled, prompt_artifact_path
+
+        path = args.output or prompt_artifact_path or "prompts.bin"
+        size = build_prompt_artifact(path, accepted_levels, accepted_languages, accepted_modalities, prompt_layout,
+                                     prompt_pruning, grid_encoding, prompt_minify, code_delta_enabled)
+        print(f"Prompt artifact {path}: {len(accepted_modalities) * len(accepted_levels) * len(accepted_languages)} "
+              f"variants, {size / 1024:.0f} KB of UTF-8 content")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# ############
+# PROMPT CACHE
+# ############
+
+# Opt-in support of the provider-side prompt (prefix) caching.
+# The system prompt is identical for all the students at the same level/language/modality and is sent first,
+# so it forms a static prefix that the provider can cache to avoid paying the full prefill on every request:
+# - OpenAI compatible API: the usage is requested at the end of the stream (stream_options) and a prompt_cache_key
+#   per prompt variant routes the requests sharing the same prefix to the same cache. With the "cache_control" marker,
+#   the system message is also explicitly marked as cacheable (gateways/providers using Anthropic-style breakpoints).
+# - Mistral API: no cache hint is available, the cached token counts are read from the usage when they are provided.
+# The hints depend on the provider: they are applied when a backend is called (prompt_cache_preparer).
+# The cached token counts read back from the usage payload give the prefix cache hit rate per level and modality.
+
+import threading
+
+from prompt_registry import MODALITY_NAMES
+
+
+# Extra parameters of the LLM call enabling the prompt caching
+def prompt_cache_params(llm_api, modality, level, language):
+    if llm_api == "mistral":
+        return {}
+    return {
+        "stream_options": {"include_usage": True},
+        "prompt_cache_key": f"pyrates-{MODALITY_NAMES[modality]}-{level}-{language}",
+    }
+
+
+# Mark the system message (static prefix) as cacheable
+def mark_cacheable_prefix(llm_api, full_messages, marker):
+    if llm_api == "mistral" or marker != "cache_control":
+        return full_messages
+    system_message = full_messages[0]
+    system_message = {
+        "role": system_message["role"],
+        "content": [{
+            "type": "text",
+            "text": system_message["content"],
+            "cache_control": {"type": "ephemeral"},
+        }],
+    }
+    return [system_message] + full_messages[1:]
+
+
+# Return the messages and the parameters of the LLM call with the prompt caching enabled
+def apply_prompt_cache(llm_api, marker, modality, level, language, full_messages, llm_params):
+    full_messages = mark_cacheable_prefix(llm_api, full_messages, marker)
+    llm_params = dict(llm_params, **prompt_cache_params(llm_api, modality, level, language))
+    return full_messages, llm_params
+
+
+# Preparation of the LLM call of a help request: prepare(llm_api, full_messages, llm_params) -> (messages, params)
+# with the cache hints of that provider. The messages and parameters of the request stay provider-neutral, the hints
+# are applied by each backend when it is called (see generate_sse in llm_stream.py and hedging.py).
+def prompt_cache_preparer(marker, modality, level, language):
+    def prepare(llm_api, full_messages, llm_params):
+        return apply_prompt_cache(llm_api, marker, modality, level, language, full_messages, llm_params)
+
+    return prepare
+
+
+def get_usage_value(data, key):
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        return data.get(key)
+    value = getattr(data, key, None)
+    if value is None and getattr(data, "model_extra", None):
+        value = data.model_extra.get(key)  # field not declared by the SDK model
+    return value
+
+
+# Return (prompt tokens, cached prompt tokens) of a usage payload
+def get_prompt_tokens(usage):
+    prompt_tokens = get_usage_value(usage, "prompt_tokens") or 0
+    details = get_usage_value(usage, "prompt_tokens_details")
+    cached_tokens = get_usage_value(details, "cached_tokens") or 0
+    return prompt_tokens, cached_tokens
+
+
+class PromptCacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}  # (level, modality) -> [requests, requests with cached tokens, prompt tokens, cached tokens]
+
+    def record(self, level, modality, usage):
+        prompt_tokens, cached_tokens = get_prompt_tokens(usage)
+        with self.lock:
+            stats = self.stats.setdefault((level, modality), [0, 0, 0, 0])
+            stats[0] += 1
+            stats[1] += 1 if cached_tokens else 0
+            stats[2] += prompt_tokens
+            stats[3] += cached_tokens
+
+    # Prefix cache hit rate per level and modality:
+    # - request_hit_rate: share of the requests reusing a cached prefix
+    # - token_hit_rate: share of the prompt tokens read from the cache
+    def report(self):
+        with self.lock:
+            report = {}
+            for (level, modality), (requests, cached_requests, prompt_tokens, cached_tokens) in sorted(self.stats.items()):
+                report[f"level_{level}_modality_{MODALITY_NAMES[modality]}"] = {
+                    "requests": requests,
+                    "prompt_tokens": prompt_tokens,
+                    "cached_tokens": cached_tokens,
+                    "request_hit_rate": round(cached_requests / requests, 3),
+                    "token_hit_rate": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+                }
+            return report
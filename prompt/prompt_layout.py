@@ -0,0 +1,96 @@
+# #######################
+# PROMPT LAYOUT OPTIMIZER
+# #######################
+
+# Computes the longest common prefix of the system prompt variants of each modality and reports the
+# shared and unique token counts for each context layout (see CONTEXT_LAYOUTS in the system prompt modules).
+# The prompts start with IDENTITY and INSTRUCTION, which depend on the language, so the prefix that can be
+# reused by the KV/prefix caches is the one shared by the 8 levels of the same language and modality.
+# The optimizer emits the layout maximizing this prefix: the sections are sorted by number of distinct
+# values across the levels (level-independent sections first), keeping the default order for the ties.
+# Usage (from the prompt/ folder):
+#   python prompt_layout.py [--json]
+
+import argparse
+import json
+import os
+
+from prompt_registry import MODALITY_NAMES, PROMPT_MODULES, PROMPT_BUILDERS, context_layout
+from token_count import count_tokens, tokenizer_name
+
+LEVELS = [1, 2, 3, 4, 5, 6, 7, 8]
+LANGUAGES = ["EN", "FR"]
+
+
+# Shared and unique token counts of a group of prompts
+def prefix_report(prompts):
+    prefix = os.path.commonprefix(prompts)
+    shared_tokens = count_tokens(prefix)
+    total_tokens = sum(count_tokens(prompt) for prompt in prompts)
+    return {
+        "variants": len(prompts),
+        "shared_prefix_chars": len(prefix),
+        "shared_prefix_tokens": shared_tokens,
+        "unique_tokens": total_tokens - shared_tokens * len(prompts),
+        "total_tokens": total_tokens,
+        # share of the prompt tokens that can be served from a prefix cache once the prefix is cached
+        "prefix_reuse": round(shared_tokens * len(prompts) / total_tokens, 3),
+    }
+
+
+# Context layout maximizing the prefix shared by the levels of the same language
+def optimal_layout(module):
+    return context_layout(module, "shared_prefix", LANGUAGES)
+
+
+def layout_report():
+    report = {"tokenizer": tokenizer_name(), "modalities": {}}
+    for modality, module in PROMPT_MODULES.items():
+        get_system_prompt = PROMPT_BUILDERS[modality]
+        layouts = {}
+        for layout in module.CONTEXT_LAYOUTS:
+            groups = {}
+            for language in LANGUAGES:
+                prompts = [get_system_prompt(level, language, layout)["content"] for level in LEVELS]
+                groups[language] = prefix_report(prompts)
+            prompts = [get_system_prompt(level, language, layout)["content"]
+                       for level in LEVELS for language in LANGUAGES]
+            groups["all"] = prefix_report(prompts)
+            layouts[layout] = groups
+        computed_layout = optimal_layout(module)
+        report["modalities"][MODALITY_NAMES[modality]] = {
+            "layouts": layouts,
+            "optimal_layout": computed_layout,
+            "optimal_layout_is_shared_prefix": computed_layout == module.CONTEXT_LAYOUTS["shared_prefix"],
+        }
+    return report
+
+
+def print_report(report):
+    print(f"Tokenizer: {report['tokenizer']}")
+    for modality_name, modality_report in report["modalities"].items():
+        print(f"\nModality {modality_name}")
+        print(f"  {'layout':14} {'group':6} {'shared prefix':>14} {'unique':>10} {'total':>10} {'reuse':>7}")
+        for layout, groups in modality_report["layouts"].items():
+            for group, stats in groups.items():
+                print(f"  {layout:14} {group:6} {stats['shared_prefix_tokens']:>14} {stats['unique_tokens']:>10}"
+                      f" {stats['total_tokens']:>10} {stats['prefix_reuse']:>7.1%}")
+        print(f"  optimal layout: {', '.join(modality_report['optimal_layout'])}")
+        if not modality_report["optimal_layout_is_shared_prefix"]:
+            print("  WARNING: CONTEXT_LAYOUTS['shared_prefix'] differs from the optimal layout")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared prefix of the system prompt variants per context layout")
+    parser.add_argument("--json", action="store_true", help="print the machine-readable report")
+    args = parser.parse_args()
+
+    report = layout_report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
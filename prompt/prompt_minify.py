@@ -0,0 +1,92 @@
+# #############
+# PROMPT MINIFY
+# #############
+
+# Minification of the XML instructions of modality C (INSTRUCTION in system_prompt_modality_C.py), opt-in with
+# PROMPT_MINIFY in settings.py and applied once when the prompt registry is built.
+# The instructions are indented XML where every "<" and ">" of the text is written as an entity. The minifier:
+# - collapses the indentation and removes the blank lines and the line breaks between two tags
+# - normalizes the entities: "&gt;" (and its misspelling "&Gt;") become ">", "&lt;" is kept so that the text
+#   cannot be read as a tag
+# - collapses the runs of spaces inside the lines
+# The instructions are not always well-formed XML (the FR version has mismatched tags), so the equivalence checker
+# compares the sequence of tags and the whitespace-normalized text between them instead of a parsed tree.
+# Usage (from the prompt/ folder), checks the equivalence and prints the token savings per language:
+#   python prompt_minify.py
+
+import re
+
+TAG_PATTERN = re.compile(r"(<[^<>]*>)")
+SPACES_PATTERN = re.compile(r" {2,}")
+
+# Entities normalized by the minifier
+ENTITIES_NORMALIZATION = {
+    "&gt;" : ">",
+    "&Gt;" : ">",  # misspelling of "&gt;" in the FR instructions
+}
+
+# Entities decoded by the equivalence checker
+ENTITIES = dict(ENTITIES_NORMALIZATION, **{"&lt;" : "<", "&amp;" : "&"})
+
+
+def minify_xml(text):
+    for entity, character in ENTITIES_NORMALIZATION.items():
+        text = text.replace(entity, character)
+    lines = [SPACES_PATTERN.sub(" ", line.strip()) for line in text.split("\n")]
+    minified = ""
+    for line in lines:
+        if not line:
+            continue
+        if minified and not (minified.endswith(">") and line.startswith("<")):
+            minified += "\n"
+        minified += line
+    # The prompt sections are concatenated, keep the line breaks around the instructions
+    return "\n" + minified + "\n"
+
+
+# ---- Equivalence checker ----
+
+def decode_entities(text):
+    for entity, character in ENTITIES.items():
+        text = text.replace(entity, character)
+    return text
+
+
+# Sequence of the tags (with normalized whitespace) and of the non-empty texts of an XML document
+def xml_structure(text):
+    structure = []
+    for part in TAG_PATTERN.split(text):
+        if TAG_PATTERN.fullmatch(part):
+            structure.append(("tag", " ".join(part.split())))
+        else:
+            content = " ".join(decode_entities(part).split())
+            if content:
+                structure.append(("text", content))
+    return structure
+
+
+# True if the minified document has the same tags and text content as the original one
+def check_equivalence(original, minified):
+    return xml_structure(original) == xml_structure(minified)
+
+
+def main():
+    import system_prompt_modality_C
+    from token_count import count_tokens, tokenizer_name
+
+    failures = 0
+    print(f"Token savings of the minified modality C instructions (tokenizer: {tokenizer_name()})")
+    print(f"  {'language':10}{'chars':>9}{'minified':>10}{'tokens':>9}{'minified':>10}{'saved':>8}  equivalent")
+    for language, instruction in system_prompt_modality_C.INSTRUCTION.items():
+        minified = minify_xml(instruction)
+        equivalent = check_equivalence(instruction, minified)
+        failures += 0 if equivalent else 1
+        tokens = count_tokens(instruction)
+        minified_tokens = count_tokens(minified)
+        print(f"  {language:10}{len(instruction):>9}{len(minified):>10}{tokens:>9}{minified_tokens:>10}"
+              f"{1 - minified_tokens / tokens:>8.1%}  {equivalent}")
+    return failures
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if main() else 0)
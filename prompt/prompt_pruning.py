@@ -0,0 +1,78 @@
+# ##############
+# PROMPT PRUNING
+# ##############
+
+# Per-level relevance pruning of the system prompt context (opt-in, see PROMPT_PRUNING in settings.py).
+# Every level gets by default the whole programming memo and the rules of every control function in
+# PROGRAM_EXECUTION_DEF. With pruning, a level only gets the memo sections related to its <learning_goals>
+# and the rules of its <control_functions>, as declared in the relevance tables below.
+
+# ---- Relevance tables ----
+
+# Programming memo sections relevant to each level (<learning_goals> and <help_content> of the level description)
+LEVELS_MEMO_SECTIONS = {
+    1 : ["BASIC_CONCEPTS", "FOR_LOOP"],
+    2 : ["BASIC_CONCEPTS", "FOR_LOOP"],
+    3 : ["BASIC_CONCEPTS", "VARIABLE", "FOR_LOOP"],
+    4 : ["BASIC_CONCEPTS", "VARIABLE", "CONDITIONAL", "FOR_LOOP"],
+    5 : ["BASIC_CONCEPTS", "VARIABLE", "CONDITIONAL", "FOR_LOOP"],
+    6 : ["BASIC_CONCEPTS", "VARIABLE", "FOR_LOOP"],
+    7 : ["BASIC_CONCEPTS", "VARIABLE", "FOR_LOOP"],
+    8 : ["BASIC_CONCEPTS", "VARIABLE", "FOR_LOOP", "WHILE_LOOP"],
+}
+
+# Control functions available in each level (<control_functions> of the level description)
+LEVELS_CONTROL_FUNCTIONS = {
+    1 : ["walk", "left", "right", "open"],
+    2 : ["walk", "left", "right", "jump", "attack", "open"],
+    3 : ["walk", "jump_height", "read_number", "open"],
+    4 : ["walk", "left", "right", "read_string", "open"],
+    5 : ["walk", "jump", "jump_high", "get_height", "open"],
+    6 : ["walk", "jump_height", "open"],
+    7 : ["turn", "shoot"],
+    8 : ["walk", "left", "right", "attack", "detect_obstacle", "open"],
+}
+
+# Rules of PROGRAM_EXECUTION_DEF specific to some control functions, identified by their beginning.
+# A rule is kept if one of its control functions is available in the level.
+# The rules not listed here are general and kept for all the levels.
+PROGRAM_EXECUTION_RULES = {
+    '- When the "left" control function' : ["left"],
+    '- When the "right" control function' : ["right"],
+    '- When the "walk" control function' : ["walk"],
+    '- If the character attempts to walk to a position outside the game map' : ["walk"],
+    '- When the "open" control fonction' : ["open"],
+    '- when the "jump" control function' : ["jump"],
+    '- When the "attack" control function' : ["attack"],
+    # jump_high is described as a jump_height with parameter 2
+    '- When the "jump_height" control function' : ["jump_height", "jump_high"],
+    '- When the "jump_high" control function' : ["jump_high"],
+    '- When the "shoot" control function' : ["shoot"],
+    '- When the "turn" control function' : ["turn"],
+    '- The "read_number" control function' : ["read_number"],
+    '- The "read_string" control function' : ["read_string"],
+    '- The "get_height" control function' : ["get_height"],
+    '- The "detect_obstacle" control function' : ["detect_obstacle"],
+}
+
+
+# ---- Pruning ----
+
+# Control functions described by a rule (None for the general rules)
+def get_rule_control_functions(rule):
+    for beginning, control_functions in PROGRAM_EXECUTION_RULES.items():
+        if rule.startswith(beginning):
+            return control_functions
+    return None
+
+
+# PROGRAM_EXECUTION_DEF without the rules of the control functions not available in the level
+def prune_program_execution(program_execution_def, level):
+    level_control_functions = LEVELS_CONTROL_FUNCTIONS[level]
+    lines = []
+    for line in program_execution_def.split("\n"):
+        control_functions = get_rule_control_functions(line)
+        if control_functions is None or any(function in level_control_functions for function in control_functions):
+            lines.append(line)
+    return "\n".join(lines)
+
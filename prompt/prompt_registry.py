@@ -0,0 +1,98 @@
+# ###############
+# PROMPT REGISTRY
+# ###############
+
+# The system prompt only depends on the feedback modality, the level and the language of the student,
+# i.e. 2 x 8 x 2 = 32 variants. Instead of concatenating the prompt sections (160 to 300 KB of strings)
+# on every help request, all the variants are built once at startup and stored as read-only objects.
+# A help request then only performs a dictionary lookup and gets a reference to the prebuilt message.
+# The prompt modules are imported on first use: the servers loading the prebuilt prompts of the artifact
+# (see prompt_artifact.py) never import them.
+
+import importlib
+import sys
+from collections.abc import Mapping
+from types import MappingProxyType
+
+MODALITY_NAMES = {
+    1 : "B",
+    2 : "C",
+}
+
+
+# Read-only mapping modality -> attribute of a prompt module (the module itself if attribute is None),
+# importing the module on first access
+class LazyPromptMapping(Mapping):
+    def __init__(self, names, attribute=None):
+        self.names = names  # modality -> module name
+        self.attribute = attribute
+
+    def __getitem__(self, modality):
+        module = importlib.import_module(self.names[modality])
+        return module if self.attribute is None else getattr(module, self.attribute.format(MODALITY_NAMES[modality]))
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Prompt module and prompt builder associated with each modality (1 = modality B, 2 = modality C)
+PROMPT_MODULE_NAMES = {
+    1 : "system_prompt_modality_B",
+    2 : "system_prompt_modality_C",
+}
+
+PROMPT_MODULES = LazyPromptMapping(PROMPT_MODULE_NAMES)
+
+PROMPT_BUILDERS = LazyPromptMapping(PROMPT_MODULE_NAMES, "get_system_prompt_modality_{}")
+
+# Modalities with XML instructions that can be minified (see prompt_minify.py)
+MINIFIABLE_MODALITIES = [2]
+
+# Order of the context sections of a prompt module for the given options (list of section names).
+# "shared_prefix": the sections sorted by number of distinct values across the levels of the same language
+# (level-independent sections first, default order for the ties). CONTEXT_LAYOUTS["shared_prefix"] only holds for the
+# default options: with pruning, the programming memo and the control function rules depend on the level.
+def context_layout(module, layout, languages, pruning=False, grid_encoding="verbatim"):
+    if layout != "shared_prefix":
+        return module.CONTEXT_LAYOUTS[layout]
+    default_layout = module.CONTEXT_LAYOUTS["default"]
+    distinct_values = dict.fromkeys(default_layout, 0)
+    for language in languages:
+        level_sections = [module.get_context_sections(level, language, pruning, grid_encoding)
+                          for level in module.LEVELS_MAP_GRID]
+        for section in default_layout:
+            values = {sections[section] for sections in level_sections}
+            distinct_values[section] = max(distinct_values[section], len(values))
+    return sorted(default_layout, key=lambda section: distinct_values[section])
+
+# Build every system prompt variant and return them in a read-only mapping
+# keyed by (modality, level, language)
+# layout: order of the context sections (see CONTEXT_LAYOUTS in the system prompt modules)
+# pruning: per-level relevance pruning of the context (see prompt_pruning.py)
+# grid_encoding: representation of the level map grids (see map_encoding.py)
+# minify: minified XML instructions of modality C (see prompt_minify.py)
+# code_delta: notation of the code snapshots encoded by code_delta.py added to the instructions
+def build_prompt_registry(levels, languages, modalities, layout="default", pruning=False, grid_encoding="verbatim",
+                          minify=False, code_delta=False):
+    registry = {}
+    for modality in modalities:
+        build_prompt = PROMPT_BUILDERS[modality]
+        sections_layout = context_layout(PROMPT_MODULES[modality], layout, languages, pruning, grid_encoding)
+        options = {"minify": minify} if modality in MINIFIABLE_MODALITIES else {}
+        for level in levels:
+            for language in languages:
+                message = build_prompt(level, language, sections_layout, pruning, grid_encoding, code_delta=code_delta,
+                                       **options)
+                registry[(modality, level, language)] = MappingProxyType({
+                    "role": sys.intern(message["role"]),
+                    "content": sys.intern(message["content"]),
+                })
+    return MappingProxyType(registry)
+
+# Return the prebuilt system message for the given modality, level and language.
+# The returned mapping is shared by all requests and cannot be modified.
+def get_system_message(registry, modality, level, language):
+    return registry[(modality, level, language)]
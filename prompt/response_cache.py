@@ -0,0 +1,112 @@
+# ##############
+# RESPONSE CACHE
+# ##############
+
+# In-process cache of the completed LLM responses (level restarts and page reloads replay
+# the same activity history). The SSE frames of a completed stream are stored under the request key
+# (modality, level, language, messages hash) and replayed as SSE on the next identical request.
+# The cache is bounded by a number of entries, a total size in bytes (LRU eviction) and a TTL.
+# Responses ending with an error frame are never stored.
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # seconds
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expiration time, frames, size in bytes)
+        self.size = 0
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # entries removed to respect max_entries / max_bytes
+        self.expirations = 0  # entries removed because of the TTL
+
+    # Return the cached frames of the request (None if not cached)
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expiration, frames, size = entry
+            if expiration <= time.monotonic():
+                self.remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return frames
+
+    def put(self, key, frames):
+        frames = tuple(frames)
+        size = sum(len(frame.encode("utf-8")) for frame in frames)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, frames, size)
+            self.size += size
+            # Evict the least recently used entries
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    # Must be called with the lock held
+    def remove(self, key):
+        expiration, frames, size = self.entries.pop(key)
+        self.size -= size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    # Yield the frames and store them once the stream is completed without error
+    def record(self, key, frames):
+        recorded = []
+        for frame in frames:
+            recorded.append(frame)
+            yield frame
+        if recorded and not any(frame.startswith("error: ") for frame in recorded):
+            self.put(key, recorded)
+
+    # Async version of record()
+    async def arecord(self, key, frames):
+        recorded = []
+        async for frame in frames:
+            recorded.append(frame)
+            yield frame
+        if recorded and not any(frame.startswith("error: ") for frame in recorded):
+            self.put(key, recorded)
+
+
+# ---- Replay ----
+# pacing: delay in seconds between two replayed frames (0 = all the frames at once)
+
+def replay_frames(frames, pacing):
+    for index, frame in enumerate(frames):
+        if index and pacing:
+            time.sleep(pacing)
+        yield frame
+
+
+async def areplay_frames(frames, pacing):
+    for index, frame in enumerate(frames):
+        if index and pacing:
+            await asyncio.sleep(pacing)
+        yield frame
@@ -0,0 +1,250 @@
+# #############
+# SESSION STORE
+# #############
+
+# Optional server-side sessions of the help requests, keyed by the game_id of the student (see SESSION_STORE in
+# settings.py). The session keeps the messages of the previous help requests of the current level (activities
+# sent by the client and feedback generated by the assistant), so the client only sends the messages since its
+# last help request and the server rebuilds the whole message list.
+# A session is restarted when the student changes level (or modality/language) and expires after SESSION_TTL
+# seconds without help request. Backends:
+# - "memory": dictionary of the server process (one worker)
+# - "sqlite": SQLite database file shared by the workers of the same host (SESSION_STORE_URL = path of the file)
+# - "redis": Redis server shared by all the hosts (SESSION_STORE_URL = redis:// URL, requires the redis package).
+#   SESSION_STORE_URL = "local" uses LocalRedis, an in-process stand-in implementing the commands used by the store.
+# The activities sent by the client are saved whatever the outcome of the generation (error, empty response, client
+# disconnected): the client does not send them again. The feedback is only added when the response is complete.
+# The ASGI server calls the sqlite and redis backends in a thread (a* methods) so that they do not block the event loop.
+# Two help requests of the same game_id in flight at the same time (at most ADMISSION_MAX_PER_GAME with admission
+# control) both start from the same session and the last one to finish overwrites the other one (last writer wins):
+# the activities and the feedback of the first one are lost from the history.
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+
+# Feedback streamed by the SSE frames (None if the generation failed)
+def feedback_from_frames(frames):
+    frames = [frame for frame in frames if not frame.startswith(":")]  # SSE comments (admission keep-alive)
+    if not frames or any(frame.startswith("error: ") for frame in frames):
+        return None
+    # Inverse of sse_data() in llm_stream.py
+    return "".join(frame[len("data: "):-2].replace('\\n', '\n') for frame in frames)
+
+
+# Messages saved at the end of a help request: the user messages, then the feedback if the response is complete
+def saved_messages(messages, recorded, complete):
+    feedback = feedback_from_frames(recorded) if complete else None
+    if feedback is None:
+        return messages
+    return messages + [{"role": "assistant", "content": feedback}]
+
+
+class SessionStore:
+    blocking = False  # backend doing I/O, called in a thread by the async methods
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    # Messages of the previous help requests (empty list for a new session)
+    def get_messages(self, game_id, context):
+        session = self.get(game_id)
+        if session is None or session["context"] != list(context):
+            return []
+        return session["messages"]
+
+    def save_messages(self, game_id, context, messages):
+        self.put(game_id, {"context": list(context), "messages": messages})
+
+    # Stream the frames and save the session at the end of the help request, with the generated feedback if the
+    # response is complete
+    # context: (level, modality, language) of the session
+    def record(self, game_id, context, messages, frames):
+        recorded = []
+        complete = False
+        try:
+            for frame in frames:
+                recorded.append(frame)
+                yield frame
+            complete = True
+        finally:
+            self.save_messages(game_id, context, saved_messages(messages, recorded, complete))
+
+    # Async version of record()
+    async def arecord(self, game_id, context, messages, frames):
+        recorded = []
+        complete = False
+        try:
+            async for frame in frames:
+                recorded.append(frame)
+                yield frame
+            complete = True
+        finally:
+            await self.asave_messages(game_id, context, saved_messages(messages, recorded, complete))
+
+    # ---- Async versions (ASGI server) ----
+
+    async def run(self, method, *args):
+        if self.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def aget_messages(self, game_id, context):
+        return await self.run(self.get_messages, game_id, context)
+
+    async def asave_messages(self, game_id, context, messages):
+        await self.run(self.save_messages, game_id, context, messages)
+
+    async def adelete(self, game_id):
+        await self.run(self.delete, game_id)
+
+    async def acount(self):
+        return await self.run(self.count)
+
+
+# ---- In-memory backend ----
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl):
+        super().__init__(ttl)
+        self.lock = threading.Lock()
+        self.sessions = {}  # game_id -> (expiration time, session)
+        self.next_sweep = time.monotonic() + ttl
+
+    def get(self, game_id):
+        with self.lock:
+            entry = self.sessions.get(game_id)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def put(self, game_id, session):
+        now = time.monotonic()
+        with self.lock:
+            self.sessions[game_id] = (now + self.ttl, session)
+            # Eviction of the expired sessions (students who left)
+            if now >= self.next_sweep:
+                self.sessions = {key: entry for key, entry in self.sessions.items() if entry[0] > now}
+                self.next_sweep = now + self.ttl
+
+    def delete(self, game_id):
+        with self.lock:
+            self.sessions.pop(game_id, None)
+
+    def count(self):
+        now = time.monotonic()
+        with self.lock:
+            return sum(1 for expiration, _ in self.sessions.values() if expiration > now)
+
+
+# ---- SQLite backend ----
+
+class SQLiteSessionStore(SessionStore):
+    blocking = True
+
+    def __init__(self, ttl, path):
+        super().__init__(ttl)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (game_id TEXT PRIMARY KEY, session TEXT, expiration REAL)")
+
+    def get(self, game_id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT session FROM sessions WHERE game_id = ? AND expiration > ?", (game_id, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, game_id, session):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sessions (game_id, session, expiration) VALUES (?, ?, ?)",
+                (game_id, json.dumps(session, ensure_ascii=False), now + self.ttl))
+            self.connection.execute("DELETE FROM sessions WHERE expiration <= ?", (now,))
+
+    def delete(self, game_id):
+        with self.lock:
+            self.connection.execute("DELETE FROM sessions WHERE game_id = ?", (game_id,))
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM sessions WHERE expiration > ?", (time.time(),)).fetchone()[0]
+
+
+# ---- Redis backend ----
+
+class RedisSessionStore(SessionStore):
+    blocking = True
+    KEY_PREFIX = "pyrates:session:"
+
+    def __init__(self, ttl, redis_client):
+        super().__init__(ttl)
+        self.redis = redis_client
+
+    def get(self, game_id):
+        value = self.redis.get(self.KEY_PREFIX + game_id)
+        return json.loads(value) if value is not None else None
+
+    def put(self, game_id, session):
+        # The expiration is handled by Redis
+        self.redis.set(self.KEY_PREFIX + game_id, json.dumps(session, ensure_ascii=False), ex=max(1, int(self.ttl)))
+
+    def delete(self, game_id):
+        self.redis.delete(self.KEY_PREFIX + game_id)
+
+    def count(self):
+        return sum(1 for _ in self.redis.scan_iter(self.KEY_PREFIX + "*"))
+
+
+# In-process stand-in of a Redis server implementing the commands used by RedisSessionStore
+class LocalRedis:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}  # key -> (expiration time or None, value)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                del self.values[key]
+                return None
+            return entry[1].encode()
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.values[key] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(1 for key in keys if self.values.pop(key, None) is not None)
+
+    def scan_iter(self, match="*"):
+        prefix = match.rstrip("*")
+        now = time.monotonic()
+        with self.lock:
+            keys = [key for key, (expiration, _) in self.values.items()
+                    if key.startswith(prefix) and (expiration is None or expiration > now)]
+        return iter(keys)
+
+
+def create_session_store(backend, url, ttl):
+    if backend == "memory":
+        return MemorySessionStore(ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(ttl, url)
+    if backend == "redis":
+        if url == "local":
+            return RedisSessionStore(ttl, LocalRedis())
+        import redis  # optional dependency, only required by this backend
+
+        return RedisSessionStore(ttl, redis.Redis.from_url(url))
+    raise ValueError(f"Unknown session store: {backend}")
@@ -0,0 +1,126 @@
+# ########
+# SETTINGS
+# ########
+
+# Configuration shared by the Flask server (main.py) and the async server (main_asgi.py)
+
+from dotenv import load_dotenv
+import os
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ---- Environment variables ----
+llm_api = os.getenv('LLM_API')
+llm_api_key = os.getenv('LLM_API_KEY')
+llm_url = os.getenv('LLM_URL')
+llm_model = os.getenv('LLM_MODEL')
+# MISTRAL_SERVER_URL: server of the Mistral backends (LLM_API or LLM_ALT_API = "mistral"), "" = Mistral API.
+# LLM_URL and LLM_ALT_URL only apply to the OpenAI-compatible backends (e.g. http://localhost:8001 for fake_llm.py)
+mistral_server_url = os.getenv('MISTRAL_SERVER_URL', '')
+# LLM_ALT_API: alternate backend ("mistral" or "openai" for any OpenAI-compatible URL) for the hedged requests and
+# the failover (see hedging.py), "" = single backend
+llm_alt_api = os.getenv('LLM_ALT_API', '')
+llm_alt_api_key = os.getenv('LLM_ALT_API_KEY')
+llm_alt_url = os.getenv('LLM_ALT_URL')
+llm_alt_model = os.getenv('LLM_ALT_MODEL')
+# HEDGE_DELAY_MS: delay without first chunk before the same request is sent to the alternate backend
+hedge_delay = float(os.getenv('HEDGE_DELAY_MS', '2000')) / 1000
+# CIRCUIT_BREAKER_FAILURES: consecutive failures (or empty responses) before a backend is skipped for
+# CIRCUIT_BREAKER_COOLDOWN seconds
+circuit_breaker_failures = int(os.getenv('CIRCUIT_BREAKER_FAILURES', '3'))
+circuit_breaker_cooldown = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', '30'))
+
+# ---- Optimizations ----
+# FAST_START: the LLM clients are created in a background thread, the server serves before the provider SDK is
+# imported (1 = enabled, 0 = disabled, see DeferredClient in llm_stream.py and import_profile.py)
+fast_start = os.getenv('FAST_START', '0') == '1'
+# PROMPT_LAYOUT: order of the system prompt context sections, "default" or "shared_prefix"
+# (level-independent sections first to maximize the prefix reused by the provider caches, order computed for the
+# PROMPT_PRUNING and GRID_ENCODING options, see context_layout in prompt_registry.py)
+prompt_layout = os.getenv('PROMPT_LAYOUT', 'default')
+# PROMPT_PRUNING: only the memo sections and control function rules relevant to the level (1 = enabled, 0 = disabled)
+prompt_pruning = os.getenv('PROMPT_PRUNING', '0') == '1'
+# GRID_ENCODING: representation of the level map grids, "verbatim", "rle", "sparse" or "entities" (see map_encoding.py)
+grid_encoding = os.getenv('GRID_ENCODING', 'verbatim')
+# PROMPT_MINIFY: minified XML instructions of modality C (1 = enabled, 0 = disabled)
+prompt_minify = os.getenv('PROMPT_MINIFY', '0') == '1'
+# PROMPT_ARTIFACT: prebuilt system prompts memory-mapped instead of importing the prompt modules, built by
+# "python prompt_artifact.py build" ("" = disabled, prompts built from the modules when missing or stale)
+prompt_artifact_path = os.getenv('PROMPT_ARTIFACT', '')
+# SINGLE_FLIGHT: identical help requests in flight share one upstream LLM stream (1 = enabled, 0 = disabled)
+single_flight_enabled = os.getenv('SINGLE_FLIGHT', '0') == '1'
+# RESPONSE_CACHE: completed responses are cached and replayed to identical requests (1 = enabled, 0 = disabled)
+response_cache_enabled = os.getenv('RESPONSE_CACHE', '0') == '1'
+response_cache_max_entries = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+response_cache_max_bytes = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+response_cache_ttl = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))  # seconds
+response_cache_pacing = float(os.getenv('RESPONSE_CACHE_PACING_MS', '20')) / 1000  # delay between replayed frames
+# PROMPT_CACHE: provider-side caching of the system prompt prefix and hit rate tracking (1 = enabled, 0 = disabled)
+prompt_cache_enabled = os.getenv('PROMPT_CACHE', '0') == '1'
+# PROMPT_CACHE_MARKER: "none" (automatic prefix caching) or "cache_control" (explicit cache breakpoint)
+prompt_cache_marker = os.getenv('PROMPT_CACHE_MARKER', 'none')
+# HISTORY_TOKEN_BUDGET: the oldest activities of longer histories are collapsed into a digest (0 = disabled)
+history_token_budget = int(os.getenv('HISTORY_TOKEN_BUDGET', '0'))
+# CODE_DELTA: code snapshots of the activities sent as references/line diffs of the previous one (1 = enabled, 0 = disabled)
+code_delta_enabled = os.getenv('CODE_DELTA', '0') == '1'
+# SESSION_STORE: sessions keyed by game_id, the client only sends the messages since its last help request
+# ("none", "memory", "sqlite" or "redis", see session_store.py)
+session_store_backend = os.getenv('SESSION_STORE', 'none')
+session_store_url = os.getenv('SESSION_STORE_URL', 'sessions.sqlite3')  # SQLite file or Redis URL
+session_ttl = float(os.getenv('SESSION_TTL', '7200'))  # seconds without help request before the session expires
+# SSE_FLUSH_DELAY_MS: the deltas are coalesced into fewer SSE frames, flushed after this delay or once
+# SSE_FLUSH_MIN_BYTES are buffered, the first delta being always flushed immediately (0 = one frame per delta)
+sse_flush_delay = float(os.getenv('SSE_FLUSH_DELAY_MS', '0')) / 1000
+sse_flush_min_bytes = int(os.getenv('SSE_FLUSH_MIN_BYTES', '64'))
+sse_flush_policy = (sse_flush_delay, sse_flush_min_bytes) if sse_flush_delay > 0 else None
+# ADMISSION_CONTROL: global cap of the upstream streams with weighted fair queueing across the classes (class_id) and
+# limit of the help requests in flight per student (game_id) (1 = enabled, 0 = disabled, see admission.py)
+admission_enabled = os.getenv('ADMISSION_CONTROL', '0') == '1'
+admission_max_concurrent = int(os.getenv('ADMISSION_MAX_CONCURRENT', '32'))  # upstream streams
+admission_max_per_game = int(os.getenv('ADMISSION_MAX_PER_GAME', '2'))  # help requests in flight per student
+admission_class_weights = os.getenv('ADMISSION_CLASS_WEIGHTS', '')  # "class_id=weight,...", default weight 1
+admission_keepalive = float(os.getenv('ADMISSION_KEEPALIVE_MS', '5000')) / 1000  # SSE comments while queued
+admission_max_wait = float(os.getenv('ADMISSION_MAX_WAIT', '120'))  # seconds in the queue before an error frame
+# CLIENT_POOL: pooled keep-alive HTTP clients of the LLM backends with connection warm-up and saturation counters
+# (1 = enabled, 0 = disabled, see client_pool.py)
+client_pool_enabled = os.getenv('CLIENT_POOL', '0') == '1'
+# CLIENT_POOL_MAX_CONNECTIONS: connections per backend and worker, 0 = upstream streams of a worker
+# (ADMISSION_MAX_CONCURRENT with admission control, else GUNICORN_THREADS for the Flask server and 100 for the ASGI
+# server)
+client_pool_max_connections = int(os.getenv('CLIENT_POOL_MAX_CONNECTIONS', '0'))
+client_pool_keepalive_expiry = float(os.getenv('CLIENT_POOL_KEEPALIVE_EXPIRY', '60'))  # seconds of idle connection
+client_pool_http2 = os.getenv('CLIENT_POOL_HTTP2', '1') == '1'  # HTTP/2 when the h2 package is installed
+# CLIENT_POOL_WARMUP: connections opened per backend at startup, then every CLIENT_POOL_WARMUP_INTERVAL seconds while
+# classes are in session (CLIENT_POOL_WARMUP_SCHEDULE "sessions": weekly times of SESSION_DATE) or at all times
+# ("always"), 0 = no warm-up
+client_pool_warmup = int(os.getenv('CLIENT_POOL_WARMUP', '2'))
+client_pool_warmup_interval = float(os.getenv('CLIENT_POOL_WARMUP_INTERVAL', '30'))
+client_pool_warmup_schedule = os.getenv('CLIENT_POOL_WARMUP_SCHEDULE', 'sessions')
+
+# METRICS: Prometheus metrics of the help requests exposed by /metrics (1 = enabled, 0 = disabled, see metrics.py)
+metrics_enabled = os.getenv('METRICS', '1') == '1'
+# TRACE_SAMPLE_RATE: fraction of the help requests whose stages are traced to TRACE_LOG (OpenTelemetry JSON lines,
+# see tracing.py), 0 = disabled
+trace_sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+trace_log = os.getenv('TRACE_LOG', 'traces.jsonl')
+
+# ---- Common LLM parameters ----
+llm_params = {
+    # temperature : Controls the randomness of the responses [0.0,2.0] / def = 1.0
+    "temperature": 0.3,
+    # 0.3 -> Lower temperature reduces randomness. This ensures factual, consistent, and clear responses.
+    # max_tokens : Maximum length of the generated response [0,model max] / def = no def
+    "max_tokens": 500,  # 500 -> Allows for reasonably detailed explanations without being too verbose.
+    # top_p : Nucleus sampling to filter unlikely tokens [0.0,1.0] / def = 1.0
+    "top_p": 0.9,  # 0.9 -> Helps avoid unlikely creative words while keeping some diversity
+    # presence_penalty : Discourages repeating earlier tokens [-2.0,2.0] / def = 0.0
+    "presence_penalty": 0, # 0 -> Default value
+    # frequency_penalty: Reduces exact repetitions [-2.0,2.0] / def = 0.0
+    "frequency_penalty": 0, # 0-> Default value
+}
+
+# ---- Accepted input values ----
+accepted_levels = [1, 2, 3, 4, 5, 6, 7, 8]
+accepted_languages = ["EN", "FR"]
+accepted_modalities = [1, 2]
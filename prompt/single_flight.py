@@ -0,0 +1,195 @@
+# #############
+# SINGLE FLIGHT
+# #############
+
+# Coalescing of identical in-flight help requests (double clicks on the help button, client retries).
+# The first request of a given key starts one upstream LLM stream, the following identical requests
+# attach to it and receive the same SSE frames, including the frames already emitted.
+# The upstream stream is driven by a background thread (Flask server) or task (ASGI server), so that the
+# attached requests are not affected if the first student leaves. When all the attached requests have left,
+# the flight is cancelled and the upstream stream is closed. A flight is forgotten as soon as its
+# stream ends: completed responses are not kept here.
+
+import asyncio
+import threading
+
+
+# ---- Flask server (threads) ----
+
+class Flight:
+    def __init__(self):
+        self.frames = []
+        self.done = False
+        self.condition = threading.Condition()
+        self.subscribers = 0
+        self.cancelled = False
+
+    def append(self, frame):
+        with self.condition:
+            self.frames.append(frame)
+            self.condition.notify_all()
+
+    def finish(self):
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    # Yield all the frames of the stream, from the first one
+    def subscribe(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.frames) and not self.done:
+                    self.condition.wait()
+                frames = self.frames[index:]
+                done = self.done
+            index += len(frames)
+            yield from frames
+            if done:
+                return
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        # Counters
+        self.started = 0  # upstream streams started
+        self.coalesced = 0  # requests attached to an upstream stream already in flight
+
+    # Return the SSE frames of the request identified by key.
+    # generate_frames() is only called if no identical request is in flight.
+    # observe_coalesced(frames): wraps the frames of a request attached to a stream already in flight (its metrics and
+    # trace, the driving request being observed by generate_sse)
+    def stream(self, key, generate_frames, observe_coalesced=None):
+        with self.lock:
+            flight = self.flights.get(key)
+            coalesced = flight is not None
+            if flight is None:
+                flight = Flight()
+                self.flights[key] = flight
+                self.started += 1
+                threading.Thread(target=self.drive, args=(key, flight, generate_frames), daemon=True).start()
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+        frames = self.subscribe(key, flight)
+        if coalesced and observe_coalesced is not None:
+            frames = observe_coalesced(frames)
+        return frames
+
+    def subscribe(self, key, flight):
+        try:
+            yield from flight.subscribe()
+        finally:
+            with self.lock:
+                flight.subscribers -= 1
+                # All the requests left before the end of the stream
+                if flight.subscribers == 0 and not flight.done:
+                    flight.cancelled = True
+                    self.forget(key, flight)
+
+    def forget(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def drive(self, key, flight, generate_frames):
+        frames = generate_frames()
+        try:
+            for frame in frames:
+                flight.append(frame)
+                if flight.cancelled:
+                    frames.close()  # closes the upstream stream
+                    break
+        finally:
+            with self.lock:
+                self.forget(key, flight)
+            flight.finish()
+
+
+# ---- ASGI server (event loop) ----
+
+class AsyncFlight:
+    def __init__(self):
+        self.frames = []
+        self.done = False
+        self.condition = asyncio.Condition()
+        self.subscribers = 0
+        self.task = None
+
+    async def append(self, frame):
+        async with self.condition:
+            self.frames.append(frame)
+            self.condition.notify_all()
+
+    async def finish(self):
+        async with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    # Yield all the frames of the stream, from the first one
+    async def subscribe(self):
+        index = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: index < len(self.frames) or self.done)
+                frames = self.frames[index:]
+                done = self.done
+            index += len(frames)
+            for frame in frames:
+                yield frame
+            if done:
+                return
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self.flights = {}
+        self.tasks = set()  # keep a reference to the running tasks
+        # Counters
+        self.started = 0  # upstream streams started
+        self.coalesced = 0  # requests attached to an upstream stream already in flight
+
+    # Return the SSE frames of the request identified by key.
+    # agenerate_frames() is only called if no identical request is in flight.
+    # observe_coalesced(frames): wraps the frames of a request attached to a stream already in flight
+    def stream(self, key, agenerate_frames, observe_coalesced=None):
+        flight = self.flights.get(key)
+        coalesced = flight is not None
+        if flight is None:
+            flight = AsyncFlight()
+            self.flights[key] = flight
+            self.started += 1
+            flight.task = asyncio.create_task(self.drive(key, flight, agenerate_frames))
+            self.tasks.add(flight.task)
+            flight.task.add_done_callback(self.tasks.discard)
+        else:
+            self.coalesced += 1
+        flight.subscribers += 1
+        frames = self.subscribe(key, flight)
+        if coalesced and observe_coalesced is not None:
+            frames = observe_coalesced(frames)
+        return frames
+
+    async def subscribe(self, key, flight):
+        try:
+            async for frame in flight.subscribe():
+                yield frame
+        finally:
+            flight.subscribers -= 1
+            # All the requests left before the end of the stream: the cancellation of the task closes the upstream stream
+            if flight.subscribers == 0 and not flight.done:
+                self.forget(key, flight)
+                flight.task.cancel()
+
+    def forget(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    async def drive(self, key, flight, agenerate_frames):
+        try:
+            async for frame in agenerate_frames():
+                await flight.append(frame)
+        finally:
+            self.forget(key, flight)
+            await flight.finish()
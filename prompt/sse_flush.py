@@ -0,0 +1,101 @@
+# #########
+# SSE FLUSH
+# #########
+
+# Flush policy of the SSE frames (opt-in, see SSE_FLUSH_DELAY_MS in settings.py).
+# The providers stream many tiny deltas (often one token each), sent by default as one SSE frame and one socket
+# write each. The flush policy coalesces the deltas into fewer frames:
+# - the first delta is always flushed immediately (time to first token unchanged)
+# - the following deltas are buffered until min_bytes are buffered or max_delay seconds have passed since the
+#   oldest buffered delta
+# The async version flushes on time even if the provider stalls. The sync version (Flask) can only check the
+# delay when a delta arrives, so a stalled provider may hold the buffered deltas until its next delta.
+
+import asyncio
+import time
+
+
+def coalesce_contents(contents, max_delay, min_bytes):
+    buffer = []
+    size = 0
+    deadline = None
+    first = True
+    try:
+        for content in contents:
+            if first:
+                first = False
+                yield content
+                continue
+            if not buffer:
+                deadline = time.monotonic() + max_delay
+            buffer.append(content)
+            size += len(content)
+            if size >= min_bytes or time.monotonic() >= deadline:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        contents.close()  # closes the upstream stream if the coalescing is closed first
+
+
+# Async version of coalesce_contents()
+# After the first delta, a pump task reads the deltas into the buffer and wakes the generator up when a frame is due
+# (min_bytes buffered, deadline timer or end of the stream): one timer per frame instead of one wait per delta.
+async def acoalesce_contents(contents, max_delay, min_bytes):
+    loop = asyncio.get_running_loop()
+    state = {"buffer": [], "size": 0, "due": False, "ended": False, "error": None, "waiter": None, "timer": None}
+
+    def wake():
+        state["due"] = True
+        if state["waiter"] is not None and not state["waiter"].done():
+            state["waiter"].set_result(None)
+
+    async def pump():
+        try:
+            async for content in contents:
+                state["buffer"].append(content)
+                state["size"] += len(content)
+                if state["size"] >= min_bytes:
+                    wake()
+                elif state["timer"] is None:
+                    state["timer"] = loop.call_later(max_delay, wake)
+        except Exception as e:
+            state["error"] = e  # raised by the generator after the buffered deltas
+        finally:
+            state["ended"] = True
+            wake()
+
+    pump_task = None
+    try:
+        try:
+            yield await contents.__anext__()
+        except StopAsyncIteration:
+            return
+        pump_task = asyncio.ensure_future(pump())
+        while True:
+            if not state["due"] and not state["ended"]:
+                state["waiter"] = loop.create_future()
+                await state["waiter"]
+            state["due"] = False
+            if state["timer"] is not None:
+                state["timer"].cancel()
+                state["timer"] = None
+            if state["buffer"]:
+                content = "".join(state["buffer"])
+                state["buffer"] = []
+                state["size"] = 0
+                yield content
+            elif state["ended"]:
+                break
+        if state["error"] is not None:
+            raise state["error"]
+    finally:
+        # Closed or cancelled before the end: the cancellation of the pump closes the upstream stream
+        if state["timer"] is not None:
+            state["timer"].cancel()
+        if pump_task is not None and not pump_task.done():
+            pump_task.cancel()
+            await asyncio.wait({pump_task})
+        await contents.aclose()
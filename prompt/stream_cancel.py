@@ -0,0 +1,37 @@
+# #############
+# STREAM CANCEL
+# #############
+
+# Counters of the upstream LLM streams cancelled because the student left (tab closed, navigation, end of class)
+# before the end of the response (see on_cancel in llm_stream.py).
+# The tokens saved are estimated as the tokens that the model could still have generated: max_tokens minus the
+# tokens already generated when the stream was closed.
+
+import threading
+
+from token_count import count_tokens
+
+
+class CancelledStreamStats:
+    def __init__(self, max_tokens):
+        self.max_tokens = max_tokens
+        self.lock = threading.Lock()
+        self.cancelled = 0
+        self.generated_tokens = 0  # tokens generated before the cancellations
+        self.tokens_saved = 0
+
+    # Called with the text generated before the cancellation
+    def record(self, generated):
+        tokens = count_tokens(generated)
+        with self.lock:
+            self.cancelled += 1
+            self.generated_tokens += tokens
+            self.tokens_saved += max(0, self.max_tokens - tokens)
+
+    def report(self):
+        with self.lock:
+            return {
+                "cancelled": self.cancelled,
+                "generated_tokens": self.generated_tokens,
+                "tokens_saved": self.tokens_saved,
+            }
@@ -11,6 +11,9 @@
 # Some parts of the prompt are written in the user’s language (EN or FR) to maintain vocabulary consistency
 # between the instructional content and the assistant’s messages.
 
+from prompt_pruning import LEVELS_MEMO_SECTIONS, prune_program_execution
+from map_encoding import encode_map_grid
+
 # IDENTITY
 # ########
 # Describe the purpose, communication style, and high-level goals of the assistant.
@@ -169,6 +172,29 @@ INSTRUCTION = {
     "FR" : INSTRUCTION_FR
 }
 
+# Notation of the code snapshots encoded relative to the previous activity (see code_delta.py),
+# added to the instructions when the code delta encoding is enabled
+CODE_DELTA_NOTATION_EN = """
+## Notation of the code in the activities:
+- To shorten the activity history, the code of an activity (<activity><code>) can be given relative to the code of the previous activity:
+    - <code ref="previous"/> means that the code is identical to the code of the previous activity.
+    - <code diff="previous"> only gives the changed lines: "-n text" means that line n of the previous code is removed and "+n text" means that line n of the new code is added (lines are numbered from 1). All the other lines are unchanged.
+- Rebuild the complete code from these changes before analysing it, and never use this notation in your answers.
+"""
+
+CODE_DELTA_NOTATION_FR = """
+## Notation du code dans les activités:
+- Pour raccourcir l'historique des activités, le code d'une activité (<activity><code>) peut être donné par rapport au code de l'activité précédente :
+    - <code ref="previous"/> signifie que le code est identique au code de l'activité précédente.
+    - <code diff="previous"> donne seulement les lignes modifiées : "-n texte" signifie que la ligne n du code précédent est supprimée et "+n texte" signifie que la ligne n du nouveau code est ajoutée (les lignes sont numérotées à partir de 1). Toutes les autres lignes sont inchangées.
+- Reconstitue le code complet à partir de ces modifications avant de l'analyser, et n'utilise jamais cette notation dans tes réponses.
+"""
+
+CODE_DELTA_NOTATION = {
+    "EN" : CODE_DELTA_NOTATION_EN,
+    "FR" : CODE_DELTA_NOTATION_FR
+}
+
 # CONTEXT
 # #######
 # Give the model any additional information it might need to generate a response, 
@@ -2880,46 +2906,110 @@ PROGRAMMING_MEMO_WHILE_LOOP_FR = """
 </section>
 """
 
-PROGRAMMING_MEMO = {
+PROGRAMMING_MEMO_SECTIONS = {
+    "EN" : {
+        "BASIC_CONCEPTS" : PROGRAMMING_MEMO_BASIC_CONCEPTS_EN,
+        "VARIABLE" : PROGRAMMING_MEMO_VARIABLE_EN,
+        "CONDITIONAL" : PROGRAMMING_MEMO_CONDITIONAL_EN,
+        "FOR_LOOP" : PROGRAMMING_MEMO_FOR_LOOP_EN,
+        "WHILE_LOOP" : PROGRAMMING_MEMO_WHILE_LOOP_EN,
+    },
+    "FR" : {
+        "BASIC_CONCEPTS" : PROGRAMMING_MEMO_BASIC_CONCEPTS_FR,
+        "VARIABLE" : PROGRAMMING_MEMO_VARIABLE_FR,
+        "CONDITIONAL" : PROGRAMMING_MEMO_CONDITIONAL_FR,
+        "FOR_LOOP" : PROGRAMMING_MEMO_FOR_LOOP_FR,
+        "WHILE_LOOP" : PROGRAMMING_MEMO_WHILE_LOOP_FR,
+    },
+}
+
+PROGRAMMING_MEMO_HEADER = {
     "EN" : "## Programming memo\n"
-        + PROGRAMMING_MEMO_FOREWORDS_EN
-        + "<programming_memo>\n"
-        + PROGRAMMING_MEMO_BASIC_CONCEPTS_EN
-        + PROGRAMMING_MEMO_VARIABLE_EN
-        + PROGRAMMING_MEMO_CONDITIONAL_EN
-        + PROGRAMMING_MEMO_FOR_LOOP_EN 
-        + PROGRAMMING_MEMO_WHILE_LOOP_EN
-        + "</programming_memo>\n",
-    "FR" : "## Mémo programmation\n" 
-        + PROGRAMMING_MEMO_FOREWORDS_FR
-        + "<programming_memo>\n"
-        + PROGRAMMING_MEMO_BASIC_CONCEPTS_FR
-        + PROGRAMMING_MEMO_VARIABLE_FR
-        + PROGRAMMING_MEMO_CONDITIONAL_FR
-        + PROGRAMMING_MEMO_FOR_LOOP_FR 
-        + PROGRAMMING_MEMO_WHILE_LOOP_FR
-        + "</programming_memo>\n",
+        + PROGRAMMING_MEMO_FOREWORDS_EN,
+    "FR" : "## Mémo programmation\n"
+        + PROGRAMMING_MEMO_FOREWORDS_FR,
+}
+
+# Programming memo composed of the given sections
+def get_programming_memo(language,sections):
+    return PROGRAMMING_MEMO_HEADER[language] \
+        + "<programming_memo>\n" \
+        + "".join(PROGRAMMING_MEMO_SECTIONS[language][section] for section in sections) \
+        + "</programming_memo>\n"
+
+PROGRAMMING_MEMO = {
+    "EN" : get_programming_memo("EN", PROGRAMMING_MEMO_SECTIONS["EN"]),
+    "FR" : get_programming_memo("FR", PROGRAMMING_MEMO_SECTIONS["FR"]),
+}
+
+# Sections of the context for the given level and language
+# pruning: keep only the memo sections and the control function rules relevant to the level (see prompt_pruning.py)
+# grid_encoding: representation of the level map grid (see GRID_ENCODINGS in map_encoding.py)
+def get_context_sections(level,language,pruning=False,grid_encoding="verbatim"):
+    program_execution_def = PROGRAM_EXECUTION_DEF
+    programming_memo = PROGRAMMING_MEMO[language]
+    if pruning:
+        program_execution_def = prune_program_execution(PROGRAM_EXECUTION_DEF, level)
+        programming_memo = get_programming_memo(language, LEVELS_MEMO_SECTIONS[level])
+    return {
+        "LEVELS_MAP_DEF" : LEVELS_MAP_DEF[level],
+        "LEVELS_MAP_GRID" : encode_map_grid(LEVELS_MAP_GRID[level], grid_encoding),
+        "CURRENT_STATE_DEF" : CURRENT_STATE_DEF,
+        "PROGRAM_EXECUTION_DEF" : program_execution_def,
+        "LEVEL_DESCRIPTION" : get_levels_description(language)[level],
+        "STARTUP_GUIDE" : STARTUP_GUIDE[language],
+        "PROGRAMMING_MEMO" : programming_memo,
+    }
+
+# Order of the sections in the context
+CONTEXT_LAYOUTS = {
+    # Original order: level-specific map first
+    "default" : [
+        "LEVELS_MAP_DEF",
+        "LEVELS_MAP_GRID",
+        "CURRENT_STATE_DEF",
+        "PROGRAM_EXECUTION_DEF",
+        "LEVEL_DESCRIPTION",
+        "STARTUP_GUIDE",
+        "PROGRAMMING_MEMO",
+    ],
+    # Level-independent sections first, so that the prompts of all the levels share the longest
+    # common prefix (reused by the KV/prefix caches). Computed by prompt_layout.py for the default options,
+    # the prompt registry computes it for its pruning and grid encoding (see context_layout in prompt_registry.py).
+    "shared_prefix" : [
+        "CURRENT_STATE_DEF",
+        "PROGRAM_EXECUTION_DEF",
+        "STARTUP_GUIDE",
+        "PROGRAMMING_MEMO",
+        "LEVELS_MAP_DEF",
+        "LEVELS_MAP_GRID",
+        "LEVEL_DESCRIPTION",
+    ],
 }
 
-def get_context(level,language):
+# layout: name of a layout of CONTEXT_LAYOUTS or list of the sections in order
+def get_context(level,language,layout="default",pruning=False,grid_encoding="verbatim"):
+    sections = get_context_sections(level,language,pruning,grid_encoding)
+    order = CONTEXT_LAYOUTS[layout] if isinstance(layout, str) else layout
     context = "# Context:\n" \
-        + LEVELS_MAP_DEF[level] \
-        + LEVELS_MAP_GRID[level] \
-        + CURRENT_STATE_DEF \
-        + PROGRAM_EXECUTION_DEF \
-        + get_levels_description(language)[level] \
-        + STARTUP_GUIDE[language] \
-        + PROGRAMMING_MEMO[language]
+        + "".join(sections[section] for section in order)
     return context
 
 # MAIN FUNCTION
 # #############
 # Main function that provides the system prompt for the given level (1 to 8) and language ("EN" or "FR")
-def get_system_prompt_modality_B(level,language):
+# layout: order of the context sections (see get_context)
+# pruning: per-level relevance pruning of the context (see get_context_sections)
+# grid_encoding: representation of the level map grid (see get_context_sections)
+# code_delta: notation of the code snapshots encoded relative to the previous activity (see CODE_DELTA_NOTATION)
+def get_system_prompt_modality_B(level,language,layout="default",pruning=False,grid_encoding="verbatim",code_delta=False):
+    instruction = INSTRUCTION[language]
+    if code_delta:
+        instruction += CODE_DELTA_NOTATION[language]
     prompt = {
         "role": "system", 
         "content": IDENTITY[language]
-                    +INSTRUCTION[language]
-                    +get_context(level,language),
+                    +instruction
+                    +get_context(level,language,layout,pruning,grid_encoding),
     }
     return prompt
\ No newline at end of file
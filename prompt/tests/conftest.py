@@ -0,0 +1,7 @@
+# Tests of the help server modules (from the repository root: python -m pytest prompt/tests).
+# The modules of prompt/ import each other by bare name, as when the servers run from the prompt/ folder.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,172 @@
+# Fakes of the tests: provider clients with the call signatures and chunk shapes of the Mistral and OpenAI SDKs,
+# observation recorder and fake LLM server (fake_llm.py) for the real HTTP clients
+
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import httpx
+
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def openai_chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None)
+
+
+def mistral_chunk(content):
+    return SimpleNamespace(data=openai_chunk(content))
+
+
+# Streamed response: context manager and (async) iterator of chunks
+# stall: the async iteration waits forever after the chunks (provider still generating)
+class FakeResponse:
+    def __init__(self, chunks, stall=False):
+        self.chunks = chunks
+        self.stall = stall
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        if self.stall:
+            await asyncio.get_running_loop().create_future()
+
+
+class FakeMistralChat:
+    def __init__(self, client):
+        self.client = client
+
+    # Explicit keyword arguments like the Mistral SDK: the parameters of the other providers are rejected
+    def stream(self, model, messages, temperature=None, max_tokens=None, top_p=None, presence_penalty=None,
+               frequency_penalty=None):
+        return self.client.respond(messages)
+
+    async def stream_async(self, model, messages, temperature=None, max_tokens=None, top_p=None,
+                           presence_penalty=None, frequency_penalty=None):
+        return self.client.respond(messages)
+
+
+class FakeMistral:
+    def __init__(self, contents, error=None):
+        self.contents = contents
+        self.error = error
+        self.calls = []  # messages of each call
+        self.chat = FakeMistralChat(self)
+
+    def respond(self, messages):
+        self.calls.append(messages)
+        if self.error is not None:
+            raise self.error
+        return FakeResponse([mistral_chunk(content) for content in self.contents])
+
+
+class FakeOpenAICompletions:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, model, messages, stream=False, **params):
+        self.client.calls.append((messages, params))
+        if self.client.error is not None:
+            raise self.client.error
+        response = FakeResponse([openai_chunk(content) for content in self.client.contents], self.client.stall)
+        self.client.responses.append(response)
+        return response
+
+
+class FakeAsyncOpenAICompletions(FakeOpenAICompletions):
+    async def create(self, model, messages, stream=False, **params):
+        return FakeOpenAICompletions.create(self, model, messages, stream, **params)
+
+
+class FakeOpenAI:
+    def __init__(self, contents, error=None, asynchronous=False, stall=False):
+        self.contents = contents
+        self.error = error
+        self.stall = stall
+        self.calls = []  # (messages, params) of each call
+        self.responses = []  # FakeResponse of each call
+        completions = FakeAsyncOpenAICompletions(self) if asynchronous else FakeOpenAICompletions(self)
+        self.chat = SimpleNamespace(completions=completions)
+
+
+# Observation recording the calls of the observation interface (see StreamObservation in metrics.py)
+class RecordingObservation:
+    def __init__(self):
+        self.events = []
+
+    def started(self):
+        self.events.append("started")
+
+    def connected(self, backend, seconds):
+        self.events.append(("connected", backend))
+
+    def served_by(self, backend):
+        self.events.append(("served_by", backend))
+
+    def first_token(self):
+        self.events.append("first_token")
+
+    def finished(self, generated):
+        self.events.append(("finished", generated))
+
+    def empty(self):
+        self.events.append("empty")
+
+    def error(self, error):
+        self.events.append(("error", type(error).__name__))
+
+    def cancelled(self):
+        self.events.append("cancelled")
+
+
+# ---- Fake LLM server (fake_llm.py) ----
+
+# Fake LLM server in a subprocess, yields its URL
+@contextlib.contextmanager
+def fake_llm_server(*args):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen([sys.executable, os.path.join(PROMPT_DIR, "fake_llm.py"), "--port", str(port),
+                                "--ttft-jitter-ms", "0", "--token-delay-ms", "1", *args],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(url + "/stats", timeout=1)
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"fake LLM server {url} not ready")
+                time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def fake_llm_stats(url):
+    return httpx.get(url + "/stats").json()
@@ -0,0 +1,166 @@
+import asyncio
+import gc
+import inspect
+import threading
+
+from admission import AdmissionController, AsyncAdmissionController, KEEPALIVE_FRAME, parse_class_weights
+
+
+def controller(max_concurrent=1, max_per_game=2, class_weights=None, keepalive=0.01, max_wait=5.0,
+               controller_class=AdmissionController):
+    return controller_class(max_concurrent, max_per_game, class_weights or {}, keepalive, max_wait)
+
+
+def upstream(name):
+    yield f"data: {name}\n\n"
+
+
+def test_parse_class_weights():
+    assert parse_class_weights("BOU_2_2=2, LJS_1=1,") == {"BOU_2_2": 2.0, "LJS_1": 1.0}
+    assert parse_class_weights("") == {}
+
+
+# ---- Weighted fair queueing ----
+
+def granted_order(admission, requests):
+    waiters = []
+    with admission.lock:
+        assert admission.enqueue("busy", threading.Event()) is None
+        for class_id in requests:
+            waiters.append(admission.enqueue(class_id, threading.Event()))
+    # One slot: each release grants the next queued request
+    order = []
+    for _ in requests:
+        admission.release()
+        waiter = next(waiter for waiter in waiters if waiter.granted)
+        waiters.remove(waiter)
+        order.append(waiter.class_id)
+    return order
+
+
+def test_burst_of_one_class_does_not_delay_another_class():
+    admission = controller()
+    assert granted_order(admission, ["A", "A", "A", "A", "B"]) == ["A", "B", "A", "A", "A"]
+
+
+def test_class_weights():
+    admission = controller(class_weights={"A": 2.0})
+    assert granted_order(admission, ["A", "A", "A", "A", "B", "B"]) == ["A", "A", "B", "A", "A", "B"]
+
+
+# ---- Global cap ----
+
+def test_release_grants_the_slot_to_the_queued_request():
+    admission = controller()
+    first = admission.admit("A", upstream("first"))
+    assert next(first) == "data: first\n\n"
+    second = admission.admit("B", upstream("second"))
+    # Queued: keep-alive comments until the first stream ends
+    assert next(second) == KEEPALIVE_FRAME
+    assert admission.report()["queue_depth_by_class"] == {"B": 1}
+
+    first.close()
+    assert list(second) == ["data: second\n\n"]
+
+    report = admission.report()
+    assert (report["in_flight"], report["queue_depth"], report["admitted"], report["queued"]) == (0, 0, 2, 1)
+
+
+def test_queued_request_times_out():
+    admission = controller(max_wait=0.05)
+    first = admission.admit("A", upstream("first"))
+    next(first)
+    second = upstream("second")
+
+    frames = list(admission.admit("A", second))
+
+    assert frames[-1].startswith("error: ") and "server busy" in frames[-1]
+    assert set(frames[:-1]) <= {KEEPALIVE_FRAME}
+    assert inspect.getgeneratorstate(second) == inspect.GEN_CLOSED
+    assert admission.report()["timed_out"] == 1
+    first.close()
+    assert admission.report()["in_flight"] == 0
+
+
+def test_client_leaving_the_queue():
+    admission = controller()
+    first = admission.admit("A", upstream("first"))
+    next(first)
+    second = admission.admit("A", upstream("second"))
+    assert next(second) == KEEPALIVE_FRAME
+
+    second.close()
+    first.close()
+
+    report = admission.report()
+    assert (report["abandoned"], report["in_flight"], report["queue_depth"], report["admitted"]) == (1, 0, 0, 1)
+
+
+# ---- Per-student limit ----
+
+def test_per_game_limit():
+    admission = controller(max_per_game=1)
+    # Double click: the second request is rejected before the response of the first one starts
+    slot = admission.reserve_game("game")
+    assert slot is not None
+    assert admission.reserve_game("game") is None
+    assert admission.reserve_game("other game") is not None
+    assert admission.reserve_game("") is not None and admission.reserve_game("") is not None
+
+    tracked = admission.track_game(slot, upstream("first"))
+    assert list(tracked) == ["data: first\n\n"]
+    assert admission.reserve_game("game") is not None
+    assert admission.report()["rejected"] == 1
+
+
+def test_game_slot_released_once():
+    admission = controller(max_per_game=1)
+    slot = admission.reserve_game("game")
+    slot.release()
+    slot.release()
+    assert admission.games == {}
+
+
+def test_game_slot_of_a_response_never_iterated():
+    admission = controller(max_per_game=1)
+    tracked = admission.track_game(admission.reserve_game("game"), upstream("first"))
+    tracked.close()
+    del tracked
+    gc.collect()
+    assert admission.games == {}
+
+
+# ---- ASGI server ----
+
+async def aupstream(name):
+    yield f"data: {name}\n\n"
+
+
+def test_async_release_grants_the_slot_to_the_queued_request():
+    async def scenario():
+        admission = controller(controller_class=AsyncAdmissionController)
+        first = admission.aadmit("A", aupstream("first"))
+        assert await first.__anext__() == "data: first\n\n"
+        second = admission.aadmit("B", aupstream("second"))
+        assert await second.__anext__() == KEEPALIVE_FRAME
+        await first.aclose()
+        frames = [frame async for frame in second]
+        return frames, admission.report()
+
+    frames, report = asyncio.run(scenario())
+    assert frames == ["data: second\n\n"]
+    assert (report["in_flight"], report["admitted"], report["queued"]) == (0, 2, 1)
+
+
+def test_async_queued_request_times_out():
+    async def scenario():
+        admission = controller(max_wait=0.05, controller_class=AsyncAdmissionController)
+        first = admission.aadmit("A", aupstream("first"))
+        await first.__anext__()
+        frames = [frame async for frame in admission.aadmit("A", aupstream("second"))]
+        await first.aclose()
+        return frames, admission.report()
+
+    frames, report = asyncio.run(scenario())
+    assert frames[-1].startswith("error: ")
+    assert (report["timed_out"], report["in_flight"]) == (1, 0)
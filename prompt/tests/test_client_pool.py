@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from client_pool import ClientPool, PoolStats, in_session, session_windows
+
+
+def test_saturation_counters():
+    stats = PoolStats(max_connections=2)
+    for _ in range(3):
+        stats.request_started()
+    stats.request_finished()
+
+    assert (stats.requests, stats.in_flight, stats.max_in_flight, stats.waited) == (3, 2, 3, 1)
+
+
+def test_report_without_the_private_pool_of_httpx():
+    pool = ClientPool("primary", "openai", "key", "http://127.0.0.1:1/v1", 4, 60.0, http2=False)
+    report = pool.report()
+    assert (report["connections"], report["idle_connections"], report["saturation"]) == (0, 0, 0.0)
+
+    # Other httpx versions: the connections are not reported, the counters still are
+    pool.transport = object()
+    report = pool.report()
+    assert (report["connections"], report["idle_connections"], report["requests"]) == (None, None, 0)
+
+
+def test_session_windows():
+    windows = session_windows()
+    assert windows
+    weekday, start, end = next(iter(windows))
+    # 2024-01-01 is a Monday (weekday 0)
+    assert in_session(datetime(2024, 1, 1 + weekday, start // 3600, start % 3600 // 60), windows)
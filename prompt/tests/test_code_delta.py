@@ -0,0 +1,66 @@
+import random
+
+from code_delta import encode_code_history, decode_code_history
+
+CODE = "\n".join([
+    "def main():",
+    "    for i in range(3):",
+    "        avancer()",
+    "",
+    "    sauter()",
+    "    ouvrir()",
+])
+
+
+def activity(number, code):
+    return {"role": "user", "content": f"<activity id='{number}'><status>error</status><code>{code}</code></activity>"}
+
+
+def test_round_trip_of_the_snapshots():
+    codes = [
+        CODE,
+        CODE,  # unchanged
+        CODE.replace("range(3)", "range(4)"),  # one line changed
+        CODE.replace("range(3)", "range(4)") + "\n    avancer()",  # line added
+        CODE.replace("    sauter()\n", ""),  # line removed
+        "",  # editor cleared
+        CODE,
+    ]
+    user_messages = [activity(number, code) for number, code in enumerate(codes)]
+    user_messages.insert(3, {"role": "assistant", "content": "Try a loop"})
+
+    encoded_messages, report = encode_code_history(user_messages)
+
+    assert decode_code_history(encoded_messages) == user_messages
+    assert report["snapshots"]["ref"] == 1 and report["snapshots"]["diff"] >= 2
+    assert report["encoded_chars"] < report["code_chars"]
+    assert '<code ref="previous"/>' in encoded_messages[1]["content"]
+
+
+def test_round_trip_of_random_edits():
+    rng = random.Random(0)
+    words = ["avancer()", "sauter()", "    gauche()", "", "for i in range(2):", "    droite()", "# note"]
+    lines = CODE.split("\n")
+    user_messages = []
+    for number in range(200):
+        position = rng.randrange(len(lines) + 1)
+        edit = rng.choice(["add", "remove", "change", "none"])
+        if edit == "add" or not lines:
+            lines.insert(position, rng.choice(words))
+        elif edit == "remove":
+            del lines[min(position, len(lines) - 1)]
+        elif edit == "change":
+            lines[min(position, len(lines) - 1)] = rng.choice(words)
+        user_messages.append(activity(number, "\n".join(lines)))
+
+    encoded_messages, _ = encode_code_history(user_messages)
+
+    assert decode_code_history(encoded_messages) == user_messages
+
+
+def test_messages_without_code_are_unchanged():
+    user_messages = [{"role": "user", "content": "<activity id='1'/>"}, {"role": "user", "content": [{"type": "text"}]}]
+    encoded_messages, report = encode_code_history(user_messages)
+    assert encoded_messages == user_messages
+    assert decode_code_history(encoded_messages) == user_messages
+    assert report["ratio"] == 1.0
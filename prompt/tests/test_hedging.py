@@ -0,0 +1,143 @@
+import asyncio
+
+from fakes import FakeMistral, FakeOpenAI, fake_llm_server, fake_llm_stats
+from hedging import Backend, HedgedBackends
+from llm_stream import create_async_client, generate_sse, agenerate_sse
+from prompt_cache import prompt_cache_preparer
+
+MESSAGES = [{"role": "system", "content": "system prompt"}, {"role": "user", "content": "<activities/>"}]
+PARAMS = {"temperature": 0.3, "max_tokens": 500}
+
+
+def mixed_backends(primary, alternate, max_failures=3, cooldown=30.0):
+    return HedgedBackends([Backend("primary", primary, "openai", "gpt"),
+                           Backend("alternate", alternate, "mistral", "mistral-small")],
+                          hedge_delay=10.0, max_failures=max_failures, cooldown=cooldown)
+
+
+async def collect(frames):
+    return [frame async for frame in frames]
+
+
+# ---- Failover between providers ----
+
+def test_failover_openai_to_mistral_with_prompt_cache():
+    primary = FakeOpenAI([], error=RuntimeError("primary down"))
+    alternate = FakeMistral(["Try ", "a loop"])
+    hedging = mixed_backends(primary, alternate)
+    prepare = prompt_cache_preparer("cache_control", 1, 2, "EN")
+
+    frames = list(generate_sse(None, "openai", "gpt", MESSAGES, PARAMS, hedging=hedging, prepare=prepare))
+
+    assert frames == ["data: Try \n\n", "data: a loop\n\n"]
+    # The primary received the OpenAI hints, the alternate the plain Mistral call
+    primary_messages, primary_params = primary.calls[0]
+    assert "stream_options" in primary_params and "prompt_cache_key" in primary_params
+    assert primary_messages[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert alternate.calls == [MESSAGES]
+    assert hedging.report()["alternate"]["failovers"] == 1
+
+
+def test_async_failover_openai_to_mistral_with_prompt_cache():
+    primary = FakeOpenAI([], error=RuntimeError("primary down"), asynchronous=True)
+    alternate = FakeMistral(["Try ", "a loop"])
+    hedging = mixed_backends(primary, alternate)
+    prepare = prompt_cache_preparer("cache_control", 1, 2, "EN")
+
+    frames = asyncio.run(collect(agenerate_sse(None, "openai", "gpt", MESSAGES, PARAMS, hedging=hedging,
+                                               prepare=prepare)))
+
+    assert frames == ["data: Try \n\n", "data: a loop\n\n"]
+    assert "stream_options" in primary.calls[0][1]
+    assert alternate.calls == [MESSAGES]
+
+
+# ---- Circuit breaker ----
+
+def test_circuit_opens_after_consecutive_failures():
+    primary = FakeOpenAI([], error=RuntimeError("primary down"))
+    alternate = FakeMistral(["hint"])
+    hedging = mixed_backends(primary, alternate, max_failures=2, cooldown=60.0)
+
+    for _ in range(3):
+        assert list(hedging.stream(MESSAGES, PARAMS)) == ["hint"]
+
+    # The third request skipped the primary
+    assert len(primary.calls) == 2
+    report = hedging.report()
+    assert report["primary"]["circuit"] == "open"
+    assert report["primary"]["circuit_opened"] == 1
+    assert report["alternate"]["requests"] == 3
+
+
+def test_circuit_closes_after_cooldown():
+    primary = FakeOpenAI([], error=RuntimeError("primary down"))
+    alternate = FakeMistral(["hint"])
+    hedging = mixed_backends(primary, alternate, max_failures=1, cooldown=0.0)
+
+    list(hedging.stream(MESSAGES, PARAMS))
+    primary.error = None
+    primary.contents = ["back"]
+
+    assert list(hedging.stream(MESSAGES, PARAMS)) == ["back"]
+    assert hedging.report()["primary"]["circuit"] == "closed"
+
+
+def test_all_circuits_open_tries_all_backends():
+    primary = FakeOpenAI([], error=RuntimeError("primary down"))
+    alternate = FakeMistral([], error=RuntimeError("alternate down"))
+    hedging = mixed_backends(primary, alternate, max_failures=1, cooldown=60.0)
+
+    frames = list(generate_sse(None, "openai", "gpt", MESSAGES, PARAMS, hedging=hedging))
+    assert frames[-1].startswith("error: ")
+    frames = list(generate_sse(None, "openai", "gpt", MESSAGES, PARAMS, hedging=hedging))
+    assert frames[-1].startswith("error: ")
+    assert len(primary.calls) == 2 and len(alternate.calls) == 2
+
+
+def test_empty_response_counts_as_failure():
+    primary = FakeOpenAI([])
+    alternate = FakeMistral(["hint"])
+    hedging = mixed_backends(primary, alternate, max_failures=1, cooldown=60.0)
+
+    assert list(hedging.stream(MESSAGES, PARAMS)) == ["hint"]
+    assert hedging.report()["primary"]["failures"] == 1
+    assert hedging.report()["primary"]["circuit"] == "open"
+
+
+# ---- Real HTTP clients (fake_llm.py) ----
+# astream() awaits the first chunk of each backend in its own task, the rest of the winner is read by the request task
+
+def http_backends(primary_url, alternate_url, hedge_delay):
+    primary = create_async_client("openai", "fake", primary_url + "/v1")
+    alternate = create_async_client("mistral", "fake", alternate_url)
+    return HedgedBackends([Backend("primary", primary, "openai", "gpt"),
+                           Backend("alternate", alternate, "mistral", "mistral-small")],
+                          hedge_delay=hedge_delay, max_failures=3, cooldown=30.0)
+
+
+def test_async_hedging_over_http():
+    with fake_llm_server("--ttft-ms", "2000", "--length", "fixed:5") as slow_url, \
+            fake_llm_server("--ttft-ms", "10", "--length", "fixed:8") as fast_url:
+        async def scenario():
+            # Primary answering: first chunk in a task, the other chunks in the request task
+            served = await collect(agenerate_sse(None, "openai", "gpt", MESSAGES, PARAMS,
+                                                 hedging=http_backends(fast_url, slow_url, 5.0)))
+            # Slow primary: the alternate is hedged, wins, and the primary is cancelled
+            hedging = http_backends(slow_url, fast_url, 0.1)
+            hedged = await collect(agenerate_sse(None, "openai", "gpt", MESSAGES, PARAMS, hedging=hedging))
+            return served, hedged, hedging.report()
+
+        served, hedged, report = asyncio.run(scenario())
+        assert len(served) == 8 and all(frame.startswith("data: ") for frame in served)
+        assert len(hedged) == 8 and all(frame.startswith("data: ") for frame in hedged)
+        assert (report["alternate"]["hedges"], report["alternate"]["wins"], report["primary"]["cancelled"]) == (1, 1, 1)
+        # The fast server streamed both responses to the end
+        assert fake_llm_stats(fast_url)["streams"] == 2
+
+
+def test_async_empty_response_of_all_the_backends_over_http():
+    with fake_llm_server("--ttft-ms", "10", "--empty-rate", "1") as url:
+        frames = asyncio.run(collect(agenerate_sse(None, "openai", "gpt", MESSAGES, PARAMS,
+                                                   hedging=http_backends(url, url, 5.0))))
+    assert frames == ["error: POST llm_inference_stream : empty response from the LLM backends\n\n"]
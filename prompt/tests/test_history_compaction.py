@@ -0,0 +1,71 @@
+from history_compaction import activities_digest, compact_history, find_activities, kept_activities
+from token_count import count_tokens
+
+
+def activity(type_, game_time, extra=""):
+    code = "\n".join(f"avancer({step})" for step in range(20))
+    return (f"<activity><type>{type_}</type><game_time>{game_time}</game_time>{extra}"
+            f"<code>{code}</code></activity>")
+
+
+def history():
+    activities = [
+        activity("launched-program", "00:01", "<error_message>NameError: avancr</error_message>"),
+        activity("displayed-content", "00:02", "<section>FOR_LOOP</section>"),
+        activity("launched-program", "00:03", "<lost_reason>fell into the sea</lost_reason>"),
+        activity("asked-help", "00:04"),
+        activity("launched-program", "00:05", "<error_message>NameError: avancr</error_message>"),
+        activity("launched-program", "00:06"),
+        activity("asked-help", "00:07"),
+    ]
+    return [{"role": "user", "content": "<activities>" + "".join(activities) + "</activities>"}]
+
+
+def types_of(user_messages):
+    return [match.group().split("<type>")[1].split("</type>")[0] for _, match in find_activities(user_messages)]
+
+
+def test_short_history_is_unchanged():
+    user_messages = history()
+    assert compact_history(user_messages, count_tokens(user_messages[0]["content"])) is user_messages
+
+
+def test_kept_activities():
+    # Last launched program, last asked help and every displayed content
+    assert kept_activities(find_activities(history())) == {1, 5, 6}
+
+
+def test_budget_cutoff_collapses_the_oldest_activities():
+    user_messages = history()
+    total_tokens = count_tokens(user_messages[0]["content"])
+    budget = total_tokens - count_tokens(activity("launched-program", "00:01")) * 2
+
+    compacted = compact_history(user_messages, budget)
+
+    content = compacted[0]["content"]
+    # The two oldest collapsible activities are replaced by the digests, the next ones stay verbatim
+    assert types_of(compacted) == ["displayed-content", "asked-help", "launched-program", "launched-program",
+                                   "asked-help"]
+    assert content.count("<activities_digest>") == 2
+    assert "<game_time>00:03</game_time></activity>" not in content
+    assert count_tokens(content) <= budget + 2 * count_tokens(activities_digest([activity("asked-help", "0")]))
+
+
+def test_kept_activities_exceeding_the_budget():
+    compacted = compact_history(history(), 1)
+    assert types_of(compacted) == ["displayed-content", "launched-program", "asked-help"]
+    assert compacted[0]["content"].count("<activities_digest>") == 2
+
+
+def test_digest_text():
+    digest = activities_digest([
+        activity("launched-program", "00:01", "<error_message>NameError: avancr</error_message>"),
+        activity("launched-program", "00:03", "<lost_reason>fell into the sea</lost_reason>"),
+        activity("asked-help", "00:04", "<error_message>NameError: avancr</error_message>"),
+    ])
+    assert digest == ("<activities_digest><count>3</count><types>launched-program x2, asked-help x1</types>"
+                      "<game_time>00:01 to 00:04</game_time><errors>NameError: avancr | fell into the sea</errors>"
+                      "</activities_digest>")
+    assert activities_digest([activity("asked-help", "00:04")]) == (
+        "<activities_digest><count>1</count><types>asked-help x1</types><game_time>00:04</game_time>"
+        "</activities_digest>")
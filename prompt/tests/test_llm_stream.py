@@ -0,0 +1,97 @@
+import asyncio
+
+from fakes import FakeOpenAI, RecordingObservation
+from llm_stream import generate_sse, agenerate_sse
+
+MESSAGES = [{"role": "system", "content": "system prompt"}, {"role": "user", "content": "<activities/>"}]
+PARAMS = {"temperature": 0.3, "max_tokens": 500}
+
+
+# ---- Client disconnection ----
+
+def test_closing_the_sse_generator_closes_the_upstream_stream():
+    client = FakeOpenAI(["Try ", "a ", "loop"])
+    observation = RecordingObservation()
+    cancelled = []
+    frames = generate_sse(client, "openai", "gpt", MESSAGES, PARAMS, on_cancel=cancelled.append,
+                          observation=observation)
+
+    assert next(frames) == "data: Try \n\n"
+    assert next(frames) == "data: a \n\n"
+    frames.close()  # GeneratorExit: the client disconnected
+
+    assert client.responses[0].closed
+    assert cancelled == ["Try a "]
+    assert observation.events[-1] == "cancelled"
+
+
+def test_closing_the_sse_generator_with_flush_policy():
+    client = FakeOpenAI(["Try ", "a ", "loop"])
+    cancelled = []
+    frames = generate_sse(client, "openai", "gpt", MESSAGES, PARAMS, on_cancel=cancelled.append,
+                          flush_policy=(10.0, 1000))
+
+    assert next(frames) == "data: Try \n\n"
+    frames.close()
+
+    assert client.responses[0].closed
+    assert cancelled == ["Try "]
+
+
+def test_completed_stream_is_not_cancelled():
+    client = FakeOpenAI(["Try ", "a loop"])
+    cancelled = []
+
+    frames = list(generate_sse(client, "openai", "gpt", MESSAGES, PARAMS, on_cancel=cancelled.append))
+
+    assert frames == ["data: Try \n\n", "data: a loop\n\n"]
+    assert client.responses[0].closed
+    assert cancelled == []
+
+
+def test_async_closing_the_sse_generator_closes_the_upstream_stream():
+    client = FakeOpenAI(["Try ", "a ", "loop"], asynchronous=True, stall=True)
+    cancelled = []
+
+    async def scenario():
+        frames = agenerate_sse(client, "openai", "gpt", MESSAGES, PARAMS, on_cancel=cancelled.append)
+        first = await frames.__anext__()
+        await frames.aclose()
+        return first
+
+    assert asyncio.run(scenario()) == "data: Try \n\n"
+    assert client.responses[0].closed
+    assert cancelled == ["Try "]
+
+
+# The ASGI server cancels the task streaming the response when the client disconnects
+def test_async_cancelling_the_sse_task_closes_the_upstream_stream():
+    for flush_policy in [None, (0.01, 1000)]:
+        client = FakeOpenAI(["Try ", "a ", "loop"], asynchronous=True, stall=True)
+        observation = RecordingObservation()
+        cancelled = []
+
+        async def scenario():
+            received = []
+
+            async def stream():
+                async for frame in agenerate_sse(client, "openai", "gpt", MESSAGES, PARAMS,
+                                                 on_cancel=cancelled.append, flush_policy=flush_policy,
+                                                 observation=observation):
+                    received.append(frame)
+
+            task = asyncio.ensure_future(stream())
+            while len(received) < (3 if flush_policy is None else 2):
+                await asyncio.sleep(0.01)
+            # The provider stalls after the last delta: the client leaves before the end of the stream
+            task.cancel()
+            await asyncio.wait({task})
+            return received, task.cancelled()
+
+        received, task_cancelled = asyncio.run(scenario())
+        assert task_cancelled
+        assert "".join(received) == "data: Try \n\n" + ("data: a \n\ndata: loop\n\n" if flush_policy is None
+                                                         else "data: a loop\n\n")
+        assert client.responses[0].closed
+        assert cancelled == ["Try a loop"]
+        assert observation.events[-1] == "cancelled"
@@ -0,0 +1,31 @@
+import pytest
+
+import system_prompt_modality_B
+import system_prompt_modality_C
+from map_encoding import GRID_ENCODINGS, GRID_PATTERN, encode_map_grid, parse_grid
+
+LEVEL_GRIDS = [(f"{name}-{level}", map_grid)
+               for name, module in (("B", system_prompt_modality_B), ("C", system_prompt_modality_C))
+               for level, map_grid in module.LEVELS_MAP_GRID.items()]
+
+
+@pytest.mark.parametrize("encoding", list(GRID_ENCODINGS))
+@pytest.mark.parametrize("map_grid", [map_grid for _, map_grid in LEVEL_GRIDS], ids=[name for name, _ in LEVEL_GRIDS])
+def test_round_trip_of_every_level_grid(map_grid, encoding):
+    encode, decode = GRID_ENCODINGS[encoding]
+    rows = parse_grid(map_grid)
+    assert decode(encode(rows)) == rows
+
+
+@pytest.mark.parametrize("encoding", ["rle", "sparse", "entities"])
+def test_encoded_section_keeps_the_text_around_the_grid(encoding):
+    map_grid = system_prompt_modality_B.LEVELS_MAP_GRID[1]
+    encoded = encode_map_grid(map_grid, encoding)
+    match = GRID_PATTERN.search(map_grid)
+    assert encoded.startswith(map_grid[:match.start()]) and encoded.endswith(map_grid[match.end():])
+    assert GRID_PATTERN.search(encoded) is None
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        encode_map_grid(system_prompt_modality_B.LEVELS_MAP_GRID[1], "png")
@@ -0,0 +1,14 @@
+from metrics import percentile
+
+
+def test_nearest_rank_percentile():
+    assert percentile([4, 1, 3, 2], 0.5) == 2
+    values = list(range(1, 21))
+    assert percentile(values, 0.95) == 19
+    assert percentile(values, 0.99) == 20
+    assert percentile(values, 1.0) == 20
+    assert percentile(values, 0.0) == 1
+    assert percentile([7], 0.5) == 7
+    assert percentile([], 0.5) is None
+    # Rank not shifted by the rounding error of q * n
+    assert percentile(list(range(1, 101)), 0.07) == 7
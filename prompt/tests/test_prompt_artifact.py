@@ -0,0 +1,31 @@
+from prompt_artifact import build_prompt_artifact, load_prompt_artifact
+from prompt_registry import build_prompt_registry
+
+LEVELS = [1, 2]
+LANGUAGES = ["EN", "FR"]
+MODALITIES = [1, 2]
+
+
+def test_artifact_matches_the_registry(tmp_path):
+    path = str(tmp_path / "prompts.bin")
+    build_prompt_artifact(path, LEVELS, LANGUAGES, MODALITIES)
+    artifact = load_prompt_artifact(path, LEVELS, LANGUAGES, MODALITIES)
+    registry = build_prompt_registry(LEVELS, LANGUAGES, MODALITIES)
+
+    assert set(artifact) == set(registry)
+    for key, message in registry.items():
+        assert dict(artifact[key]) == message
+
+
+def test_content_is_decoded_once(tmp_path):
+    path = str(tmp_path / "prompts.bin")
+    build_prompt_artifact(path, LEVELS, LANGUAGES, MODALITIES)
+    message = load_prompt_artifact(path, LEVELS, LANGUAGES, MODALITIES)[(1, 2, "EN")]
+
+    assert message["content"] is message["content"]
+
+
+def test_stale_artifact_is_ignored(tmp_path):
+    path = str(tmp_path / "prompts.bin")
+    build_prompt_artifact(path, LEVELS, LANGUAGES, MODALITIES)
+    assert load_prompt_artifact(path, LEVELS, LANGUAGES, MODALITIES, pruning=True) is None
@@ -0,0 +1,27 @@
+from prompt_cache import prompt_cache_preparer
+
+MESSAGES = [{"role": "system", "content": "system prompt"}, {"role": "user", "content": "<activities/>"}]
+PARAMS = {"temperature": 0.3, "max_tokens": 500}
+
+
+def test_openai_hints():
+    prepare = prompt_cache_preparer("cache_control", 1, 3, "EN")
+    messages, params = prepare("openai", MESSAGES, PARAMS)
+    assert params["stream_options"] == {"include_usage": True}
+    assert params["prompt_cache_key"] == "pyrates-B-3-EN"
+    assert messages[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert messages[1] is MESSAGES[1]
+
+
+def test_mistral_without_hints():
+    prepare = prompt_cache_preparer("cache_control", 1, 3, "EN")
+    messages, params = prepare("mistral", MESSAGES, PARAMS)
+    assert messages == MESSAGES
+    assert params == PARAMS
+
+
+def test_request_left_provider_neutral():
+    prepare = prompt_cache_preparer("cache_control", 2, 1, "FR")
+    prepare("openai", MESSAGES, PARAMS)
+    assert MESSAGES[0]["content"] == "system prompt"
+    assert "stream_options" not in PARAMS
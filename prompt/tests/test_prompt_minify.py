@@ -0,0 +1,36 @@
+import pytest
+
+import system_prompt_modality_C
+from prompt_minify import check_equivalence, minify_xml
+
+LANGUAGES = list(system_prompt_modality_C.INSTRUCTION)
+
+
+def test_every_language_is_checked():
+    assert set(LANGUAGES) >= {"EN", "FR"}
+
+
+@pytest.mark.parametrize("language", LANGUAGES)
+def test_minified_instructions_are_equivalent(language):
+    instruction = system_prompt_modality_C.INSTRUCTION[language]
+    minified = minify_xml(instruction)
+    assert check_equivalence(instruction, minified)
+    assert len(minified) < len(instruction)
+    assert minify_xml(minified) == minified
+
+
+@pytest.mark.parametrize("language", LANGUAGES)
+def test_checker_detects_a_change(language):
+    minified = minify_xml(system_prompt_modality_C.INSTRUCTION[language])
+    tag = minified.index("</")
+    assert not check_equivalence(minified, minified[:tag] + "</changed>" + minified[minified.index(">", tag) + 1:])
+    assert not check_equivalence(minified, minified.replace(" ", "", 1))
+
+
+def test_minified_prompt():
+    for language in LANGUAGES:
+        for level in range(1, 9):
+            full = system_prompt_modality_C.get_system_prompt_modality_C(level, language)["content"]
+            minified = system_prompt_modality_C.get_system_prompt_modality_C(level, language, minify=True)["content"]
+            assert len(minified) < len(full)
+            assert check_equivalence(full, minified)
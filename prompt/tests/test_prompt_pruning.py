@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+import system_prompt_modality_B
+import system_prompt_modality_C
+from prompt_pruning import LEVELS_CONTROL_FUNCTIONS, LEVELS_MEMO_SECTIONS, PROGRAM_EXECUTION_RULES, \
+    prune_program_execution
+
+MODULES = {"B": system_prompt_modality_B, "C": system_prompt_modality_C}
+LEVELS = [1, 2, 3, 4, 5, 6, 7, 8]
+LANGUAGES = ["EN", "FR"]
+CONTROL_FUNCTION_PATTERN = re.compile(r'<control_function id="(.*?)"')
+
+
+def is_subsequence(lines, all_lines):
+    remaining = iter(all_lines)
+    return all(line in remaining for line in lines)
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_every_rule_prefix_matches_exactly_one_rule(name):
+    lines = MODULES[name].PROGRAM_EXECUTION_DEF.split("\n")
+    for beginning in PROGRAM_EXECUTION_RULES:
+        assert sum(line.startswith(beginning) for line in lines) == 1, beginning
+
+
+# A rule is kept when one of its functions is available: the table may list more functions than the description
+# (the FR description of level 8 does not list attack()), never fewer
+@pytest.mark.parametrize("language", LANGUAGES)
+@pytest.mark.parametrize("name", MODULES)
+def test_control_functions_of_the_level_descriptions(name, language):
+    descriptions = MODULES[name].get_levels_description(language)
+    for level in LEVELS:
+        control_functions = CONTROL_FUNCTION_PATTERN.findall(descriptions[level])
+        assert set(control_functions) <= set(LEVELS_CONTROL_FUNCTIONS[level])
+        if language == "EN":
+            assert control_functions == LEVELS_CONTROL_FUNCTIONS[level]
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_memo_sections_exist(name):
+    for language in LANGUAGES:
+        sections = MODULES[name].PROGRAMMING_MEMO_SECTIONS[language]
+        for level in LEVELS:
+            assert set(LEVELS_MEMO_SECTIONS[level]) <= set(sections)
+
+
+# The pruned prompt only removes lines of the full prompt
+@pytest.mark.parametrize("language", LANGUAGES)
+@pytest.mark.parametrize("name", MODULES)
+def test_pruned_prompt_is_a_subset_of_the_full_prompt(name, language):
+    build_prompt = getattr(MODULES[name], f"get_system_prompt_modality_{name}")
+    for level in LEVELS:
+        full = build_prompt(level, language)["content"]
+        pruned = build_prompt(level, language, pruning=True)["content"]
+        assert len(pruned) < len(full)
+        assert is_subsequence(pruned.split("\n"), full.split("\n"))
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_pruned_rules(name):
+    program_execution_def = MODULES[name].PROGRAM_EXECUTION_DEF
+    pruned = prune_program_execution(program_execution_def, 7)
+    for beginning, control_functions in PROGRAM_EXECUTION_RULES.items():
+        kept = any(function in ["turn", "shoot"] for function in control_functions)
+        assert (beginning in pruned) == kept, beginning
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from prompt_registry import PROMPT_MODULES, build_prompt_registry, context_layout
+
+LEVELS = [1, 2, 3, 4, 5, 6, 7, 8]
+LANGUAGES = ["EN", "FR"]
+
+
+@pytest.mark.parametrize("modality", [1, 2])
+def test_shared_prefix_layout_of_the_default_options(modality):
+    module = PROMPT_MODULES[modality]
+    assert context_layout(module, "shared_prefix", LANGUAGES) == module.CONTEXT_LAYOUTS["shared_prefix"]
+    assert context_layout(module, "default", LANGUAGES, pruning=True) == module.CONTEXT_LAYOUTS["default"]
+
+
+# With pruning, the level-dependent sections of the static layout must not cut the prefix shared by the levels
+@pytest.mark.parametrize("grid_encoding", ["verbatim", "rle"])
+@pytest.mark.parametrize("modality", [1, 2])
+def test_shared_prefix_layout_with_pruning(modality, grid_encoding):
+    module = PROMPT_MODULES[modality]
+    layout = context_layout(module, "shared_prefix", LANGUAGES, pruning=True, grid_encoding=grid_encoding)
+    registry = build_prompt_registry(LEVELS, LANGUAGES, [modality], "shared_prefix", pruning=True,
+                                     grid_encoding=grid_encoding)
+
+    for language in LANGUAGES:
+        prefix = os.path.commonprefix([registry[(modality, level, language)]["content"] for level in LEVELS])
+        level_sections = [module.get_context_sections(level, language, True, grid_encoding) for level in LEVELS]
+        shared = [section for section in layout if len({sections[section] for sections in level_sections}) == 1]
+        assert layout[:len(shared)] == shared
+        assert "# Context:\n" + "".join(level_sections[0][section] for section in shared) in prefix
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from response_cache import ResponseCache, replay_frames
+
+FRAMES = ["data: Try\n\n", "data:  a loop\n\n"]
+
+
+def test_completed_stream_is_stored_and_replayed():
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60)
+    assert cache.get("key") is None
+    assert list(cache.record("key", iter(FRAMES))) == FRAMES
+
+    assert list(replay_frames(cache.get("key"), 0)) == FRAMES
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_error_frames_are_not_stored():
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60)
+    list(cache.record("error", iter(["data: a\n\n", "error: POST llm_inference_stream : timeout\n\n"])))
+    list(cache.record("empty", iter(["error: POST llm_inference_stream : empty response from LLM\n\n"])))
+    list(cache.record("nothing", iter([])))
+
+    assert cache.stats()["entries"] == 0
+    assert cache.get("error") is None
+
+
+def test_interrupted_stream_is_not_stored():
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60)
+    frames = cache.record("key", iter(FRAMES))
+    next(frames)
+    frames.close()  # client disconnected
+    assert cache.get("key") is None
+
+
+def test_lru_eviction_by_entries():
+    cache = ResponseCache(max_entries=2, max_bytes=10_000, ttl=60)
+    cache.put("a", ["data: a\n\n"])
+    cache.put("b", ["data: b\n\n"])
+    cache.get("a")  # "b" becomes the least recently used entry
+    cache.put("c", ["data: c\n\n"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_eviction_by_bytes():
+    frame = "data: " + "x" * 94 + "\n\n"  # 102 bytes
+    cache = ResponseCache(max_entries=10, max_bytes=250, ttl=60)
+    cache.put("a", [frame])
+    cache.put("b", [frame])
+    cache.put("c", [frame])
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 2 and cache.stats()["bytes"] == 204
+
+
+def test_response_larger_than_the_cache_is_not_stored():
+    cache = ResponseCache(max_entries=10, max_bytes=50, ttl=60)
+    cache.put("a", ["data: " + "x" * 100 + "\n\n"])
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_expired_entry_is_removed():
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=0.01)
+    cache.put("a", FRAMES)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["bytes"] == 0
+
+
+def test_put_replaces_an_entry():
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60)
+    cache.put("a", ["data: old\n\n"])
+    cache.put("a", FRAMES)
+    assert cache.get("a") == tuple(FRAMES)
+    assert cache.stats()["bytes"] == sum(len(frame) for frame in FRAMES)
+
+
+def test_async_record():
+    async def frames():
+        for frame in FRAMES:
+            yield frame
+
+    async def scenario(cache):
+        return [frame async for frame in cache.arecord("key", frames())]
+
+    cache = ResponseCache(max_entries=10, max_bytes=10_000, ttl=60)
+    assert asyncio.run(scenario(cache)) == FRAMES
+    assert cache.get("key") == tuple(FRAMES)
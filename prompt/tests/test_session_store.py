@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from session_store import create_session_store, feedback_from_frames
+
+CONTEXT = (2, 1, "EN")
+ACTIVITY = {"role": "user", "content": "<activity id='1'/>"}
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    url = {"sqlite": str(tmp_path / "sessions.sqlite3"), "redis": "local"}.get(request.param, "")
+    return create_session_store(request.param, url, 60.0)
+
+
+def test_feedback_from_frames():
+    assert feedback_from_frames([": keep-alive\n\n", "data: Try\\n\n\n", "data:  a loop\n\n"]) == "Try\n a loop"
+    assert feedback_from_frames(["data: Try\n\n", "error: POST llm_inference_stream : timeout\n\n"]) is None
+    assert feedback_from_frames([]) is None
+
+
+def test_record_merges_the_feedback_into_the_session(store):
+    frames = store.record("game", CONTEXT, [ACTIVITY], iter(["data: Try \n\n", "data: a loop\n\n"]))
+    assert list(frames) == ["data: Try \n\n", "data: a loop\n\n"]
+
+    second = {"role": "user", "content": "<activity id='2'/>"}
+    messages = store.get_messages("game", CONTEXT) + [second]
+    assert messages == [ACTIVITY, {"role": "assistant", "content": "Try a loop"}, second]
+    assert store.count() == 1
+
+
+def test_new_level_restarts_the_session(store):
+    list(store.record("game", CONTEXT, [ACTIVITY], iter(["data: hint\n\n"])))
+    assert store.get_messages("game", (3, 1, "EN")) == []
+    assert store.get_messages("other game", CONTEXT) == []
+
+
+def test_failed_generation_keeps_the_activities(store):
+    list(store.record("game", CONTEXT, [ACTIVITY], iter(["error: POST llm_inference_stream : timeout\n\n"])))
+    assert store.get_messages("game", CONTEXT) == [ACTIVITY]
+    store.delete("game")
+    assert store.get_messages("game", CONTEXT) == []
+
+
+def test_client_disconnection_keeps_the_activities(store):
+    frames = store.record("game", CONTEXT, [ACTIVITY], iter(["data: Try \n\n", "data: a loop\n\n"]))
+    next(frames)
+    frames.close()
+    assert store.get_messages("game", CONTEXT) == [ACTIVITY]
+
+
+def test_async_record(store):
+    async def upstream(contents):
+        for content in contents:
+            yield content
+
+    async def scenario():
+        frames = store.arecord("game", CONTEXT, [ACTIVITY], upstream(["data: hint\n\n"]))
+        assert [frame async for frame in frames] == ["data: hint\n\n"]
+        messages = await store.aget_messages("game", CONTEXT)
+        failed = store.arecord("game", CONTEXT, messages + [ACTIVITY], upstream(["error: empty response\n\n"]))
+        assert [frame async for frame in failed] == ["error: empty response\n\n"]
+        return await store.aget_messages("game", CONTEXT), await store.acount()
+
+    messages, count = asyncio.run(scenario())
+    assert messages == [ACTIVITY, {"role": "assistant", "content": "hint"}, ACTIVITY]
+    assert count == 1
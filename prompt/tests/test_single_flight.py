@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+from fakes import RecordingObservation
+from llm_stream import observe_frames, aobserve_frames
+from single_flight import SingleFlight, AsyncSingleFlight
+
+
+def unexpected_call():
+    raise AssertionError("a second upstream stream was started")
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+# ---- Flask server (threads) ----
+
+def test_late_join_replays_the_emitted_frames():
+    release = threading.Event()
+
+    def generate_frames():
+        yield "data: a\n\n"
+        release.wait(5)
+        yield "data: b\n\n"
+
+    single_flight = SingleFlight()
+    first = single_flight.stream("key", generate_frames)
+    assert next(first) == "data: a\n\n"
+    second = single_flight.stream("key", unexpected_call)
+    release.set()
+
+    assert list(second) == ["data: a\n\n", "data: b\n\n"]
+    assert list(first) == ["data: b\n\n"]
+    assert (single_flight.started, single_flight.coalesced) == (1, 1)
+    assert single_flight.flights == {}
+
+
+def test_flight_cancelled_when_all_the_requests_leave():
+    closed = threading.Event()
+
+    def generate_frames():
+        try:
+            while True:
+                yield "data: x\n\n"
+                time.sleep(0.01)
+        finally:
+            closed.set()
+
+    single_flight = SingleFlight()
+    first = single_flight.stream("key", generate_frames)
+    second = single_flight.stream("key", unexpected_call)
+    next(first)
+    next(second)
+    first.close()
+    assert not closed.wait(0.1)  # the second request is still attached
+    second.close()
+
+    assert closed.wait(2)
+    assert single_flight.flights == {}
+    third = single_flight.stream("key", lambda: iter(["data: new\n\n"]))
+    assert list(third) == ["data: new\n\n"]
+    assert single_flight.started == 2
+
+
+def test_different_keys_are_not_coalesced():
+    single_flight = SingleFlight()
+    assert list(single_flight.stream("a", lambda: iter(["data: a\n\n"]))) == ["data: a\n\n"]
+    assert list(single_flight.stream("b", lambda: iter(["data: b\n\n"]))) == ["data: b\n\n"]
+    assert (single_flight.started, single_flight.coalesced) == (2, 0)
+
+
+def test_coalesced_request_is_observed():
+    release = threading.Event()
+
+    def generate_frames():
+        yield "data: Try\n\n"
+        release.wait(5)
+        yield "data:  a loop\n\n"
+
+    single_flight = SingleFlight()
+    driver_observation = RecordingObservation()
+    follower_observation = RecordingObservation()
+    first = single_flight.stream("key", generate_frames, lambda frames: observe_frames(frames, driver_observation))
+    next(first)
+    second = single_flight.stream("key", unexpected_call,
+                                  lambda frames: observe_frames(frames, follower_observation))
+    release.set()
+    list(second)
+    list(first)
+
+    assert driver_observation.events == []  # observed by generate_sse in the driving request
+    assert follower_observation.events == ["started", ("served_by", "coalesced"), "first_token",
+                                           ("finished", "Try a loop")]
+
+
+def test_coalesced_error_and_empty_response_are_observed():
+    observation = RecordingObservation()
+    list(observe_frames(iter(["data: a\n\n", "error: POST llm_inference_stream : timeout\n\n"]), observation))
+    assert observation.events[-1] == ("error", "CoalescedStreamError")
+
+    observation = RecordingObservation()
+    list(observe_frames(iter(["error: POST llm_inference_stream : empty response from LLM\n\n"]), observation))
+    assert observation.events[-1] == "empty"
+
+
+# ---- ASGI server (event loop) ----
+
+def test_async_late_join_replays_the_emitted_frames():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def agenerate_frames():
+            yield "data: a\n\n"
+            await release.wait()
+            yield "data: b\n\n"
+
+        single_flight = AsyncSingleFlight()
+        follower_observation = RecordingObservation()
+        first = single_flight.stream("key", agenerate_frames)
+        assert await first.__anext__() == "data: a\n\n"
+        second = single_flight.stream("key", unexpected_call,
+                                      lambda frames: aobserve_frames(frames, follower_observation))
+        release.set()
+        second_frames = [frame async for frame in second]
+        first_frames = [frame async for frame in first]
+        return single_flight, follower_observation, first_frames, second_frames
+
+    single_flight, observation, first_frames, second_frames = asyncio.run(scenario())
+    assert second_frames == ["data: a\n\n", "data: b\n\n"]
+    assert first_frames == ["data: b\n\n"]
+    assert (single_flight.started, single_flight.coalesced) == (1, 1)
+    assert observation.events[-1] == ("finished", "ab")
+
+
+def test_async_flight_cancelled_when_all_the_requests_leave():
+    async def scenario():
+        closed = asyncio.Event()
+
+        async def agenerate_frames():
+            try:
+                while True:
+                    yield "data: x\n\n"
+                    await asyncio.sleep(0.01)
+            finally:
+                closed.set()
+
+        single_flight = AsyncSingleFlight()
+        first = single_flight.stream("key", agenerate_frames)
+        await first.__anext__()
+        await first.aclose()
+        await asyncio.wait_for(closed.wait(), 2)
+        return single_flight
+
+    assert asyncio.run(scenario()).flights == {}
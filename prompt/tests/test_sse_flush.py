@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+
+import sse_flush
+from sse_flush import coalesce_contents, acoalesce_contents
+
+
+# Deltas (delay in seconds before the delta, content) read on a fake clock
+def timed_contents(clock, deltas, closed):
+    try:
+        for delay, content in deltas:
+            clock[0] += delay
+            yield content
+    finally:
+        closed.append(True)
+
+
+def coalesce(monkeypatch, deltas, max_delay, min_bytes):
+    clock = [0.0]
+    monkeypatch.setattr(sse_flush, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    closed = []
+    return list(coalesce_contents(timed_contents(clock, deltas, closed), max_delay, min_bytes)), closed
+
+
+def test_first_delta_is_flushed_immediately(monkeypatch):
+    frames, _ = coalesce(monkeypatch, [(0, "Try"), (0, " a"), (0, " loop")], 10.0, 1000)
+    assert frames == ["Try", " a loop"]
+
+
+def test_coalesce_by_min_bytes(monkeypatch):
+    frames, closed = coalesce(monkeypatch, [(0, "a"), (0, "b"), (0, "c"), (0, "dd"), (0, "e")], 10.0, 3)
+    # "e" is below min_bytes and before the deadline: flushed at the end of the stream
+    assert frames == ["a", "bcdd", "e"]
+    assert closed == [True]
+
+
+def test_coalesce_by_max_delay(monkeypatch):
+    deltas = [(0, "a"), (0, "b"), (0.01, "c"), (0.05, "d"), (0.01, "e"), (0.01, "f")]
+    frames, _ = coalesce(monkeypatch, deltas, 0.05, 1000)
+    # The deadline runs from the oldest buffered delta
+    assert frames == ["a", "bcd", "ef"]
+
+
+def test_nothing_lost(monkeypatch):
+    contents = [str(i) * (i % 4) for i in range(1, 50)]
+    for max_delay, min_bytes in [(0.0, 1), (0.02, 5), (10.0, 1000)]:
+        frames, _ = coalesce(monkeypatch, [(0.01, content) for content in contents], max_delay, min_bytes)
+        assert "".join(frames) == "".join(contents)
+
+
+def test_closing_closes_the_upstream_stream(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(sse_flush, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    closed = []
+    frames = coalesce_contents(timed_contents(clock, [(0, "a"), (0, "b"), (0, "c")], closed), 10.0, 1000)
+    assert next(frames) == "a"
+    frames.close()
+    assert closed == [True]
+
+
+# ---- Async version ----
+
+async def adeltas(deltas, closed, error=None):
+    try:
+        for delay, content in deltas:
+            await asyncio.sleep(delay)
+            yield content
+        if error is not None:
+            raise error
+    finally:
+        closed.append(True)
+
+
+def acoalesce(deltas, max_delay, min_bytes, error=None):
+    closed = []
+
+    async def scenario():
+        frames = []
+        try:
+            async for frame in acoalesce_contents(adeltas(deltas, closed, error), max_delay, min_bytes):
+                frames.append(frame)
+        except Exception as e:
+            frames.append(e)
+        return frames
+
+    return asyncio.run(scenario()), closed
+
+
+def test_async_coalesce_by_min_bytes():
+    frames, closed = acoalesce([(0, "a"), (0.01, "bb"), (0.01, "cc"), (0.01, "d")], 10.0, 4)
+    assert frames == ["a", "bbcc", "d"]
+    assert closed == [True]
+
+
+def test_async_coalesce_by_max_delay_when_the_provider_stalls():
+    async def scenario():
+        times = []
+        start = asyncio.get_running_loop().time()
+        deltas = [(0, "a"), (0, "b"), (0, "c"), (0.3, "d")]
+        async for frame in acoalesce_contents(adeltas(deltas, []), 0.05, 1000):
+            times.append((frame, asyncio.get_running_loop().time() - start))
+        return times
+
+    times = asyncio.run(scenario())
+    assert [frame for frame, _ in times] == ["a", "bc", "d"]
+    # "bc" is flushed on time, before the next delta of the provider
+    assert times[1][1] < 0.25
+
+
+def test_async_nothing_lost_before_an_error():
+    frames, closed = acoalesce([(0, "a"), (0, "b"), (0, "c")], 10.0, 1000, error=RuntimeError("provider down"))
+    assert frames[:-1] == ["a", "bc"]
+    assert isinstance(frames[-1], RuntimeError)
+    assert closed == [True]
+
+
+def test_async_nothing_lost():
+    contents = [str(i) * (i % 4) for i in range(1, 30)]
+    for max_delay, min_bytes in [(0.0, 1), (0.005, 5), (10.0, 1000)]:
+        frames, _ = acoalesce([(0.001, content) for content in contents], max_delay, min_bytes)
+        assert "".join(frames) == "".join(contents)
+
+
+def test_async_closing_closes_the_upstream_stream():
+    closed = []
+
+    async def scenario():
+        frames = acoalesce_contents(adeltas([(0, "a"), (0, "b"), (10.0, "c")], closed), 0.01, 1000)
+        assert await frames.__anext__() == "a"
+        assert await frames.__anext__() == "b"
+        await frames.aclose()
+
+    asyncio.run(scenario())
+    assert closed == [True]
@@ -0,0 +1,24 @@
+import time
+
+from tracing import Tracer
+
+
+def span(trace, name, backend):
+    return next(span for span in trace.spans if span["name"] == name
+                and {"key": "backend", "value": {"stringValue": backend}} in span["attributes"])
+
+
+def test_upstream_connect_span_of_a_hedged_attempt(tmp_path):
+    trace = Tracer(str(tmp_path / "traces.jsonl"), 1.0).start_trace()
+    trace.started()
+    time.sleep(0.02)
+    trace.connected("primary", 0.02)
+    time.sleep(0.1)  # hedge delay
+    trace.connected("alternate", 0.01)
+
+    primary = span(trace, "upstream_connect", "primary")
+    alternate = span(trace, "upstream_connect", "alternate")
+    assert int(primary["startTimeUnixNano"]) >= trace.upstream_start
+    # The alternate attempt starts after the hedge delay, not at the start of the primary
+    assert int(alternate["startTimeUnixNano"]) - trace.upstream_start >= 0.1e9
+    assert int(alternate["endTimeUnixNano"]) - int(alternate["startTimeUnixNano"]) == int(0.01e9)
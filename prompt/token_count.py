@@ -0,0 +1,74 @@
+# ###########
+# TOKEN COUNT
+# ###########
+
+# Offline token counts of the prompts (no API call).
+# tiktoken (optional dependency) gives the exact counts of the o200k_base encoding when the encoding file
+# is available locally. Otherwise a heuristic estimator is used: it splits the text into letter runs,
+# digit runs, punctuation runs and whitespace runs and approximates the number of BPE tokens of each run.
+# ESTIMATOR_SCALE corrects the estimator globally, calibrate_estimator() computes it when tiktoken is available.
+
+import math
+import re
+
+TOKENIZER_ENCODING = "o200k_base"
+ESTIMATOR_SCALE = 1.0
+
+RUN_PATTERN = re.compile(r"[^\W\d_]+|\d+|\s+|[^\w\s]+|_+")
+
+encoder = None
+encoder_loaded = False
+
+
+def get_encoder():
+    global encoder, encoder_loaded
+    if not encoder_loaded:
+        encoder_loaded = True
+        try:
+            import tiktoken
+
+            encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception:
+            encoder = None  # tiktoken not installed or encoding file not available offline
+    return encoder
+
+
+def tokenizer_name():
+    if get_encoder() is not None:
+        return f"tiktoken:{TOKENIZER_ENCODING}"
+    return "estimator"
+
+
+# Approximate number of tokens of a text
+def estimate_tokens(text):
+    tokens = 0
+    for run in RUN_PATTERN.findall(text):
+        first = run[0]
+        if first.isspace():
+            # A single space is merged with the next word, longer runs (indentation, new lines) cost one token
+            tokens += 0 if run == " " else 1
+        elif first.isdigit():
+            tokens += math.ceil(len(run) / 3)
+        elif first.isalpha():
+            # Common words are one token, long words are split into pieces
+            tokens += 1 + len(run) // 8
+        else:
+            tokens += math.ceil(len(run) / 2)
+    return round(tokens * ESTIMATOR_SCALE)
+
+
+def count_tokens(text):
+    encoder = get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return estimate_tokens(text)
+
+
+# Scale to apply to the estimator so that it matches the tokenizer on the given texts (None without tokenizer)
+def calibrate_estimator(texts):
+    encoder = get_encoder()
+    if encoder is None:
+        return None
+    exact = sum(len(encoder.encode(text)) for text in texts)
+    estimated = sum(estimate_tokens(text) for text in texts) / ESTIMATOR_SCALE
+    return exact / estimated
@@ -0,0 +1,257 @@
+# #######
+# TRACING
+# #######
+
+# Sampled per-request stage tracing of the help requests (opt-in, see TRACE_SAMPLE_RATE in settings.py).
+# A sampled request is written as one line of OpenTelemetry JSON (OTLP/JSON ExportTraceServiceRequest, as written by
+# the file exporter of the OpenTelemetry collector) to TRACE_LOG, with a root span "llm_inference_stream" (from the
+# start of the handler to the last SSE frame) and one child span per stage:
+# - parse_request: query parameters and JSON body
+# - validate: validation against accepted_levels / accepted_languages / accepted_modalities
+# - build_prompt: session, compaction, code delta, system prompt and cache markers
+# - upstream_connect: upstream call until the response headers of the provider (one span per backend with hedging)
+# - first_chunk: upstream call until the first content chunk
+# - last_chunk: first content chunk until the last one
+# The time between build_prompt and the upstream call is the wait in the admission queue (see admission.py).
+# The upstream stages are reported through the observation interface of generate_sse() (see metrics.py).
+# Analyzer (from the prompt/ folder): python tracing.py [traces.jsonl], per-stage p50/p95/p99 in milliseconds.
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from metrics import percentile
+
+ROOT_SPAN = "llm_inference_stream"
+STAGES = [ROOT_SPAN, "parse_request", "validate", "build_prompt", "upstream_connect", "first_chunk", "last_chunk"]
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def otlp_attributes(attributes):
+    values = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = {"boolValue": value}
+        elif isinstance(value, int):
+            value = {"intValue": str(value)}  # int64 as string in OTLP/JSON
+        elif isinstance(value, float):
+            value = {"doubleValue": value}
+        else:
+            value = {"stringValue": str(value)}
+        values.append({"key": key, "value": value})
+    return values
+
+
+class Tracer:
+    def __init__(self, path, sample_rate, service_name="pyrates-prompt"):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.service_name = service_name
+        self.lock = threading.Lock()
+        self.file = None  # opened on the first sampled request
+
+    # New trace of a help request, None if the request is not sampled
+    def start_trace(self):
+        if random.random() >= self.sample_rate:
+            return None
+        return Trace(self)
+
+    def write(self, spans):
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "pyrates.prompt"}, "spans": spans}],
+        }]}, separators=(",", ":"))
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            self.file.write(line + "\n")
+            self.file.flush()
+
+
+class Trace:
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.trace_id = os.urandom(16).hex()
+        self.root_id = os.urandom(8).hex()
+        self.start = time.time_ns()
+        self.stage_start = self.start
+        self.upstream_start = None
+        self.first_chunk_time = None
+        self.attributes = {}
+        self.spans = []
+        self.done = False
+
+    def add_span(self, name, start, end, attributes=None, error=None):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": os.urandom(8).hex(),
+            "parentSpanId": self.root_id,
+            "name": name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(end),
+            "attributes": otlp_attributes(attributes or {}),
+            "status": {"code": STATUS_ERROR, "message": error} if error else {"code": STATUS_OK},
+        }
+        self.spans.append(span)
+
+    # Span of the stage ending now (started at the end of the previous stage)
+    def end_stage(self, name):
+        now = time.time_ns()
+        self.add_span(name, self.stage_start, now)
+        self.stage_start = now
+
+    # ---- Observation of the upstream stream (see StreamObservation in metrics.py) ----
+
+    def started(self):
+        self.upstream_start = time.time_ns()
+
+    # Called when the response headers of a backend are received: the span ends now and lasts the connect time of the
+    # attempt (a hedged or failover attempt starts after the primary)
+    def connected(self, backend, seconds):
+        end = time.time_ns()
+        self.add_span("upstream_connect", end - int(seconds * 1e9), end, {"backend": backend})
+
+    def served_by(self, backend):
+        self.attributes["backend"] = backend
+
+    def first_token(self):
+        self.first_chunk_time = time.time_ns()
+        self.add_span("first_chunk", self.upstream_start, self.first_chunk_time)
+
+    def finished(self, generated):
+        self.add_span("last_chunk", self.first_chunk_time, time.time_ns(), {"output_chars": len(generated)})
+
+    def empty(self):
+        self.attributes["outcome"] = "empty_response"
+
+    def error(self, error):
+        self.attributes["outcome"] = "error"
+        self.attributes["exception"] = type(error).__name__
+
+    def cancelled(self):
+        self.attributes["outcome"] = "cancelled"
+
+    # ---- End of the request ----
+
+    def finish(self, status_code, error=None):
+        if self.done:
+            return
+        self.done = True
+        self.attributes["http.status_code"] = status_code
+        root = {
+            "traceId": self.trace_id,
+            "spanId": self.root_id,
+            "name": ROOT_SPAN,
+            "kind": SPAN_KIND_SERVER,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(time.time_ns()),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": STATUS_ERROR, "message": str(error)} if error else {"code": STATUS_OK},
+        }
+        self.tracer.write([root] + self.spans)
+
+    # Yield the frames and write the trace after the last frame (or when the client disconnects)
+    def record(self, frames):
+        try:
+            yield from frames
+        finally:
+            self.finish(200)
+
+    # Async version of record()
+    async def arecord(self, frames):
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            self.finish(200)
+
+
+# Observation forwarded to several observations (metrics and trace)
+class ObservationGroup:
+    def __init__(self, observations):
+        self.observations = observations
+
+    def started(self):
+        for observation in self.observations:
+            observation.started()
+
+    def connected(self, backend, seconds):
+        for observation in self.observations:
+            observation.connected(backend, seconds)
+
+    def served_by(self, backend):
+        for observation in self.observations:
+            observation.served_by(backend)
+
+    def first_token(self):
+        for observation in self.observations:
+            observation.first_token()
+
+    def finished(self, generated):
+        for observation in self.observations:
+            observation.finished(generated)
+
+    def empty(self):
+        for observation in self.observations:
+            observation.empty()
+
+    def error(self, error):
+        for observation in self.observations:
+            observation.error(error)
+
+    def cancelled(self):
+        for observation in self.observations:
+            observation.cancelled()
+
+
+def combine_observations(*observations):
+    observations = [observation for observation in observations if observation is not None]
+    if not observations:
+        return None
+    if len(observations) == 1:
+        return observations[0]
+    return ObservationGroup(observations)
+
+
+# ---- Analyzer ----
+
+# Durations in milliseconds per span name
+def read_durations(path):
+    durations = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line)["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    for span in scope_spans["spans"]:
+                        duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+                        durations.setdefault(span["name"], []).append(duration)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency percentiles of the traced help requests")
+    parser.add_argument("path", nargs="?", default="traces.jsonl", help="span log (TRACE_LOG)")
+    args = parser.parse_args()
+
+    durations = read_durations(args.path)
+    names = [name for name in STAGES if name in durations] + sorted(set(durations) - set(STAGES))
+    print(f"{'stage':22}{'count':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for name in names:
+        values = durations[name]
+        print(f"{name:22}{len(values):>8}{percentile(values, 0.5):>11.2f}{percentile(values, 0.95):>11.2f}"
+              f"{percentile(values, 0.99):>11.2f}")
+
+
+if __name__ == "__main__":
+    main()